@@ -19,23 +19,21 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 '''
+import logging
 import numpy as np
 from pathlib import Path
 import time
 
-from src.notebooks.lib.utilities import setup_logging, load_yaml, import_util
-CONFIGS = load_yaml('configs/config.yaml')['Application']
-MAIN_CONFIGS = load_yaml('configs/config.yaml')['main']
-CWD = CONFIGS['CWD']
+from src.notebooks.lib.utilities import CWD, get_configs, import_util
 
 import_util(cwd=CWD, paths=['src/notebooks', 'src/notebooks/lib'])
 from src.notebooks.lib.lru_database import LRUDataBase
 from src.notebooks.lib.lru_database import test as lru_test
 from src.notebooks.lib.test_case import ParticleBox
 
-logging = setup_logging(path = CONFIGS['loggingConfigPath'])
+# Loading the configuration also sets up logging
+MAIN_CONFIGS = get_configs()['main']
 LOG = logging.getLogger(MAIN_CONFIGS['logger'])
-LOG.setLevel(CONFIGS['logging_level'])
 
 
 async def main(lru_size=100, box_size=50, steps=20, dt=1./30, bound_size=4, **kwargs): 
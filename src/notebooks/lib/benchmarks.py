@@ -0,0 +1,773 @@
+'''
+Benchmarks for the LRUDataBase, AsyncDataBase and LRU classes. Run from the
+src/notebooks directory:
+
+    python -m lib.benchmarks <name>
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# The directory that holds the lib package
+NOTEBOOKS = Path(__file__).resolve().parents[1]
+
+IMPORT_SCRIPT = '''
+import logging, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, 'yaml' in sys.modules, bool(logging.getLogger().handlers))
+'''
+
+
+def import_time(module: str = 'lib.lru_database', repeat: int = 5) -> dict:
+    '''Imports the module in fresh interpreters and returns the best and mean
+    import time in seconds. Also reports whether importing parsed YAML or
+    configured logging, neither of which should happen at import.'''
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SCRIPT.format(module=module)],
+            cwd=NOTEBOOKS, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+
+    return {
+        'module': module,
+        'best': min(times),
+        'mean': sum(times) / len(times),
+        'parsed_yaml': output[1] == 'True',
+        'configured_logging': output[2] == 'True',
+    }
+
+
+def particle_ops(box_size: int = 100, steps: int = 500, dt: float = 0.033, bound_size: int = 2, seed: int = 10101010) -> list:
+    '''Runs the main.py ParticleBox simulation and records its shelf operations 
+    as a list of ('write', key, value) and ('read', keys) tuples, so the 
+    simulation itself is not part of the timed workload.'''
+    import numpy as np
+    from lib.test_case import ParticleBox
+
+    np.random.seed(seed)
+    init_state = -0.5 + np.random.random((box_size, 4))
+    init_state[:, :2] *= 3.9
+    bounds = [-bound_size, bound_size, -bound_size, bound_size]
+    box = ParticleBox(init_state, bounds=bounds, size=(bounds[1] - bounds[0]) * 0.01, G=1.0)
+
+    ops = [('write', f'pc_{i}', loc.copy()) for i, loc in enumerate(init_state)]
+    for _ in range(steps):
+        box.step(dt)
+        if box.reads:
+            ops.append(('read', [f'pc_{x}' for x in box.reads]))
+        for k, v in box.writes.items():
+            ops.append(('write', f'pc_{k}', v.copy()))
+    return ops
+
+
+async def _run_async(ops: list, lru_size: int, configs=None, cls=None, report: dict | None = None) -> float:
+    '''Replays the operations against a new LRUDataBase, or a subclass given by 
+    cls, and returns the elapsed seconds including the final close. If report is 
+    given, the row count and file size of the database are added to it.'''
+    from lib.lru_database import LRUDataBase
+
+    shelf = (cls or LRUDataBase)('bench_async_db', 'bench', configs=configs)
+    await shelf.connect()
+    shelf.lru._create_empty_deck(lru_size)
+    database_path = shelf.db.database_path
+
+    start = time.perf_counter()
+    for op in ops:
+        if op[0] == 'write':
+            await shelf.write(op[1], op[2])
+        else:
+            await shelf.read(op[1])
+    db = shelf.db
+    await shelf.close()
+    elapsed = time.perf_counter() - start
+
+    if report is not None:
+        await db.open_connection()
+        await db.create()
+        report['rows'] = len(await db.node_keys())
+        await db.close()
+        report['bytes'] = _disk_size(database_path)
+
+    _remove(database_path)
+    return elapsed
+
+
+def _disk_size(path: Path) -> int:
+    '''Size in bytes of a database file, or of the files of a directory backend.'''
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+    return path.stat().st_size
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    else:
+        path.unlink()
+        # Left by a WAL database that was not closed cleanly
+        for suffix in ('-wal', '-shm'):
+            Path(f'{path}{suffix}').unlink(missing_ok=True)
+
+
+def _run_sync(ops: list, lru_size: int, configs=None) -> float:
+    from lib.lru_database import SyncLRUDataBase
+
+    shelf = SyncLRUDataBase('bench_sync_db', 'bench', configs=configs)
+    shelf.connect()
+    shelf.lru._create_empty_deck(lru_size)
+    database_path = shelf.db.database_path
+
+    start = time.perf_counter()
+    for op in ops:
+        if op[0] == 'write':
+            shelf.write(op[1], op[2])
+        else:
+            shelf.read(op[1])
+    shelf.close()
+    elapsed = time.perf_counter() - start
+
+    database_path.unlink()
+    return elapsed
+
+
+def front_ends(lru_sizes: tuple = (20, 40, 80), repeat: int = 3, **workload) -> dict:
+    '''Compares LRUDataBase (connection thread) and SyncLRUDataBase (sqlite3) on the 
+    ParticleBox workload. Returns the best time in seconds and microseconds 
+    per operation for each front end and LRU size.'''
+    ops = particle_ops(**workload)
+    count = sum(len(op[1]) if op[0] == 'read' else 1 for op in ops)
+
+    results = {}
+    for lru_size in lru_sizes:
+        t_async = min(asyncio.run(_run_async(ops, lru_size)) for _ in range(repeat))
+        t_sync = min(_run_sync(ops, lru_size) for _ in range(repeat))
+        results[f'LRU_{lru_size}'] = {
+            'async': t_async, 
+            'sync': t_sync, 
+            'async_us_per_op': t_async / count * 1e6,
+            'sync_us_per_op': t_sync / count * 1e6,
+            'speedup': t_async / t_sync,
+        }
+    return results
+
+
+def dense_ops(entities: int = 20000, sweeps: int = 3, chunk: int = 100, seed: int = 0) -> list:
+    '''Returns the operations of a dense entity table workload. Every entity 
+    is written once, then each sweep reads the entities in chunks of keys and 
+    writes each one back.'''
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    state = rng.random((entities, 4))
+    ops = [('write', f'pc_{i}', state[i].copy()) for i in range(entities)]
+    for _ in range(sweeps):
+        for i in range(0, entities, chunk):
+            keys = [f'pc_{j}' for j in range(i, min(i + chunk, entities))]
+            ops.append(('read', keys))
+            ops.extend(('write', k, rng.random(4)) for k in keys)
+    return ops
+
+
+def storage_modes(lru_size: int = 4096, block_size: int = 256, **workload) -> dict:
+    '''Compares row per entity storage (LRUDataBase) with block storage 
+    (BlockLRUDataBase) on the dense entity table workload. The LRU holds 
+    lru_size entities in row mode and lru_size / block_size blocks in block 
+    mode, the same memory. Returns the time, row count and file size of each 
+    mode.
+
+    Block storage pays off when entities are accessed in index order. Under 
+    random access, like the ParticleBox collisions, a small cache of blocks 
+    thrashes, because every entity read loads and evicts a whole block.'''
+    from lib.block_database import BlockLRUDataBase
+    from lib.utilities import Configs
+
+    ops = dense_ops(**workload)
+    configs = Configs(overrides={'Block_db': {'block_size': block_size}})
+
+    results = {'row': {}, 'block': {}}
+    results['row']['time'] = asyncio.run(_run_async(ops, lru_size, report=results['row']))
+    results['block']['time'] = asyncio.run(_run_async(
+        ops, max(2, lru_size // block_size), configs=configs, cls=BlockLRUDataBase, report=results['block']))
+    return results
+
+
+def update_ops(entities: int = 2000, updates: int = 50000, read_fraction: float = 0.1, value_size: int = 32, seed: int = 0) -> list:
+    '''Returns the operations of a write heavy, key only workload. Random 
+    entities are overwritten with arrays of value_size floats, and a 
+    read_fraction of the operations are single key reads.'''
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(0, entities, updates)
+    reads = rng.random(updates) < read_fraction
+    ops = [('write', f'key_{i}', rng.random(value_size)) for i in range(entities)]
+    for key, read in zip(keys.tolist(), reads.tolist()):
+        if read:
+            ops.append(('read', f'key_{key}'))
+        else:
+            ops.append(('write', f'key_{key}', rng.random(value_size)))
+    return ops
+
+
+def storage_backends(lru_size: int = 200, max_file_size: int = 1 << 22, repeat: int = 3, **workload) -> dict:
+    '''Compares the SQLite and bitcask storage backends of LRUDataBase on the 
+    write heavy workload of update_ops, with a small LRU so most writes reach 
+    the backend. The bitcask files are rotated, and compacted, every 
+    max_file_size bytes. Returns the best time, the rows and the size on disk 
+    of each backend after close.'''
+    from lib.utilities import Configs
+
+    ops = update_ops(**workload)
+    results = {}
+    for backend in ('sqlite', 'bitcask'):
+        configs = Configs(overrides={'LRU_db': {'backend': backend}, 'Bitcask': {'max_file_size': max_file_size}})
+        results[backend] = {}
+        results[backend]['time'] = min(
+            asyncio.run(_run_async(ops, lru_size, configs=configs, report=results[backend])) for _ in range(repeat))
+    results['speedup'] = results['sqlite']['time'] / results['bitcask']['time']
+    return results
+
+
+def key_types(lru_size: int = 200, repeat: int = 3, **workload) -> dict:
+    '''Compares text keys ("key_17") with integer keys (17) in an INTEGER 
+    PRIMARY KEY table on the workload of update_ops. Returns the best time, 
+    the rows and the size on disk of each key type.'''
+    from lib.utilities import Configs
+
+    ops = update_ops(**workload)
+    int_ops = [(op[0], int(op[1][4:]), *op[2:]) for op in ops]
+
+    results = {}
+    for key_type, key_ops in (('text', ops), ('integer', int_ops)):
+        configs = Configs(overrides={'LRU_db': {'integer_keys': key_type == 'integer'}})
+        results[key_type] = {}
+        results[key_type]['time'] = min(
+            asyncio.run(_run_async(key_ops, lru_size, configs=configs, report=results[key_type])) for _ in range(repeat))
+    results['speedup'] = results['text']['time'] / results['integer']['time']
+    return results
+
+
+def _rss() -> int:
+    '''Resident set size of the process in bytes, or the peak RSS where 
+    /proc is not available.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _version() -> dict:
+    '''Identifies the code and interpreter of a report, so reports of 
+    different versions can be compared.'''
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=NOTEBOOKS, 
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform()}
+
+
+async def _entry_bytes(count: int, value_size: int, integer_keys: bool) -> dict:
+    '''Writes count bytearrays of value_size random bytes to an LRU large enough 
+    to hold them all, and returns the bytes traced by tracemalloc per entry 
+    and their split into the encoded key, the pickle blob and the rest (deque 
+    slot, dict entries and dirty key bookkeeping).'''
+    from lib.lru_database import LRUDataBase
+    from lib.utilities import Configs
+
+    configs = Configs(overrides={'LRU_db': {'integer_keys': integer_keys, 'warm_start': False}})
+    shelf = LRUDataBase('bench_memory_db', 'bench', configs=configs)
+    await shelf.connect()
+    shelf.lru._create_empty_deck(count + 1)
+    database_path = shelf.db.database_path
+    try:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for i in range(count):
+            await shelf.write(i if integer_keys else f'key_{i}', bytearray(os.urandom(value_size)))
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        key = sum(sys.getsizeof(k) for k in shelf.lru.cache) / count
+        blob = sum(sys.getsizeof(v) for v in shelf.lru.cache.values()) / count
+    finally:
+        await shelf.close()
+        database_path.unlink()
+
+    per_entry = total / count
+    return {'bytes': per_entry, 'key': key, 'blob': blob, 'overhead': per_entry - key - blob}
+
+
+def memory_per_entry(count: int = 20000, value_sizes: tuple = (8, 64, 512, 4096)) -> dict:
+    '''Measures the memory cost of a cached entry of LRUDataBase with 
+    tracemalloc, for text and integer keys and values of value_sizes bytes. 
+    The overhead is what an entry costs on top of its key and pickle blob.'''
+    results = {'version': _version(), 'count': count}
+    for key_type in ('text', 'integer'):
+        results[key_type] = {
+            size: asyncio.run(_entry_bytes(count, size, key_type == 'integer')) for size in value_sizes}
+    return results
+
+
+async def _soak(ops: int, keys: int, lru_size: int, max_value_size: int, samples: int, seed: int) -> list:
+    '''Runs a random mix of 70% writes, 25% reads and 5% deletes of values of 
+    up to max_value_size bytes on a new LRUDataBase, and records the memory 
+    of the process samples times.'''
+    import numpy as np
+    from lib.lru_database import LRUDataBase
+    from lib.utilities import Configs
+
+    configs = Configs(overrides={'LRU_db': {'warm_start': False}})
+    shelf = LRUDataBase('bench_soak_db', 'bench', configs=configs)
+    await shelf.connect()
+    shelf.lru._create_empty_deck(lru_size)
+    database_path = shelf.db.database_path
+
+    rng = np.random.default_rng(seed)
+    every = max(1, ops // samples)
+    records = []
+    start = time.perf_counter()
+    try:
+        for i in range(0, ops, every):
+            kinds = rng.random(every)
+            ids = rng.integers(0, keys, every).tolist()
+            sizes = rng.integers(1, max_value_size + 1, every).tolist()
+            for kind, key, size in zip(kinds.tolist(), ids, sizes):
+                if kind < 0.7:
+                    await shelf.write(f'key_{key}', bytearray(size))
+                elif kind < 0.95:
+                    await shelf.read(f'key_{key}')
+                else:
+                    await shelf.delete(f'key_{key}')
+
+            traced, _ = tracemalloc.get_traced_memory()
+            records.append({
+                'ops': i + every,
+                'seconds': time.perf_counter() - start,
+                'rss': _rss(),
+                'traced': traced,
+                'lru_bytes': shelf.lru.size_bytes,
+                'lru_count': shelf.lru.count,
+            })
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return records
+
+
+def _growth(records: list, field) -> float:
+    '''Least squares slope of field(record) over the operations of records, 
+    in bytes per million operations.'''
+    x = [r['ops'] for r in records]
+    y = [field(r) for r in records]
+    if len(x) < 2:
+        return 0.0
+    mean_x, mean_y = sum(x) / len(x), sum(y) / len(y)
+    return sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y)) / sum((a - mean_x) ** 2 for a in x) * 1e6
+
+
+def soak(ops: int = 1_000_000, keys: int = 100_000, lru_size: int = 20_000, max_value_size: int = 1024, samples: int = 50, seed: int = 0) -> dict:
+    '''Soak test of LRUDataBase. Runs ops random operations with tracemalloc 
+    on and records, at samples points, the RSS, the traced Python heap and 
+    the bytes held by the LRU. Growth is measured over the second half of 
+    the run, once the cache is full, in bytes per million operations:
+
+    leak: the traced heap not held by cached values, should be close to 0.
+    rss: the resident set size.
+    untraced: the RSS not traced by tracemalloc, memory held by the 
+        allocator, SQLite and extension modules. Growth while the heap is 
+        flat is fragmentation.'''
+    tracemalloc.start()
+    try:
+        records = asyncio.run(_soak(ops, keys, lru_size, max_value_size, samples, seed))
+    finally:
+        tracemalloc.stop()
+
+    half = records[len(records) // 2:]
+    last = records[-1]
+    return {
+        'version': _version(),
+        'workload': {'ops': ops, 'keys': keys, 'lru_size': lru_size, 'max_value_size': max_value_size, 'seed': seed},
+        'ops_per_second': last['ops'] / last['seconds'],
+        'peak_rss': max(r['rss'] for r in records),
+        'growth': {
+            'leak': _growth(half, lambda r: r['traced'] - r['lru_bytes']),
+            'rss': _growth(half, lambda r: r['rss']),
+            'untraced': _growth(half, lambda r: r['rss'] - r['traced']),
+        },
+        'samples': records,
+    }
+
+
+def _index_workload(index: str, entries: int, value_size: int, trace: bool) -> dict:
+    '''Fills an LRU index, "dict" (LRU) or "compact" (CompactLRU), with 
+    entries new keys and values, then reads and overwrites random keys. With 
+    trace, returns the bytes traced per entry after the fill, otherwise the 
+    operations per second of each phase.'''
+    import random
+    from lib.compact_lru import CompactLRU
+    from lib.lru import LRU
+    from lib.utilities import Configs
+
+    configs = Configs(overrides={'LRU': {'mrc_sample_rate': 0}})
+    lru = CompactLRU(configs) if index == 'compact' else LRU(configs)
+    lru._create_empty_deck(entries + 1)
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for i in range(entries):
+        lru[b'key_%d' % i] = i.to_bytes(value_size, 'little')
+    fill = time.perf_counter() - start
+    if trace:
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'bytes_per_entry': traced / entries}
+
+    ops = min(entries, 1_000_000)
+    keys = [b'key_%d' % random.randrange(entries) for _ in range(ops)]
+    start = time.perf_counter()
+    for key in keys:
+        lru[key]
+    read = time.perf_counter() - start
+    start = time.perf_counter()
+    for key in keys:
+        lru[key] = bytes(value_size)
+    update = time.perf_counter() - start
+    return {'insert_ops': entries / fill, 'read_ops': ops / read, 'update_ops': ops / update}
+
+
+def lru_index(entries: int = 10_000_000, dict_entries: int = 20_000, value_size: int = 16) -> dict:
+    '''Compares the memory per entry and the operations per second of LRU 
+    and CompactLRU, each run in a fresh interpreter. CompactLRU is measured 
+    at entries and dict_entries keys, LRU only at dict_entries, since its 
+    deque.remove on every access makes each operation linear in the size of 
+    the cache and a fill quadratic.'''
+    def run(index: str, count: int, trace: bool) -> dict:
+        script = f'import json; from lib.benchmarks import _index_workload; ' \
+                 f'print(json.dumps(_index_workload({index!r}, {count}, {value_size}, {trace})))'
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=NOTEBOOKS, capture_output=True, text=True, check=True).stdout
+        return json.loads(output.splitlines()[-1])
+
+    results = {'version': _version(), 'value_size': value_size}
+    for index, count in (('dict', dict_entries), ('compact', dict_entries), ('compact', entries)):
+        results[f'{index}_{count}'] = {'entries': count, **run(index, count, True), **run(index, count, False)}
+    return results
+
+
+async def _bulk(rows: int, value_size: int, baseline_rows: int, seed: int) -> dict:
+    '''Times bulk_load, export and a load of the dump on AsyncDataBase, and 
+    per key writes through LRUDataBase for baseline_rows keys.'''
+    import random
+    import tempfile
+    from lib.database import AsyncDataBase
+    from lib.lru_database import LRUDataBase
+
+    order = list(range(rows))
+    random.Random(seed).shuffle(order)
+    value = bytes(value_size)
+    results = {}
+
+    async def timed(name: str, coroutine) -> None:
+        start = time.perf_counter()
+        count = await coroutine
+        elapsed = time.perf_counter() - start
+        results[name] = {'rows': count, 'seconds': elapsed, 'rows_per_minute': count / elapsed * 60}
+
+    db = AsyncDataBase('bench_bulk_db', 'bench')
+    copy = AsyncDataBase('bench_bulk_copy_db', 'bench')
+    with tempfile.TemporaryDirectory() as directory:
+        dump = Path(directory) / 'bench.dump'
+        try:
+            for database in (db, copy):
+                await database.open_connection()
+                await database.create()
+            await timed('bulk_load', db.bulk_load((b'key_%d' % i, value) for i in order))
+            await timed('export', db.export(dump))
+            results['dump_bytes'] = dump.stat().st_size
+            await timed('load_dump', copy.bulk_load(dump))
+        finally:
+            for database in (db, copy):
+                await database.close()
+                database.database_path.unlink()
+
+    async def per_key() -> int:
+        shelf = LRUDataBase('bench_bulk_shelf_db', 'bench')
+        await shelf.connect()
+        try:
+            for i in order[:baseline_rows]:
+                await shelf.write(b'key_%d' % i, value)
+            await shelf.flush_cache()
+        finally:
+            database_path = shelf.db.database_path
+            await shelf.close()
+            database_path.unlink()
+        return baseline_rows
+
+    await timed('per_key_write', per_key())
+    return results
+
+
+def bulk(rows: int = 2_000_000, value_size: int = 64, baseline_rows: int = 100_000, seed: int = 0) -> dict:
+    '''Measures bulk_load of rows shuffled keys with values of value_size 
+    bytes, export of the table to a dump file and a load of the dump into 
+    another file, in rows per minute, against writing baseline_rows keys one 
+    at a time through LRUDataBase.'''
+    results = {'version': _version(), 'value_size': value_size}
+    results.update(asyncio.run(_bulk(rows, value_size, baseline_rows, seed)))
+    return results
+
+
+async def _profile_db(profile: str, rows: int, reads: int, value_size: int, seed: int) -> dict:
+    '''Times a bulk_load of rows keys and reads of random keys, one at a time 
+    and in batches of 100, on an AsyncDataBase under a storage profile.'''
+    import random
+    from lib.database import AsyncDataBase
+
+    rng = random.Random(seed)
+    keys = [f'key_{i}' for i in range(rows)]
+    rng.shuffle(keys)
+    value = bytes(value_size)
+    sample = [rng.choice(keys) for _ in range(reads)]
+    results = {}
+
+    db = AsyncDataBase('bench_profile_db', 'bench', configs={'profile': profile})
+    try:
+        await db.open_connection()
+        await db.create()
+        start = time.perf_counter()
+        await db.bulk_load((key, value) for key in keys)
+        results['bulk_load'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in sample:
+            await db.read(key)
+        results['point_reads'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, reads, 100):
+            await db.read(sample[i:i + 100])
+        results['batch_reads'] = time.perf_counter() - start
+    finally:
+        await db.close()
+        results['bytes'] = _disk_size(db.database_path)
+        _remove(db.database_path)
+    return results
+
+
+def profiles(lru_size: int = 200, rows: int = 200_000, reads: int = 20_000, value_size: int = 64, repeat: int = 3, seed: int = 0) -> dict:
+    '''Compares the storage profiles of AsyncDataBase. Each profile runs the 
+    write heavy workload of update_ops and a read mostly variant with 90% 
+    reads through LRUDataBase with a small LRU, then a bulk load of rows keys 
+    and random reads straight on the database. Returns the best time in 
+    seconds of each workload, the size on disk, and the speedup of each 
+    workload over the default profile.'''
+    from lib.database import PROFILES
+    from lib.utilities import Configs
+
+    workloads = {
+        'write_heavy': update_ops(seed=seed), 
+        'read_mostly': update_ops(read_fraction=0.9, seed=seed),
+    }
+    results = {'version': _version()}
+    for profile in PROFILES:
+        configs = Configs(overrides={'DataBase': {'profile': profile}})
+        result = {}
+        for name, ops in workloads.items():
+            report = {}
+            result[name] = min(asyncio.run(_run_async(ops, lru_size, configs=configs, report=report)) for _ in range(repeat))
+            result[f'{name}_bytes'] = report['bytes']
+        for _ in range(repeat):
+            for name, elapsed in asyncio.run(_profile_db(profile, rows, reads, value_size, seed)).items():
+                result[name] = elapsed if name == 'bytes' else min(elapsed, result.get(name, elapsed))
+        results[profile] = result
+
+    for profile in PROFILES:
+        results[profile]['speedup'] = {
+            name: results['default'][name] / elapsed 
+            for name, elapsed in results[profile].items() if not name.endswith('bytes')}
+    return results
+
+
+async def _admission(admission_filter: str, cache: bool | str, keys: int, lru_size: int, hot_reads: int, scans: int, seed: int) -> dict:
+    '''Reads a skewed hot set of keys, with scans of every key spread evenly 
+    over the reads, and returns the hit ratio of the hot reads, the time 
+    and the admission counts.'''
+    import random
+    from lib.lru_database import LRUDataBase
+    from lib.utilities import Configs
+
+    configs = Configs(overrides={
+        'LRU': {'maxlen': lru_size}, 
+        'LRU_db': {'warm_start': False, 'admission_filter': admission_filter}})
+    shelf = LRUDataBase('bench_admission_db', 'bench', configs=configs)
+    await shelf.connect()
+    rng = random.Random(seed)
+    hot = [f'key_{int(keys * rng.random() ** 8)}' for _ in range(hot_reads)]
+    scan_every = max(1, hot_reads // scans)
+    try:
+        await shelf.bulk_load({f'key_{i}': bytearray(64) for i in range(keys)})
+        hits = 0
+        start = time.perf_counter()
+        for i, key in enumerate(hot):
+            hits += shelf._encode_key(key) in shelf.lru
+            await shelf.read(key)
+            if i % scan_every == scan_every - 1:
+                for j in range(0, keys, 100):
+                    await shelf.read([f'key_{k}' for k in range(j, min(j + 100, keys))], cache=cache)
+        elapsed = time.perf_counter() - start
+        return {'hot_hit_ratio': hits / hot_reads, 'seconds': elapsed, **shelf.stats()['admission']}
+    finally:
+        database_path = shelf.db.database_path
+        await shelf.close()
+        database_path.unlink()
+
+
+def admission(keys: int = 10_000, lru_size: int = 1000, hot_reads: int = 50_000, scans: int = 20, seed: int = 0) -> dict:
+    '''Measures the hit ratio of skewed reads of keys interleaved with scans 
+    of every key, with each admission filter and with scans read with 
+    cache=False and cache='low-priority'.'''
+    runs = {
+        'none': ('none', True), 
+        'doorkeeper': ('doorkeeper', True), 
+        'tinylfu': ('tinylfu', True),
+        'scan_uncached': ('none', False), 
+        'scan_low_priority': ('none', 'low-priority'),
+    }
+    results = {'version': _version()}
+    for name, (admission_filter, cache) in runs.items():
+        results[name] = asyncio.run(_admission(admission_filter, cache, keys, lru_size, hot_reads, scans, seed))
+    return results
+
+
+async def _backup(profile: str, runs: dict, keys: int, value_size: int, lru_size: int, ops: int, seed: int) -> dict:
+    '''Runs random reads and writes on a shelf of keys, alone and during a 
+    backup under each (pages, sleep) setting of runs, and returns the 
+    operations per second of each and the statistics of the backups.'''
+    import random
+    from lib.lru_database import LRUDataBase
+    from lib.utilities import Configs
+
+    configs = Configs(overrides={
+        'DataBase': {'profile': profile}, 
+        'LRU': {'maxlen': lru_size}, 
+        'LRU_db': {'warm_start': False}})
+    shelf = LRUDataBase('bench_backup_db', 'bench', configs=configs)
+    await shelf.connect()
+    dest = shelf.db.database_path.with_name('bench_backup_copy.db')
+    rng = random.Random(seed)
+    value = bytearray(value_size)
+
+    # ops operations alone, or as many as fit in a backup
+    async def foreground(done=None) -> float:
+        count = 0
+        start = time.perf_counter()
+        while (count < ops) if done is None else not done():
+            key = f'key_{rng.randrange(keys)}'
+            if count % 2:
+                await shelf.write(key, value)
+            else:
+                await shelf.read(key)
+            count += 1
+            if count % 100 == 0:
+                await asyncio.sleep(0)
+        return count / (time.perf_counter() - start)
+
+    try:
+        await shelf.bulk_load((f'key_{i}', value) for i in range(keys))
+        results = {'alone': {'ops_per_second': await foreground()}}
+        for name, (pages, sleep) in runs.items():
+            backup = asyncio.create_task(shelf.backup(dest, pages, sleep))
+            rate = await foreground(backup.done)
+            stats = await backup
+            results[name] = {
+                'ops_per_second': rate, 
+                'slowdown': 1 - rate / results['alone']['ops_per_second'], 
+                'mb_per_second': _disk_size(dest) / stats['seconds'] / 1e6, 
+                **stats}
+            _remove(dest)
+        results['bytes'] = _disk_size(shelf.db.database_path)
+    finally:
+        database_path = shelf.db.database_path
+        await shelf.close()
+        _remove(database_path)
+    return results
+
+
+def backup(keys: int = 200_000, value_size: int = 256, lru_size: int = 10_000, ops: int = 20_000, seed: int = 0) -> dict:
+    '''Measures the throughput of a shelf during an online backup, copied in 
+    one step and in paced steps, under the default and balanced (WAL) 
+    profiles.'''
+    runs = {
+        'one_step': (-1, 0), 
+        'pages_1024': (1024, 0), 
+        'pages_256_sleep_5ms': (256, 0.005), 
+        'pages_64_sleep_5ms': (64, 0.005),
+    }
+    results = {'version': _version()}
+    for profile in ('default', 'balanced'):
+        results[profile] = asyncio.run(_backup(profile, runs, keys, value_size, lru_size, ops, seed))
+    return results
+
+
+BENCHMARKS = {
+    'import_time': import_time,
+    'front_ends': front_ends,
+    'storage_modes': storage_modes,
+    'storage_backends': storage_backends,
+    'key_types': key_types,
+    'memory_per_entry': memory_per_entry,
+    'soak': soak,
+    'lru_index': lru_index,
+    'bulk': bulk,
+    'profiles': profiles,
+    'admission': admission,
+    'backup': backup,
+}
+
+
+def test(limit: float = 0.5) -> bool:
+    '''Guards against import time regressions. Importing the modules must not
+    parse YAML or configure logging, and must take less than limit seconds.'''
+    for module in ['lib.lru', 'lib.database', 'lib.lru_database']:
+        result = import_time(module, repeat=3)
+        assert not result['parsed_yaml'], f'{module} parsed YAML at import'
+        assert not result['configured_logging'], f'{module} configured logging at import'
+        assert result['best'] < limit, f'{module} import took {result["best"]:.3f}s, limit={limit}s'
+    return True
+
+
+if __name__ == '__main__':
+    name = sys.argv[1] if len(sys.argv) > 1 else 'import_time'
+    print(json.dumps(BENCHMARKS[name](), indent=2))
@@ -0,0 +1,617 @@
+'''
+The code is a Python class named BitcaskDataBase, an append-only, log
+structured storage backend for LRUDataBase in the style of Bitcask. Writes
+are appended to a data file and located by an in-memory index, so an update
+costs one sequential write instead of a B-tree update.
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+from zlib import crc32
+
+from lib.utilities import CWD, Configs, resolve_configs
+from lib.database import Node
+from lib.storage import StorageBackend
+
+LOG = logging.getLogger('Bitcask')
+
+# A record is the crc32 of the rest of the record, the key size, the value
+# size, the key and the value.
+CRC = struct.Struct('<I')
+SIZES = struct.Struct('<Ii')
+HEADER_SIZE = CRC.size + SIZES.size
+
+# Value sizes of records without a value. A tombstone deletes its key, the
+# merged marker starts a compacted file, which supersedes the files before it.
+TOMBSTONE = -1
+MERGED = -2
+
+# A hint entry is the key size, value size and value offset, then the key
+HINT = struct.Struct('<IIQ')
+
+# A hot key entry is the key size, then the key
+KEY_SIZE = struct.Struct('<I')
+
+# Where the value of a key is stored
+Location = namedtuple('Location', ['file_id', 'offset', 'size'])
+
+
+class BitcaskDataBase(StorageBackend):
+    '''The code is a Python class named BitcaskDataBase, a Bitcask-style storage
+    backend with the AsyncDataBase interface. A table is a directory of data
+    files "<file_id>.data". New records are appended to the active file and
+    an in-memory index maps every key to the file, offset and size of its
+    latest value, so a read is a single slice of a memory mapped file. Deletes
+    append a tombstone.
+
+    When the active file reaches max_file_size a new one is started. Older
+    files are immutable, and once compact_ratio of their bytes are dead they
+    are merged in a background thread into one file holding only the live
+    values, with a hint file of its index that makes the next open fast.
+
+    File writes, flushes and fsyncs run on a writer thread of the table, like
+    the connection thread of AsyncDataBase, and the index is updated on the
+    event loop once the records are in the file.
+
+    This backend suits write heavy tables that are only read by key. All keys
+    are held in memory and there is no SQL, node_keys is the only scan.'''
+
+    def __init__(self, file_name: str, table_name: str, database_path: str | None = None, configs: Configs | dict | None = None) -> None:
+        '''This is the constructor method. It initializes the instance with a file
+        name, a table name, a database path and a configuration, either a Configs
+        object or the "Bitcask" section as a dict. The table is stored in the
+        directory "<database_path><file_name>.bitcask/<table_name>".'''
+        self.configs, configs = resolve_configs(configs, 'Bitcask')
+        if database_path is None:
+            database_path = CWD + configs['DataBase'].get('database_path', 'database/')
+
+        self.file_name = file_name
+        self.table_name = table_name
+        self.database_path = Path(f'{database_path}{file_name}.bitcask')
+        self.path = self.database_path / table_name
+        self.Node = Node
+
+        self.max_file_size = self.configs['max_file_size']
+        self.compact_ratio = self.configs['compact_ratio']
+        self.sync_writes = self.configs['sync_writes']
+
+        self.index = {}
+        self.maps = {}
+        self.sizes = {}
+        self.dead = {}
+        self.active = None
+        self.active_id = None
+        self._compaction = None
+        # Serializes appends, so that records land at the offsets they index
+        self._lock = asyncio.Lock()
+
+    async def open_connection(self) -> None:
+        '''This method creates the directory of the file and starts the writer
+        thread.'''
+        try:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'Bitcask-{self.file_name}')
+            await self.run(lambda: self.database_path.mkdir(parents=True, exist_ok=True))
+        except Exception as error:
+            LOG.exception(f'open_connection: {error}')
+            raise
+        else:
+            LOG.info(f'Connection to "{self.file_name}" established.')
+
+    async def run(self, fn: Callable, *args) -> Any:
+        '''This method runs fn(*args) on the writer thread and returns its result,
+        keeping blocking file I/O off the event loop.'''
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def create(self) -> None:
+        '''This method creates the table directory if it doesn't already exist and
+        loads the index from its hint and data files.'''
+        try:
+            await self.run(lambda: self.path.mkdir(exist_ok=True))
+            await self.run(self._load)
+        except Exception as error:
+            LOG.exception(f'create: {error}')
+            raise
+        else:
+            LOG.info(f'Table "{self.table_name}" loaded, keys={len(self.index)}, files={len(self.sizes)}')
+
+    async def write(self, values: tuple | dict, hot_keys: list | None = None, deletes: list | None = None) -> None:
+        '''This method appends values to the active file. The values can be a
+        (node_id, node) tuple or list, or a dict of pairs. If hot_keys is given,
+        the stored hot key list is replaced, and tombstones are appended for
+        the node_ids in deletes.'''
+        try:
+            if isinstance(values, (tuple, list)):
+                items = [values]
+            elif isinstance(values, dict):
+                items = values.items()
+            else:
+                raise TypeError(f'values must be of type list, tuple or dict. type={type(values)}')
+
+            records = {}
+            for node_id, node in items:
+                if not isinstance(node, (bytes, bytearray, memoryview)):
+                    raise TypeError(f'node must be bytes-like. type={type(node)}')
+                records[self._key(node_id)] = bytes(node)
+
+            async with self._lock:
+                appends = list(records.items())
+                for key in map(self._key, deletes or []):
+                    if key in self.index or key in records:
+                        appends.append((key, None))
+                await self._append(appends)
+
+            if hot_keys is not None:
+                await self.run(self._write_hot_keys, hot_keys)
+        except Exception as error:
+            LOG.exception(f'write: {error}')
+            raise
+        else:
+            LOG.debug(f'Write successful, count={len(values)}, table_name={self.table_name}')
+
+    async def read(self, node_id: str | list) -> Node | list:
+        '''This method reads values using a node_id. A single node_id returns a
+        Node, or None if it is not stored, a list returns a list of Nodes.'''
+        try:
+            if isinstance(node_id, (str, bytes)):
+                location = self.index.get(self._key(node_id))
+                results = None if location is None else self.Node(node_id, self._value(location))
+
+            elif isinstance(node_id, (list, tuple)):
+                results = []
+                for n in node_id:
+                    location = self.index.get(self._key(n))
+                    if location is not None:
+                        results.append(self.Node(n, self._value(location)))
+            else:
+                raise TypeError(f'values must be of type str, bytes, list or tuple. type={type(node_id)}')
+        except Exception as error:
+            LOG.exception(f'read: {error}')
+            raise
+        else:
+            LOG.debug(f'Read successful, node_id={node_id}, table_name={self.table_name}')
+            return results
+
+    async def read_range(self, node_id: str | bytes, offset: int = 0, size: int = -1) -> bytes | None:
+        '''This method reads size bytes of a value from offset, to the end if size
+        is negative, as a slice of its data file.'''
+        location = self.index.get(self._key(node_id))
+        if location is None:
+            return None
+        start = min(offset, location.size)
+        end = location.size if size < 0 else min(location.size, offset + size)
+        return bytes(self._value(Location(location.file_id, location.offset + start, end - start)))
+
+    async def blob_size(self, node_id: str | bytes) -> int | None:
+        '''This method returns the size in bytes of a value from the index.'''
+        location = self.index.get(self._key(node_id))
+        return None if location is None else location.size
+
+    async def node_keys(self) -> list:
+        '''This method retrieves all the node_ids, as bytes.'''
+        return list(self.index)
+
+    async def delete_node(self, node_id: str | list) -> None:
+        '''This method deletes a node, or a list of nodes, by appending 
+        tombstones.'''
+        try:
+            node_ids = node_id if isinstance(node_id, (list, tuple, set)) else [node_id]
+            async with self._lock:
+                await self._append([(key, None) for key in map(self._key, node_ids) if key in self.index])
+        except Exception as error:
+            LOG.exception(f'delete_node: {error}')
+            raise
+        else:
+            LOG.debug(f'Delete node successful, node_id={node_id}, table_name={self.table_name}')
+
+    async def write_hot_keys(self, node_ids: list) -> None:
+        '''This method replaces the stored hot key list. The node_ids should be
+        ordered from the least to the most recently used.'''
+        try:
+            await self.run(self._write_hot_keys, node_ids)
+        except Exception as error:
+            LOG.exception(f'write_hot_keys: {error}')
+            raise
+
+    async def read_hot_keys(self) -> list:
+        '''This method retrieves the stored hot key list, ordered from the least
+        to the most recently used.'''
+        return await self.run(self._read_hot_keys)
+
+    async def compact(self) -> None:
+        '''This method merges the immutable data files into one file of live
+        values and its hint file, after any compaction already running. The
+        merge runs in a worker thread, reads and writes continue meanwhile, and
+        the index is switched over at the end.'''
+        if self._compaction is not None:
+            await asyncio.gather(self._compaction, return_exceptions=True)
+        self._compaction = asyncio.create_task(self._compact())
+        await self._compaction
+
+    async def _compact(self) -> None:
+        ids = sorted(self.maps)
+        if not ids or (len(ids) == 1 and not self.dead[ids[0]]):
+            return
+
+        try:
+            merging = set(ids)
+            live = {k: loc for k, loc in self.index.items() if loc.file_id in merging}
+            merged, size = await asyncio.to_thread(self._merge, ids[-1], live, dict(self.maps))
+            self._switch(ids, live, merged, size)
+        except Exception as error:
+            LOG.exception(f'compact: {error}')
+            raise
+        else:
+            LOG.info(f'Compacted {len(ids)} files into {ids[-1]}, keys={len(merged)}, table_name={self.table_name}')
+
+    async def close(self) -> None:
+        '''This method waits for a running compaction, then closes the files and
+        stops the writer thread.'''
+        try:
+            if self._compaction is not None:
+                await asyncio.gather(self._compaction, return_exceptions=True)
+            async with self._lock:
+                if self.active is not None:
+                    await self.run(self.active.close)
+            for m in self.maps.values():
+                m.close()
+            self._executor.shutdown()
+        except Exception as error:
+            LOG.exception(f'close: {error}')
+            raise
+        else:
+            self.active = None
+            self.maps = {}
+            LOG.info(f'Connection closed, table_name={self.table_name}')
+
+    def stats(self) -> dict:
+        '''This method returns the number of keys and files, and the live and
+        dead bytes of the table.'''
+        total = sum(self.sizes.values())
+        dead = sum(self.dead.values())
+        return {'keys': len(self.index), 'files': len(self.sizes), 'bytes': total, 'dead_bytes': dead}
+
+    # Files
+    def _file(self, file_id: int, suffix: str = 'data') -> Path:
+        return self.path / f'{file_id:09d}.{suffix}'
+
+    def _load(self) -> None:
+        '''Builds the index from the files in id order. A merged file supersedes
+        the files before it, which are left over from an interrupted compaction
+        and are removed. The last file stays active if it is not merged.'''
+        ids = sorted(int(p.stem) for p in self.path.glob('*.data'))
+        merged = [i for i in ids if self._is_merged(i)]
+        if merged:
+            for i in [i for i in ids if i < merged[-1]]:
+                self._file(i).unlink()
+                self._file(i, 'hint').unlink(missing_ok=True)
+            ids = [i for i in ids if i >= merged[-1]]
+
+        for i in ids:
+            if self._file(i, 'hint').exists():
+                self._load_hint(i)
+            else:
+                self._scan(i)
+
+        if ids and not self._is_merged(ids[-1]) and self.sizes[ids[-1]] < self.max_file_size:
+            self.active_id = ids.pop()
+        else:
+            self.active_id = ids[-1] + 1 if ids else 0
+            self.sizes[self.active_id] = 0
+            self.dead[self.active_id] = 0
+        self.active = open(self._file(self.active_id), 'a+b')
+
+        for i in ids:
+            self.maps[i] = self._map(i)
+
+    def _is_merged(self, file_id: int) -> bool:
+        with open(self._file(file_id), 'rb') as f:
+            header = f.read(HEADER_SIZE)
+        return len(header) == HEADER_SIZE and SIZES.unpack_from(header, CRC.size)[1] == MERGED
+
+    def _scan(self, file_id: int) -> None:
+        '''Adds the records of a data file to the index. A torn record at the end,
+        from a crash during a write, is truncated.'''
+        with open(self._file(file_id), 'rb') as f:
+            data = f.read()
+
+        pos = 0
+        self.dead.setdefault(file_id, 0)
+        while pos + HEADER_SIZE <= len(data):
+            (crc,) = CRC.unpack_from(data, pos)
+            key_size, value_size = SIZES.unpack_from(data, pos + CRC.size)
+            end = pos + HEADER_SIZE + key_size + max(value_size, 0)
+            if end > len(data) or crc32(data[pos + CRC.size:end]) != crc:
+                break
+
+            key = data[pos + HEADER_SIZE:pos + HEADER_SIZE + key_size]
+            self._discard(key)
+            if value_size >= 0:
+                self.index[key] = Location(file_id, pos + HEADER_SIZE + key_size, value_size)
+            else:
+                self.dead[file_id] += end - pos
+            pos = end
+
+        if pos < len(data):
+            LOG.warning(f'Truncated a torn record in {self._file(file_id)}, offset={pos}')
+            os.truncate(self._file(file_id), pos)
+        self.sizes[file_id] = pos
+
+    def _load_hint(self, file_id: int) -> None:
+        '''Adds the index of a merged file from its hint file.'''
+        data = self._file(file_id, 'hint').read_bytes()
+        pos = 0
+        self.dead.setdefault(file_id, 0)
+        while pos < len(data):
+            key_size, value_size, offset = HINT.unpack_from(data, pos)
+            key = data[pos + HINT.size:pos + HINT.size + key_size]
+            self._discard(key)
+            self.index[key] = Location(file_id, offset, value_size)
+            pos += HINT.size + key_size
+        self.sizes[file_id] = self._file(file_id).stat().st_size
+
+    def _map(self, file_id: int) -> mmap.mmap | None:
+        with open(self._file(file_id), 'rb') as f:
+            if not self.sizes[file_id]:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Records
+    def _key(self, node_id: str | bytes) -> bytes:
+        return node_id.encode() if isinstance(node_id, str) else bytes(node_id)
+
+    def _record(self, key: bytes, value: bytes | None) -> bytes:
+        '''Returns the record of a key and value, a tombstone if value is None.'''
+        sizes = SIZES.pack(len(key), TOMBSTONE if value is None else len(value))
+        crc = crc32(value or b'', crc32(key, crc32(sizes)))
+        return b''.join((CRC.pack(crc), sizes, key, value or b''))
+
+    async def _append(self, items: list) -> None:
+        '''Appends the records of (key, value) pairs, tombstones for a None value,
+        on the writer thread, then updates the index. A read sees a record only
+        once it is in the file. Callers hold the lock.'''
+        if not items:
+            return
+        records = [self._record(key, value) for key, value in items]
+        await self.run(self._commit, b''.join(records))
+
+        offset = self.sizes[self.active_id]
+        for (key, value), record in zip(items, records):
+            self._discard(key)
+            if value is None:
+                self.dead[self.active_id] += len(record)
+            else:
+                self.index[key] = Location(self.active_id, offset + HEADER_SIZE + len(key), len(value))
+            offset += len(record)
+        self.sizes[self.active_id] = offset
+
+        if offset >= self.max_file_size:
+            await self._rotate()
+
+    def _discard(self, key: bytes) -> None:
+        '''Removes a key from the index, counting its record as dead.'''
+        location = self.index.pop(key, None)
+        if location is not None:
+            self.dead[location.file_id] += HEADER_SIZE + len(key) + location.size
+
+    def _commit(self, data: bytes) -> None:
+        '''Writes records to the active file and flushes them to the operating
+        system, and to disk if sync_writes is set, on the writer thread.'''
+        self.active.write(data)
+        self.active.flush()
+        if self.sync_writes:
+            os.fsync(self.active.fileno())
+
+    async def _rotate(self) -> None:
+        '''Makes the active file immutable and starts a new one. Compaction is
+        started in the background once compact_ratio of the immutable bytes are
+        dead.'''
+        mapped, active = await self.run(self._roll, self.active_id)
+        self.active.close()
+        self.maps[self.active_id] = mapped
+
+        self.active_id += 1
+        self.sizes[self.active_id] = 0
+        self.dead[self.active_id] = 0
+        self.active = active
+
+        total = sum(self.sizes[i] for i in self.maps)
+        dead = sum(self.dead[i] for i in self.maps)
+        running = self._compaction is not None and not self._compaction.done()
+        if total and dead / total >= self.compact_ratio and not running:
+            self._compaction = asyncio.create_task(self._compact())
+
+    def _roll(self, file_id: int) -> tuple:
+        '''Syncs and maps the full active file and opens the next one, on the 
+        writer thread. The full file stays open for reads until the switch.'''
+        os.fsync(self.active.fileno())
+        return self._map(file_id), open(self._file(file_id + 1), 'a+b')
+
+    def _value(self, location: Location) -> bytes:
+        if location.file_id == self.active_id:
+            return os.pread(self.active.fileno(), location.size, location.offset)
+        return self.maps[location.file_id][location.offset:location.offset + location.size]
+
+    def _write_hot_keys(self, node_ids: list) -> None:
+        path = self.path / 'hot_keys'
+        data = b''.join(KEY_SIZE.pack(len(k)) + k for k in map(self._key, node_ids))
+        path.with_suffix('.tmp').write_bytes(data)
+        os.replace(path.with_suffix('.tmp'), path)
+
+    def _read_hot_keys(self) -> list:
+        path = self.path / 'hot_keys'
+        if not path.exists():
+            return []
+        data = path.read_bytes()
+        keys, pos = [], 0
+        while pos < len(data):
+            (size,) = KEY_SIZE.unpack_from(data, pos)
+            keys.append(data[pos + KEY_SIZE.size:pos + KEY_SIZE.size + size])
+            pos += KEY_SIZE.size + size
+        return keys
+
+    # Compaction
+    def _merge(self, merge_id: int, live: dict, maps: dict) -> tuple:
+        '''Writes the live values to "<merge_id>.merge" and its hint file, in a
+        worker thread. Returns the new locations and the size of the file.'''
+        sizes = SIZES.pack(0, MERGED)
+        offset = HEADER_SIZE
+        merged, hint = {}, []
+
+        with open(self._file(merge_id, 'merge'), 'wb') as f:
+            f.write(CRC.pack(crc32(sizes)) + sizes)
+            for key, location in live.items():
+                value = maps[location.file_id][location.offset:location.offset + location.size]
+                sizes = SIZES.pack(len(key), len(value))
+                f.write(b''.join((CRC.pack(crc32(value, crc32(key, crc32(sizes)))), sizes, key, value)))
+
+                merged[key] = Location(merge_id, offset + HEADER_SIZE + len(key), len(value))
+                hint.append(HINT.pack(len(key), len(value), merged[key].offset) + key)
+                offset += HEADER_SIZE + len(key) + len(value)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self._file(merge_id, 'hint.merge'), 'wb') as f:
+            f.write(b''.join(hint))
+            f.flush()
+            os.fsync(f.fileno())
+        return merged, offset
+
+    def _switch(self, ids: list, live: dict, merged: dict, size: int) -> None:
+        '''Replaces the merged files with the merge output, on the event loop
+        thread. Keys written or deleted during the merge keep their newer
+        location. Replacing the last data file is the commit point, the older
+        files are removed afterwards, or by the next open.'''
+        merge_id = ids[-1]
+        self._file(merge_id, 'hint').unlink(missing_ok=True)
+        os.replace(self._file(merge_id, 'merge'), self._file(merge_id))
+        os.replace(self._file(merge_id, 'hint.merge'), self._file(merge_id, 'hint'))
+
+        for i in ids:
+            m = self.maps.pop(i)
+            if m is not None:
+                m.close()
+            del self.sizes[i], self.dead[i]
+            if i != merge_id:
+                self._file(i).unlink()
+                self._file(i, 'hint').unlink(missing_ok=True)
+
+        self.sizes[merge_id] = size
+        self.dead[merge_id] = 0
+        for key, location in merged.items():
+            if self.index.get(key) == live[key]:
+                self.index[key] = location
+            else:
+                self.dead[merge_id] += HEADER_SIZE + len(key) + location.size
+        self.maps[merge_id] = self._map(merge_id)
+
+
+async def test() -> bool:
+    configs = Configs(overrides={'Bitcask': {'max_file_size': 2048, 'compact_ratio': 0.5}})
+    db = BitcaskDataBase('test_bitcask', 'test_case', configs=configs)
+    await db.open_connection()
+    await db.create()
+
+    try:
+        # Overwrite a few keys many times, rotating files and compacting
+        for i in range(200):
+            await db.write({f'key{j}': f'{i}-{j}'.encode() * 4 for j in range(5)})
+        await db.write(('single', b'value'))
+        await db.delete_node('key4')
+        await db.compact()
+
+        assert (await db.read('key0')).node == b'199-0' * 4, 'read after compaction failed'
+        assert await db.read_range('key0', 5, 5) == b'199-0' and await db.blob_size('key0') == 20, 'read_range failed'
+        assert await db.read('key4') is None, 'delete failed'
+        assert {n.node_id for n in await db.read(['key1', 'key4', 'single'])} == {'key1', 'single'}, 'read_many failed'
+        stats = db.stats()
+        assert stats['files'] <= 3, f'files were not compacted: {stats}'
+
+        # Writes during a compaction keep their newer value
+        for i in range(20):
+            await db.write(('key1', f'old{i}'.encode() * 40))
+        compaction = asyncio.create_task(db.compact())
+        await asyncio.sleep(0)
+        await db.write(('key1', b'new'))
+        await compaction
+        assert (await db.read('key1')).node == b'new', 'write during compaction was lost'
+
+        # Concurrent writes are appended on the writer thread, across rotations
+        threads = set()
+        commit = db._commit
+        db._commit = lambda data: (threads.add(threading.current_thread()), commit(data))[1]
+        await asyncio.gather(*(db.write((f'con{i}', f'{i}'.encode() * 100)) for i in range(30)))
+        db._commit = commit
+        assert threads and threading.current_thread() not in threads, 'writes ran on the event loop'
+        assert [n.node for n in await db.read([f'con{i}' for i in range(30)])] == [f'{i}'.encode() * 100 for i in range(30)], 'concurrent writes failed'
+        await db.delete_node([f'con{i}' for i in range(30)])
+
+        try:
+            await db.write('test')
+        except TypeError:
+            LOG.debug('Type error caught, this is expected.')
+        else:
+            raise AssertionError('type error was not raised')
+
+        await db.write_hot_keys([b'key1', b'single'])
+
+        # Reopen from the hint and data files, with a torn record at the end
+        await db.close()
+        with open(db._file(db.active_id), 'ab') as f:
+            f.write(b'\x00' * 7)
+        db = BitcaskDataBase('test_bitcask', 'test_case', configs=configs)
+        await db.open_connection()
+        await db.create()
+
+        assert sorted(await db.node_keys()) == [b'key0', b'key1', b'key2', b'key3', b'single'], 'index rebuild failed'
+        assert (await db.read('key3')).node == b'199-3' * 4, 'read after reopen failed'
+        assert (await db.read('key1')).node == b'new', 'read of the active file after reopen failed'
+        assert await db.read_hot_keys() == [b'key1', b'single'], 'hot keys read failed'
+
+        # LRUDataBase on the bitcask backend
+        from lib.lru_database import LRUDataBase
+        shelf_configs = Configs(overrides={'LRU': {'maxlen': 4}, 'LRU_db': {'backend': 'bitcask'}})
+        async with LRUDataBase('test_bitcask', 'test_shelf', configs=shelf_configs) as shelf:
+            for i in range(10):
+                await shelf.write(f'key{i}', {'value': i})
+            assert await shelf.read(['key0', 'key9', 'nokey']) == {'key0': {'value': 0}, 'key9': {'value': 9}, 'nokey': None}, 'shelf read failed'
+            await shelf.delete('key5')
+            assert sorted([k async for k in shelf]) == sorted(f'key{i}' for i in range(10) if i != 5), 'shelf iteration failed'
+            try:
+                await shelf.backup(db.database_path.with_name('test_bitcask_copy.db'))
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('backup was accepted by the bitcask backend')
+    except Exception as error:
+        LOG.exception(f'BitcaskDataBase Test Failed: {error}', exc_info=True)
+        raise
+    finally:
+        await db.close()
+        for path in sorted(db.database_path.rglob('*'), reverse=True):
+            path.rmdir() if path.is_dir() else path.unlink()
+        db.database_path.rmdir()
+
+    LOG.info('BitcaskDataBase Test completed successfully.')
+    return True
@@ -0,0 +1,445 @@
+'''
+The code is a Python class named BlockLRUDataBase, a block storage mode of
+LRUDataBase for dense tables of small array-valued entities. Keys that share
+a prefix and an index range are packed into one NumPy array per block, so a
+block costs one row, one blob and one round trip for block_size entities.
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import logging
+import re
+from io import BytesIO
+from typing import Any, Callable
+
+import numpy as np
+
+from lib.utilities import Configs, resolve_configs
+from lib.lru_database import LRUDataBase
+
+LOG = logging.getLogger('Block_db')
+
+
+class Block:
+    '''A block of block_size entities of the same shape and dtype. The values
+    array holds the entities by row, the mask marks the rows that are present
+    and dirty is set when the block differs from the database.'''
+    __slots__ = ('values', 'mask', 'dirty')
+
+    def __init__(self, values: np.ndarray, mask: np.ndarray, dirty: bool = False) -> None:
+        self.values = values
+        self.mask = mask
+        self.dirty = dirty
+
+    def __sizeof__(self) -> int:
+        return self.values.nbytes + self.mask.nbytes
+
+    @classmethod
+    def empty(cls, block_size: int, like: np.ndarray) -> 'Block':
+        '''Returns an empty block for entities shaped like the given array.'''
+        values = np.zeros((block_size,) + like.shape, dtype=like.dtype)
+        return cls(values, np.zeros(block_size, dtype=bool), dirty=True)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'Block':
+        '''Loads a block written by to_bytes.'''
+        f = BytesIO(blob)
+        values = np.load(f, allow_pickle=False)
+        mask = np.unpackbits(np.load(f, allow_pickle=False), count=len(values)).astype(bool)
+        return cls(values, mask)
+
+    def to_bytes(self) -> bytes:
+        '''Serializes the block as two .npy arrays, the values and the bit
+        packed mask.'''
+        f = BytesIO()
+        np.save(f, self.values, allow_pickle=False)
+        np.save(f, np.packbits(self.mask), allow_pickle=False)
+        return f.getvalue()
+
+
+class BlockLRUDataBase(LRUDataBase):
+    '''The code is a Python class named BlockLRUDataBase that stores array-valued
+    entities in blocks. A key is split by key_pattern into a prefix and an
+    integer index, and the entity is stored at row index % block_size of the
+    block "<prefix>#<index // block_size>".
+
+    The LRU caches whole blocks as live NumPy arrays, so reads and writes of
+    single entities are served from the cached block without serialization.
+    When blocks are synced or flushed, only the blocks that changed are written,
+    each as one row. All entities sharing a prefix must have the same shape and
+    dtype, and indexes are canonical integers, so "pc_007" is stored as "pc_7".
+
+    This class is useful for dense entity tables, like the particles in main.py,
+    where a row, a pickle header and a round trip per entity dominate the cost.'''
+
+    def __init__(self, file_name: str, table_name: str, configs: Configs | dict | None = None) -> None:
+        '''This is the constructor method. A dict configs is taken as the
+        "LRU_db" section, the block settings come from the "Block_db" section.'''
+        super().__init__(file_name, table_name, configs)
+        if self.integer_keys:
+            raise ValueError('integer_keys is not supported by block storage, blocks are keyed by prefix')
+        if self.lru_index != 'dict':
+            raise ValueError('lru_index must be "dict" for block storage, blocks are mutable objects')
+        if self.compress_level or self.object_cache_size:
+            raise ValueError('compress_level and object_cache_size must be 0 for block storage, blocks are cached as arrays')
+        if self.coherence or self.deferred_deletes:
+            raise ValueError('coherence and deferred_deletes are not supported by block storage, entities are read and deleted in their blocks')
+        block_configs, _ = resolve_configs(self.configs, 'Block_db')
+        self.block_size = block_configs['block_size']
+        self.key_pattern = re.compile(block_configs['key_pattern'])
+
+    async def __anext__(self):
+        '''Iterates over the entity keys in the database and the cached blocks.'''
+        if not hasattr(self, '_database_keys'):
+            self._database_keys = await self.node_keys()
+        try:
+            return self._database_keys.pop()
+        except IndexError:
+            self.__dict__.pop('_database_keys')
+            raise StopAsyncIteration
+
+    async def write(self, key: str, value: Any) -> None:
+        '''This method writes an entity into its cached block, loading or creating
+        the block first. If the LRU is full, the oldest blocks are synced.'''
+        block_id, row = self._locate(key)
+        block = await self._block(block_id)
+        self._put(key, block_id, block, row, np.asarray(value))
+
+        if self.lru.deck_full:
+            await self.sync()
+
+    async def update_many(self, keys: list, fn: Callable, default: Any = None) -> dict:
+        '''This method replaces the entity of each key with fn(value), fn(default)
+        if the entity is missing, and returns a dict of the new values. fn gets
+        a copy of the row, and the row is replaced in its cached block, with
+        no other call in between, see LRUDataBase.update_many.'''
+        results = {}
+        for key in keys:
+            block_id, row = self._locate(key)
+            block = await self._block(block_id)
+            value = self._row(block, row)
+            results[key] = fn(default if value is None else value.copy())
+            self._put(key, block_id, block, row, np.asarray(results[key]))
+            if self.lru.deck_full:
+                await self.sync()
+        return results
+
+    async def version(self, key: str) -> str | None:
+        '''This method returns the version of an entity, a hash of the bytes of
+        its row, or None if it is missing. See compare_and_set.'''
+        block_id, row = self._locate(key)
+        value = self._row(await self._block(block_id), row)
+        if self.lru.deck_full:
+            await self.sync()
+        return None if value is None else self._version(value.tobytes())
+
+    async def compare_and_set(self, key: str, version: str | None, value: Any) -> bool:
+        '''This method writes an entity only if its version is still version, as
+        returned by the version method, None if it must be missing. Returns
+        True if the entity was written.'''
+        block_id, row = self._locate(key)
+        block = await self._block(block_id)
+        current = self._row(block, row)
+        written = (None if current is None else self._version(current.tobytes())) == version
+        if written:
+            self._put(key, block_id, block, row, np.asarray(value))
+        if self.lru.deck_full:
+            await self.sync()
+        return written
+
+    async def read(self, key: str | list, cache: bool | str = True) -> Any | dict:
+        '''This method reads an entity, a copy of its row in the block, or None if
+        it is not stored. A list of keys returns a dict, with the missing blocks
+        read from the database in one call. Blocks are always cached, cache is 
+        accepted for the interface of LRUDataBase.read.'''
+        if isinstance(key, list):
+            return await self._read_many(key)
+
+        block_id, row = self._locate(key)
+        block = await self._block(block_id)
+        value = None if block is None or not block.mask[row] else block.values[row].copy()
+        if self.lru.deck_full:
+            await self.sync()
+        return value
+
+    async def _read_many(self, keys: list) -> dict:
+        '''Reads a list of keys. Blocks not in the LRU are read from the database
+        together, then every key is served from its block.'''
+        located = {key: self._locate(key) for key in keys}
+
+        # The blocks are kept here, a sync may evict them from the LRU
+        missing = list({block_id for block_id, _ in located.values() if block_id not in self.lru})
+        blocks = dict.fromkeys(missing)
+        if missing:
+            for blob in await self._db_read(missing):
+                blocks[blob.node_id] = self._admit(blob.node_id, Block.from_bytes(blob.node))
+                if self.lru.deck_full:
+                    await self.sync()
+
+        results = {}
+        for key, (block_id, row) in located.items():
+            if block_id not in blocks:
+                blocks[block_id] = await self._block(block_id)
+                if self.lru.deck_full:
+                    await self.sync()
+            block = blocks[block_id]
+            if block is None or not block.mask[row]:
+                results[key] = None
+            else:
+                results[key] = block.values[row].copy()
+        return results
+
+    async def node_keys(self) -> list:
+        '''Retrieves the keys of all stored entities. Every block in the database
+        that is not cached is read to find its rows.'''
+        cached = {k: self._load(k) for k in list(self.lru.cache)}
+        keys = []
+
+        block_ids = [k for k in await self.db.node_keys() if k not in cached]
+        for i in range(0, len(block_ids), self.warm_batch):
+            for blob in await self.db.read(block_ids[i:i + self.warm_batch]):
+                keys.extend(self._entity_keys(blob.node_id, Block.from_bytes(blob.node)))
+
+        for block_id, block in cached.items():
+            keys.extend(self._entity_keys(block_id, block))
+        return keys
+
+    async def delete(self, key: str) -> None:
+        '''This method removes an entity from its block. The block is written on
+        the next sync or flush, and removed from the database once it is empty.'''
+        block_id, row = self._locate(key)
+        block = await self._block(block_id)
+        if block is not None and block.mask[row]:
+            block.mask[row] = False
+            block.values[row] = 0
+            block.dirty = True
+            self._touched([block_id])
+        if self.lru.deck_full:
+            await self.sync()
+
+    async def flush_cache(self) -> None:
+        '''This method writes the changed blocks to the database and empties the
+        LRU. With warm_start enabled, the cached block ids are saved as well.'''
+        try:
+            hot_keys = list(self.lru.deck) if self.warm_start else None
+            await self._write_blocks(self.lru.cache, hot_keys)
+            cache_size = len(self.lru)
+        except Exception as error:
+            LOG.exception(f'flush_cache: {error}')
+            raise
+        else:
+            self.lru._create_empty_deck()
+            LOG.info(f'Flushed the LRU cache, shelve_name={self.table_name}, count={cache_size}')
+
+    async def sync(self) -> None:
+        '''This method offloads the oldest blocks from the LRU, writing the ones
+        that changed.'''
+        try:
+            sync_store = self.lru.sync_make_ready()
+            await self._write_blocks(sync_store)
+        except Exception as error:
+            LOG.exception(f'sync: {error}')
+            raise
+        else:
+            LOG.info(f'Sync offloaded old cached blocks to the database, shelve_name={self.table_name}, count={len(sync_store)}')
+
+    async def _write_blocks(self, blocks: dict, hot_keys: list | None = None) -> None:
+        '''Writes the dirty blocks in one transaction and deletes the empty ones, 
+        then updates the shared tier. Serialized values, cached by warm start, 
+        are clean and skipped.'''
+        dirty = {k: b for k, b in blocks.items() if isinstance(b, Block) and b.dirty}
+        empty = [k for k, b in dirty.items() if not b.mask.any()]
+        values = {k: b.to_bytes() for k, b in dirty.items() if b.mask.any()}
+
+        await self.db.write(values, hot_keys=hot_keys, deletes=empty)
+        self._publish(values, empty)
+
+        for block in dirty.values():
+            block.dirty = False
+
+    async def _block(self, block_id: bytes) -> Block | None:
+        '''Returns the block from the LRU, or from the database, or None.'''
+        try:
+            self.lru[block_id]
+        except KeyError:
+            blob = await self._db_read(block_id)
+            if blob is None:
+                return None
+            return self._admit(block_id, Block.from_bytes(blob.node))
+        else:
+            return self._load(block_id)
+
+    def _put(self, key: str, block_id: bytes, block: Block | None, row: int, value: np.ndarray) -> None:
+        '''Stores an entity at its row of a block loaded by _block, creating the
+        block if it is None. The value must match the shape and dtype of the
+        block.'''
+        if block is None:
+            block = Block.empty(self.block_size, value)
+            self.lru[block_id] = block
+        elif block.values.shape[1:] != value.shape or block.values.dtype != value.dtype:
+            raise ValueError(f'{key}: shape {value.shape} {value.dtype} does not match block {block.values.shape[1:]} {block.values.dtype}')
+
+        block.values[row] = value
+        block.mask[row] = True
+        block.dirty = True
+        self._touched([block_id])
+
+    @staticmethod
+    def _row(block: Block | None, row: int) -> np.ndarray | None:
+        '''Returns the row of an entity in its block, or None if it is missing.'''
+        return None if block is None or not block.mask[row] else block.values[row]
+
+    def _admit(self, block_id: bytes, block: Block) -> Block:
+        '''Adds a block read from the database to the LRU and returns it, or 
+        the cached block if another task cached it first. The caller syncs 
+        when the LRU is full, once it is done with the block, since the sync 
+        may evict it and a change made after that would be lost.'''
+        if block_id not in self.lru:
+            self.lru[block_id] = block
+            return block
+        return self._load(block_id)
+
+    def _load(self, block_id: bytes) -> Block:
+        '''Returns a cached block. Warm start caches serialized blocks, which 
+        are loaded here on first use.'''
+        value = self.lru.cache[block_id]
+        if isinstance(value, bytes):
+            value = self.lru.cache[block_id] = Block.from_bytes(value)
+        return value
+
+    def _locate(self, key: str) -> tuple:
+        '''Returns the (block_id, row) of a key.'''
+        match = self.key_pattern.match(key)
+        if match is None:
+            raise ValueError(f'key "{key}" does not match key_pattern "{self.key_pattern.pattern}"')
+        prefix, index = match.group(1), int(match.group(2))
+        block_id = self._encode_key(f'{prefix}#{index // self.block_size}')
+        return block_id, index % self.block_size
+
+    def _entity_keys(self, block_id: bytes, block: Block) -> list:
+        '''Returns the keys of the entities present in a block.'''
+        prefix, number = self._decode_key(block_id).rsplit('#', 1)
+        first = int(number) * self.block_size
+        return [f'{prefix}{first + row}' for row in np.flatnonzero(block.mask)]
+
+
+async def test() -> bool:
+    configs = Configs(overrides={'LRU': {'maxlen': 4}, 'Block_db': {'block_size': 8}})
+    shelf = BlockLRUDataBase('test_block_database', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+
+    try:
+        # 40 entities in 5 blocks, with an LRU of 4 blocks
+        data = {f'pc_{i}': np.array([i, -i, 0.5 * i, 1.0]) for i in range(40)}
+        for k, v in data.items():
+            await shelf.write(k, v)
+
+        assert len(await shelf.db.node_keys()) < 5, 'blocks were not synced'
+        assert np.array_equal(await shelf.read('pc_3'), data['pc_3']), 'block read failed'
+        assert await shelf.read('pc_99') is None, 'missing block read failed'
+
+        results = await shelf.read(['pc_0', 'pc_17', 'pc_39', 'pc_40'])
+        for k in ['pc_0', 'pc_17', 'pc_39']:
+            assert np.array_equal(results[k], data[k]), f'{k} read_many failed'
+        assert results['pc_40'] is None, 'missing entity read_many failed'
+
+        await shelf.delete('pc_17')
+        assert await shelf.read('pc_17') is None, 'delete failed'
+
+        try:
+            await shelf.write('pc_1', np.zeros(3))
+        except ValueError:
+            LOG.debug('Shape error caught, this is expected.')
+        else:
+            raise AssertionError('shape mismatch was not caught')
+
+        # Reconnect, the blocks and the hot set are persisted
+        await shelf.close()
+        await shelf.connect()
+        await shelf._warm_task
+        keys = [k async for k in shelf]
+        assert sorted(keys) == sorted(k for k in data if k != 'pc_17'), f'node_keys failed, {keys}'
+        assert np.array_equal(await shelf.read('pc_38'), data['pc_38']), 'read after reconnect failed'
+        assert len(await shelf.db.node_keys()) == 5, 'one row per block failed'
+    except Exception as error:
+        LOG.exception(f'BlockLRUDataBase Test Failed: {error}', exc_info=True)
+        raise
+    finally:
+        await shelf.close()
+        database_path.unlink()
+
+    for setting in ({'compress_level': 6}, {'object_cache_size': 4}, {'coherence': True}, {'deferred_deletes': True}):
+        try:
+            BlockLRUDataBase('test_block_database', 'test_case', configs=Configs(overrides={'LRU_db': setting}))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'{setting} was accepted by block storage')
+
+    # A sync of every cached block, triggered by the block being read or 
+    # written, does not lose it
+    configs = Configs(overrides={
+        'LRU': {'maxlen': 2, 'sync_fraction': 1.0}, 'Block_db': {'block_size': 8}, 'LRU_db': {'warm_start': False}})
+    shelf = BlockLRUDataBase('test_block_database', 'test_case', configs=configs)
+    await shelf.connect()
+    try:
+        for i in range(24):
+            await shelf.write(f'pc_{i}', np.array([i, 1.0]))
+        assert (await shelf.read('pc_0'))[0] == 0 and (await shelf.read('pc_20'))[0] == 20, 'read with a full sync failed'
+        results = await shelf.read(['pc_1', 'pc_9', 'pc_17'])
+        assert [v[0] for v in results.values()] == [1, 9, 17], 'read_many with a full sync failed'
+        await shelf.write('pc_2', np.array([-2, 1.0]))
+
+        # An empty block is deleted with the write of the other blocks
+        for i in range(8, 16):
+            await shelf.delete(f'pc_{i}')
+        await shelf.flush_cache()
+        assert sorted(await shelf.db.node_keys()) == [b'pc_#0', b'pc_#2'], 'empty block was not deleted'
+        assert (await shelf.read('pc_2'))[0] == -2, 'write with a full sync failed'
+
+        # Updates go through the blocks, not stray rows of the entity keys
+        assert (await shelf.update('pc_0', lambda v: v + 1))[0] == 1, 'update of a synced entity failed'
+        assert (await shelf.update('pc_30', lambda v: v + 1, np.zeros(2)))[0] == 1, 'update of a missing entity failed'
+        assert (await shelf.read('pc_0'))[0] == 1, 'update was not stored in the block'
+        version = await shelf.version('pc_0')
+        assert await shelf.compare_and_set('pc_0', version, np.array([5, 1.0])), 'compare_and_set failed'
+        assert not await shelf.compare_and_set('pc_0', version, np.array([6, 1.0])), 'stale compare_and_set was written'
+        assert await shelf.compare_and_set('pc_31', None, np.array([31, 1.0])), 'compare_and_set of a missing entity failed'
+        await shelf.flush_cache()
+        assert (await shelf.read('pc_0'))[0] == 5 and (await shelf.read('pc_31'))[0] == 31, 'updates were lost by a flush'
+        assert all(b'#' in k for k in await shelf.db.node_keys()), 'update wrote a row outside the blocks'
+        assert 'pc_31' in await shelf.node_keys(), 'node_keys after updates failed'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+
+    # Blocks written by a shelf replace the blocks in the shared tier
+    configs = Configs(overrides={'LRU_db': {'shared_cache': True, 'warm_start': False}, 'Block_db': {'block_size': 8}})
+    shelf = BlockLRUDataBase('test_block_database', 'test_case', configs=configs)
+    await shelf.connect()
+    shared = shelf.shared
+    try:
+        for value in (1.0, 2.0):
+            await shelf.write('pc_0', np.array([value, value]))
+            await shelf.flush_cache()
+            assert (await shelf.read('pc_0'))[0] == value, 'stale block read from the shared tier'
+    finally:
+        await shelf.close()
+        shared.unlink()
+        database_path.unlink()
+
+    LOG.info('BlockLRUDataBase Test completed successfully.')
+    return True
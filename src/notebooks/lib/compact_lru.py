@@ -0,0 +1,491 @@
+'''
+The code is a Python class named CompactLRU, an LRU cache index with the
+interface of LRU for tens of millions of entries. Entries live in flat slot
+arrays linked by integer indexes in recency order, an open addressing table
+maps key hashes to slots, and keys and bytes values are packed in one
+bytearray arena, so an entry costs a few dozen bytes besides its key and value
+instead of a dict entry, a deque slot and two bytes objects.
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import logging
+from array import array
+from typing import Any
+
+from lib.lru import LRU, MissRatioCurve
+from lib.utilities import Configs, resolve_configs
+
+LOG = logging.getLogger('LRU')
+
+# Settings of the "LRU" section used by CompactLRU
+CONFIG = (
+    'maxlen', 'sync_fraction', 'adaptive_sync', 'target_stall', 'min_sync_batch', 'sync_decay',
+    'mrc_sample_rate', 'mrc_max_samples', 'mrc_min_samples', 'auto_resize', 'target_hit_ratio',
+    'resize_interval', 'min_maxlen', 'memory_budget',
+)
+
+# Index table markers, an unused position and the position of a deleted key
+EMPTY = -1
+DELETED = -2
+
+# Load factor of the index table, including deleted positions
+MAX_LOAD = 0.7
+
+# Slot flags. The low bits are the type id of a bytes value in the arena,
+# OBJECT marks any other value, held in a dict. INT_KEY marks an int key,
+# stored as 8 bytes.
+OBJECT = 0x7f
+INT_KEY = 0x80
+
+# The arena is compacted when more than half of it, and at least this many
+# bytes, are overwritten or deleted entries
+MIN_GARBAGE = 1 << 16
+
+
+class CompactLRU:
+    '''This class is an LRU cache with the interface of LRU, used by
+    LRUDataBase with lru_index set to "compact". Keys are bytes or ints, values
+    are stored in the arena when they are bytes, or a bytes subclass, and
+    kept as they are otherwise.
+
+    Each entry is a slot of parallel arrays: the key hash, the arena offset,
+    key and value lengths, flags and the previous and next slot in recency
+    order, from the least (head) to the most (tail) recently used. Freed
+    slots are reused. The deck and cache attributes of LRU are built on
+    access, so they are for flushing and debugging, not for every operation.'''
+
+    __slots__ = CONFIG + (
+        'count', 'size_bytes', 'hits', 'misses', '_last_miss', '_references',
+        'sync_batch', 'sync_cost', '_sync_sums', 'mrc',
+        '_hashes', '_offsets', '_key_lens', '_value_lens', '_flags', '_prev', '_next',
+        '_head', '_tail', '_free', '_objects', '_types',
+        '_table', '_mask', '_fill', '_arena', '_garbage',
+    )
+
+    def __init__(self, configs: Configs | dict | None = None) -> None:
+        '''This is the constructor method. It initializes the cache with a given
+        configuration, see LRU.__init__.'''
+        section, _ = resolve_configs(configs, 'LRU')
+        for name in CONFIG:
+            setattr(self, name, section[name])
+        self._create_empty_deck(self.maxlen)
+
+        # Statistics and adaptive eviction batch sizing, see LRU.__init__
+        self.hits = 0
+        self.misses = 0
+        self._last_miss = None
+        self._references = 0
+        self.sync_batch = max(1, int(self.maxlen * self.sync_fraction))
+        self.sync_cost = (0.0, 0.0)
+        self._sync_sums = [0.0] * 5
+        if self.mrc_sample_rate:
+            self.mrc = MissRatioCurve(self.mrc_sample_rate, self.mrc_max_samples)
+        else:
+            self.mrc = None
+
+    # The policy code does not depend on the storage of the entries
+    record_sync = LRU.record_sync
+    hit_ratio_curve = LRU.hit_ratio_curve
+    stats = LRU.stats
+    _record = LRU._record
+    _auto_resize = LRU._auto_resize
+    _sync_limit = LRU._sync_limit
+    _sizeof = staticmethod(LRU._sizeof)
+
+    def __contains__(self, key: bytes | int) -> bool:
+        '''This method checks if a key is in the cache.'''
+        return self._find(key)[0] >= 0
+
+    def __len__(self) -> int:
+        '''This method returns the number of items in the cache.'''
+        return self.count
+
+    def __delitem__(self, key: bytes | int) -> None:
+        '''This method removes an item from the cache, if it is cached.'''
+        slot, position = self._find(key)
+        if slot >= 0:
+            self._table[position] = DELETED
+            self._unlink(slot)
+            self._release(slot)
+
+    def __iter__(self):
+        '''This method iterates through the keys, starting with the most
+        recently used key.'''
+        slot = self._tail
+        while slot >= 0:
+            previous = self._prev[slot]
+            yield self._key(slot)
+            slot = previous
+
+    def __getitem__(self, key: bytes | int) -> Any:
+        '''This method retrieves an item from the cache and marks it most
+        recently used, see LRU.__getitem__.'''
+        self._record(key)
+        slot = self._find(key)[0]
+        if slot < 0:
+            self.misses += 1
+            self._last_miss = key
+            raise KeyError(key)
+        if slot != self._tail:
+            self._unlink(slot)
+            self._append(slot)
+        self.hits += 1
+        return self._value(slot)
+
+    def __setitem__(self, key: bytes | int, value: Any) -> None:
+        '''This method adds or updates an item and marks it most recently used,
+        see LRU.__setitem__.'''
+        if key == self._last_miss:
+            self._last_miss = None
+        else:
+            self._record(key)
+        self._put(key, value, front=False)
+
+    @property
+    def deck_full(self) -> bool:
+        '''True when the cache holds maxlen items or more.'''
+        return self.count >= self.maxlen
+
+    @property
+    def deck(self) -> list:
+        '''The keys from the least to the most recently used, built on access.'''
+        keys = list(self)
+        keys.reverse()
+        return keys
+
+    @property
+    def cache(self) -> dict:
+        '''The items from the least to the most recently used, built on access.'''
+        items = {}
+        slot = self._head
+        while slot >= 0:
+            items[self._key(slot)] = self._value(slot)
+            slot = self._next[slot]
+        return items
+
+    def _create_empty_deck(self, maxlen: None | int = None) -> None:
+        '''This method empties the cache and optionally sets a new maximum
+        length, see LRU._create_empty_deck.'''
+        if maxlen is not None:
+            self.maxlen = maxlen
+
+        self._hashes = array('q')
+        self._offsets = array('Q')
+        self._key_lens = array('I')
+        self._value_lens = array('I')
+        self._flags = array('B')
+        self._prev = array('i')
+        self._next = array('i')
+        self._head = self._tail = -1
+        self._free = -1
+        self._objects = {}
+        self._types = [bytes]
+
+        self._table = array('i', [EMPTY]) * 8
+        self._mask = 7
+        self._fill = 0
+        self._arena = bytearray()
+        self._garbage = 0
+
+        self.count = 0
+        self.size_bytes = 0
+        LOG.info(f'compact cache initialized with max size={self.maxlen}.')
+
+    def warm(self, key: bytes | int, value: Any) -> bool:
+        '''This method adds an item at the least recently used end without
+        counting a reference, see LRU.warm. Returns True if the item was added.'''
+        if self.count >= self.maxlen - 1 or key in self:
+            return False
+        self._put(key, value, front=True)
+        return True
+
+    def get(self, key: bytes | int, default: Any = None) -> Any:
+        '''This method retrieves an item from the cache.
+        If the key is not found, it returns a default value.'''
+        if key in self:
+            return self[key]
+        return default
+
+    def peek(self, key: bytes | int, default: Any = None) -> Any:
+        '''This method returns the cached value of a key, or a default value,
+        without counting a reference or reordering the deck.'''
+        slot = self._find(key)[0]
+        return default if slot < 0 else self._value(slot)
+
+    def oldest(self) -> bytes | int | None:
+        '''This method returns the least recently used key, or None if the cache
+        is empty.'''
+        return None if self._head < 0 else self._key(self._head)
+
+    def sync_make_ready(self) -> dict:
+        '''This method removes the least recently used items down to the number
+        kept after a sync and returns them, see LRU.sync_make_ready.'''
+        if self.adaptive_sync:
+            batch = min(self.sync_batch, self._sync_limit())
+        else:
+            batch = max(1, int(self.maxlen * self.sync_fraction))
+        evict = max(0, self.count - (self.maxlen - batch))
+
+        sync_store = {}
+        for _ in range(evict):
+            slot = self._head
+            key = self._key(slot)
+            sync_store[key] = self._value(slot)
+            self._table[self._find(key)[1]] = DELETED
+            self._unlink(slot)
+            self._release(slot)
+
+        LOG.info(f'sync_store created with "{len(sync_store)}" keys.')
+        return sync_store
+
+    def resize(self, maxlen: int) -> None:
+        '''This method changes the maximum number of items without dropping
+        any, see LRU.resize.'''
+        maxlen = max(1, int(maxlen))
+        old_maxlen, self.maxlen = self.maxlen, maxlen
+        LOG.info(f'cache resized from {old_maxlen} to {maxlen}.')
+
+    def _put(self, key: bytes | int, value: Any, front: bool) -> None:
+        '''Stores a value under a key, at the most recently used end, or the
+        least recently used end if front.'''
+        raw, kind = self._raw_key(key)
+        slot, position = self._find(key)
+        if slot >= 0:
+            self._unlink(slot)
+            self._drop_value(slot)
+        else:
+            slot = self._slot()
+            self._hashes[slot] = hash(key)
+            if self._table[position] == EMPTY:
+                self._fill += 1
+            self._table[position] = slot
+            self.count += 1
+
+        # The key and value are appended to the arena as one record
+        self._offsets[slot] = len(self._arena)
+        self._key_lens[slot] = len(raw)
+        self._arena += raw
+        value_type = type(value)
+        if isinstance(value, bytes) and value_type not in self._types and len(self._types) < OBJECT:
+            self._types.append(value_type)
+        if value_type in self._types:
+            self._flags[slot] = kind | self._types.index(value_type)
+            self._value_lens[slot] = len(value)
+            self._arena += value
+        else:
+            self._flags[slot] = kind | OBJECT
+            self._value_lens[slot] = 0
+            self._objects[slot] = value
+        self.size_bytes += self._sizeof(value)
+
+        if front:
+            self._prepend(slot)
+        else:
+            self._append(slot)
+
+        if self._fill > MAX_LOAD * len(self._table):
+            self._rehash()
+        if self._garbage > MIN_GARBAGE and 2 * self._garbage > len(self._arena):
+            self._compact()
+
+    def _find(self, key: bytes | int) -> tuple:
+        '''Returns the slot of a key, or -1, and its position in the index
+        table, or the position to insert it at.'''
+        raw, kind = self._raw_key(key)
+        key_hash = hash(key)
+        table, mask = self._table, self._mask
+        position = key_hash & mask
+        insert_at = -1
+        while True:
+            slot = table[position]
+            if slot == EMPTY:
+                return -1, position if insert_at < 0 else insert_at
+            if slot == DELETED:
+                if insert_at < 0:
+                    insert_at = position
+            elif self._hashes[slot] == key_hash and self._flags[slot] & INT_KEY == kind:
+                offset = self._offsets[slot]
+                if self._arena[offset:offset + self._key_lens[slot]] == raw:
+                    return slot, position
+            position = (position + 1) & mask
+
+    def _raw_key(self, key: bytes | int) -> tuple:
+        '''Returns the bytes stored for a key and its key flag.'''
+        if isinstance(key, bytes):
+            return key, 0
+        if isinstance(key, int):
+            return key.to_bytes(8, 'little', signed=True), INT_KEY
+        raise TypeError(f'CompactLRU keys must be bytes or int, type={type(key)}')
+
+    def _key(self, slot: int) -> bytes | int:
+        '''Returns the key of a slot.'''
+        offset = self._offsets[slot]
+        raw = bytes(self._arena[offset:offset + self._key_lens[slot]])
+        if self._flags[slot] & INT_KEY:
+            return int.from_bytes(raw, 'little', signed=True)
+        return raw
+
+    def _value(self, slot: int) -> Any:
+        '''Returns the value of a slot.'''
+        value_type = self._flags[slot] & OBJECT
+        if value_type == OBJECT:
+            return self._objects[slot]
+        start = self._offsets[slot] + self._key_lens[slot]
+        value = self._arena[start:start + self._value_lens[slot]]
+        return bytes(value) if value_type == 0 else self._types[value_type](value)
+
+    def _slot(self) -> int:
+        '''Returns a free slot, growing the slot arrays if none is free.'''
+        slot = self._free
+        if slot >= 0:
+            self._free = self._next[slot]
+            return slot
+        for values in (self._hashes, self._offsets, self._key_lens, self._value_lens, self._flags, self._prev, self._next):
+            values.append(0)
+        return len(self._hashes) - 1
+
+    def _drop_value(self, slot: int) -> None:
+        '''Accounts for the record of a slot that is overwritten or freed.'''
+        self._garbage += self._key_lens[slot] + self._value_lens[slot]
+        if self._flags[slot] & OBJECT == OBJECT:
+            self.size_bytes -= self._sizeof(self._objects.pop(slot))
+        else:
+            self.size_bytes -= self._value_lens[slot]
+
+    def _release(self, slot: int) -> None:
+        '''Frees an unlinked slot, whose index position is already deleted.'''
+        self._drop_value(slot)
+        self._next[slot] = self._free
+        self._free = slot
+        self.count -= 1
+
+    def _unlink(self, slot: int) -> None:
+        '''Removes a slot from the recency list.'''
+        previous, following = self._prev[slot], self._next[slot]
+        if previous >= 0:
+            self._next[previous] = following
+        else:
+            self._head = following
+        if following >= 0:
+            self._prev[following] = previous
+        else:
+            self._tail = previous
+
+    def _append(self, slot: int) -> None:
+        '''Links a slot at the most recently used end.'''
+        self._prev[slot] = self._tail
+        self._next[slot] = -1
+        if self._tail >= 0:
+            self._next[self._tail] = slot
+        else:
+            self._head = slot
+        self._tail = slot
+
+    def _prepend(self, slot: int) -> None:
+        '''Links a slot at the least recently used end.'''
+        self._prev[slot] = -1
+        self._next[slot] = self._head
+        if self._head >= 0:
+            self._prev[self._head] = slot
+        else:
+            self._tail = slot
+        self._head = slot
+
+    def _rehash(self) -> None:
+        '''Rebuilds the index table without deleted positions, doubling it if
+        the live keys alone would pass half of MAX_LOAD.'''
+        size = len(self._table)
+        while self.count > MAX_LOAD * size / 2:
+            size *= 2
+        table = array('i', [EMPTY]) * size
+        mask = size - 1
+        slot = self._head
+        while slot >= 0:
+            position = self._hashes[slot] & mask
+            while table[position] != EMPTY:
+                position = (position + 1) & mask
+            table[position] = slot
+            slot = self._next[slot]
+        self._table, self._mask, self._fill = table, mask, self.count
+
+    def _compact(self) -> None:
+        '''Copies the live records to a new arena, dropping overwritten and
+        deleted ones.'''
+        arena = bytearray()
+        slot = self._head
+        while slot >= 0:
+            offset = self._offsets[slot]
+            self._offsets[slot] = len(arena)
+            arena += self._arena[offset:offset + self._key_lens[slot] + self._value_lens[slot]]
+            slot = self._next[slot]
+        LOG.debug(f'arena compacted from {len(self._arena)} to {len(arena)} bytes.')
+        self._arena = arena
+        self._garbage = 0
+
+
+def test() -> bool:
+    configs = {'maxlen': 4, 'sync_fraction': 0.5, 'adaptive_sync': False, 'target_stall': 0.01,
+               'min_sync_batch': 1, 'sync_decay': 0.9, 'mrc_sample_rate': 0, 'mrc_max_samples': 8192,
+               'mrc_min_samples': 100, 'auto_resize': False, 'target_hit_ratio': 0.9,
+               'resize_interval': 10000, 'min_maxlen': 10, 'memory_budget': None}
+    try:
+        lru = CompactLRU(configs)
+        assert not hasattr(lru, '__dict__'), 'CompactLRU has a __dict__'
+
+        for i in range(3):
+            lru[f'{i}'.encode()] = f'value{i}'.encode()
+        assert b'0' in lru and b'9' not in lru, 'contains failed'
+        assert lru[b'0'] == b'value0' and lru.deck == [b'1', b'2', b'0'], f'get failed: {lru.deck}'
+        assert lru.get(b'9', 'pass') == 'pass', 'get default failed'
+        assert list(lru) == [b'0', b'2', b'1'], f'iter failed: {list(lru)}'
+        assert lru.oldest() == b'1', f'oldest failed: {lru.oldest()}'
+
+        # Full, the two oldest items are synced. [1, 2, 0, 3] -> [0, 3]
+        lru[b'3'] = b'value3'
+        assert lru.deck_full, 'deck_full failed'
+        sync_store = lru.sync_make_ready()
+        assert sync_store == {b'1': b'value1', b'2': b'value2'}, f'sync_make_ready failed: {sync_store}'
+        assert lru.deck == [b'0', b'3'] and lru.count == 2 and not lru.deck_full, 'sync failed'
+
+        # Ints, objects, bytes subclasses and updates
+        class Packed(bytes):
+            pass
+        sentinel = object()
+        lru[7] = Packed(b'packed')
+        lru[b'0'] = sentinel
+        del lru[b'3']
+        assert type(lru.peek(7)) is Packed and lru.peek(b'0') is sentinel, 'value types failed'
+        assert lru.cache == {7: b'packed', b'0': sentinel}, f'cache failed: {lru.cache}'
+        assert lru.warm(b'w', b'warm') and lru.deck[0] == b'w', 'warm failed'
+        assert lru.size_bytes == len(b'packed') + len(b'warm') + lru._sizeof(sentinel), f'size_bytes failed: {lru.size_bytes}'
+
+        # Many updates and deletes, the index is rehashed and the arena compacted
+        lru._create_empty_deck(100000)
+        for i in range(20000):
+            lru[i % 5000] = bytes(100)
+            if i % 3 == 0:
+                del lru[(i * 7) % 5000]
+        expected = {i % 5000 for i in range(20000)}
+        assert lru.count == len(lru.cache) <= 5000 and len(lru._table) < 1 << 15, 'rehash failed'
+        assert len(lru._arena) < 4 * 5000 * 108, f'arena was not compacted: {len(lru._arena)}'
+        assert all(k in expected and lru.peek(k) == bytes(100) for k in lru.cache), 'values failed'
+        assert lru.stats()['count'] == lru.count, 'stats failed'
+    except Exception as error:
+        LOG.exception(f'CompactLRU Test Failed: {error}')
+        raise
+
+    LOG.info('CompactLRU Test completed successfully.')
+    return True
@@ -17,23 +17,72 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
-import aiosqlite
+import asyncio
+import copy
+import itertools
+import logging
+import operator
+import sqlite3
+import time
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, Callable
 
-from lib.utilities import setup_logging, load_yaml
-CONFIGS = load_yaml('configs/config.yaml')['Application']
-DB_CONFIGS = load_yaml('configs/config.yaml')['DataBase']
+from lib.utilities import CWD, Configs, resolve_configs
+from lib.storage import BULK_BATCH, CHUNK_SIZE, StorageBackend, iter_chunks, iter_rows, write_dump
 
-logging = setup_logging(path = CONFIGS['loggingConfigPath'])
-LOG = logging.getLogger(DB_CONFIGS['logger'])
-LOG.setLevel(CONFIGS['logging_level'])
+LOG = logging.getLogger('DataBase')
 
 Node = namedtuple('Node', ['node_id', 'node'])
-CWD = CONFIGS['CWD']
 
+# Host parameters per statement, below the SQLite default limit of 999 in 
+# older builds.
+MAX_PARAMETERS = 900
 
-class AsyncDataBase:
+# Page cache of a bulk load in KiB, and the pragmas relaxed for its duration
+BULK_CACHE_SIZE = 65536
+BULK_PRAGMAS = {'synchronous': 'OFF', 'cache_size': -BULK_CACHE_SIZE}
+
+# Comparison operators of query conditions, as SQL and as Python functions
+OPERATORS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>=', 'in': 'IN'}
+COMPARE = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, 
+    '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+# Storage profiles, selected by the "profile" setting of DataBase. The pragmas 
+# are set in order on every connection, page_size before journal_mode since a 
+# WAL database can't change its page size, and only takes effect on a new file. 
+# without_rowid creates the node table as a WITHOUT ROWID table clustered on 
+# node_id. "default" leaves the SQLite defaults. See python -m lib.benchmarks 
+# profiles.
+PROFILES = {
+    'default': {'pragmas': {}, 'without_rowid': False},
+    'durable': {
+        'pragmas': {'journal_mode': 'WAL', 'synchronous': 'FULL'}, 
+        'without_rowid': False},
+    'balanced': {
+        'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -16384, 'mmap_size': 1 << 28}, 
+        'without_rowid': False},
+    'throughput': {
+        'pragmas': {'page_size': 8192, 'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -65536, 
+                    'temp_store': 'MEMORY', 'wal_autocheckpoint': 10000}, 
+        'without_rowid': True},
+    'read-mostly': {
+        'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'mmap_size': 1 << 30}, 
+        'without_rowid': True},
+}
+
+# Online backups copy BACKUP_PAGES pages per step with a pause of BACKUP_SLEEP 
+# seconds between steps. After BACKUP_RESTARTS restarts, caused by commits of 
+# other connections, the file is copied again in one step. See backup().
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+BACKUP_RESTARTS = 3
+
+
+class AsyncDataBase(StorageBackend):
     '''The code is a Python class named AsyncDataBase that provides asynchronous 
     interaction with a SQLite database. This class is designed to be used 
     asynchronously, as indicated by the async keyword in many of its methods.
@@ -43,25 +92,79 @@ class AsyncDataBase:
     table, retrieving all keys from the table, deleting a node from the table, and 
     closing the connection to the database.
     '''
-    sqliteConnection: aiosqlite.Connection
+    sqliteConnection: sqlite3.Connection
 
-    def __init__(self, file_name: str, table_name: str, database_path: str = CWD + 'database/') -> None:
+    def __init__(self, file_name: str, table_name: str, database_path: str | None = None, configs: Configs | dict | None = None) -> None:
         '''This is the constructor method. It initializes the instance with a file name, 
-        a table name, and a database path.'''
+        a table name, a database path and a configuration, either a Configs object 
+        or the "DataBase" section as a dict. The database path defaults to the 
+        configured database_path, relative to CWD.'''
+        self.configs, _ = resolve_configs(configs, 'DataBase')
+        if database_path is None:
+            database_path = CWD + self.configs.get('database_path', 'database/')
+
         self.file_name = file_name
         self.table_name = table_name
         self.database_path = Path(f'{database_path}{file_name}.db')
         self.Node = Node
 
+        # Set on the databases returned by table(), which borrow the connection
+        self.shared = False
+
+        # Writes are recorded in the change log under this id when it is set, 
+        # see changes()
+        self.origin = None
+        self.log_retention = self.configs.get('log_retention', 100000)
+        self._data_version = None
+
+        # Set before create for tables keyed by integers, see create()
+        self.integer_keys = False
+
+        # Set before create, the extractors of the indexed fields by name and 
+        # the function that decodes a node for them, see create() and query()
+        self.indexes = {}
+        self.index_decoder = None
+
+        # Pairs written per transaction by bulk_load
+        self.bulk_batch = self.configs.get('bulk_batch', BULK_BATCH)
+
+        # The pragmas of the profile, updated by the pragmas setting, are set on 
+        # open_connection. create reads back whether the table has a rowid.
+        self.profile = self.configs.get('profile', 'default')
+        try:
+            profile = PROFILES[self.profile]
+        except KeyError:
+            raise ValueError(f'unknown storage profile "{self.profile}", expected one of {list(PROFILES)}') from None
+        self.pragmas = {**profile['pragmas'], **(self.configs.get('pragmas') or {})}
+        self.without_rowid = profile['without_rowid']
+
+        # The step size, pause and restart limit of online backups
+        self.backup_pages = self.configs.get('backup_pages', BACKUP_PAGES)
+        self.backup_sleep = self.configs.get('backup_sleep', BACKUP_SLEEP)
+        self.backup_restarts = self.configs.get('backup_restarts', BACKUP_RESTARTS)
+
+    def table(self, table_name: str) -> 'AsyncDataBase':
+        '''This method returns a database for another table in the same file that 
+        shares this open connection and its thread. Its statements can join one 
+        transaction, and closing it leaves the connection open for its owner.'''
+        db = copy.copy(self)
+        db.table_name = table_name
+        db.shared = True
+        return db
+
     async def open_connection(self) -> None:
-        '''This method opens a connection to the SQLite database. It also sets the 
-        row factory to aiosqlite.Row which allows you to access rows by their column 
-        names.'''
+        '''This method opens a connection to the SQLite database on a thread of 
+        its own. It also sets the row factory to sqlite3.Row which allows you to 
+        access rows by their column names, and the pragmas of the storage profile.'''
         try:
-            self.sqliteConnection = await aiosqlite.connect(self.database_path)
-            self.sqliteConnection.row_factory = aiosqlite.Row
-            self.cursor = await self.sqliteConnection.cursor()
-        except aiosqlite.Error as error:
+            self.database_path.parent.mkdir(parents=True, exist_ok=True)
+
+            # The connection is created, used and closed on the single thread 
+            # of this executor only, see run()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'DataBase-{self.file_name}')
+            self.sqliteConnection = await asyncio.get_running_loop().run_in_executor(self._executor, self._connect)
+            await self.run(self._set_pragmas)
+        except sqlite3.Error as error:
             LOG.exception(f'open_connection: {error}')
             raise
         except Exception as error:
@@ -70,16 +173,45 @@ class AsyncDataBase:
         else:
             LOG.info(f'Connection to "{self.file_name}" established.')
     
+    async def run(self, fn: Callable, *args) -> Any:
+        '''This method runs fn(connection, *args) against the sqlite3 connection 
+        on the connection thread and returns its result. A compound unit of 
+        work (several statements, fetches and the commit) therefore costs a 
+        single hop to the connection thread and back through the event loop, 
+        instead of one hop per statement. Units of work run one at a time, in 
+        the order they were called.'''
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, self.sqliteConnection, *args)
+
+    async def execute_batch(self, statements: list, commit: bool = True) -> list:
+        '''This method runs a list of statements in one hop to the connection 
+        thread. Each statement is a SQL string or a (sql, parameters) pair. 
+        Returns the fetched rows of each statement.'''
+        try:
+            results = await self.run(self._execute_batch, statements, commit)
+        except Exception as error:
+            LOG.exception(f'execute_batch: {error}')
+            raise
+        else:
+            LOG.debug(f'Batch successful, count={len(statements)}, table_name={self.table_name}')
+            return results
+
     async def create(self) -> None:
         '''This method creates a new table in the database if it doesn't already 
-        exist. The table has two columns: "node_id" (text) and "node" (blob).'''
-        try:
-            await self.cursor.execute(
-                f'''CREATE TABLE IF NOT EXISTS {self.table_name} (
-                "node_id" text PRIMARY KEY,
-                "node" blob)''')
-            await self.sqliteConnection.commit()
-        except aiosqlite.Error as error:
+        exist. The table has two columns: "node_id" (text) and "node" (blob). A 
+        companion table "<table_name>_hot" stores the hot key list for warm starts, 
+        and "<table_name>_log" the change log. With integer_keys set, node_id is an 
+        INTEGER PRIMARY KEY, an alias of the rowid, so the table is keyed by the 
+        rowid B-tree itself instead of a separate text index. Otherwise a profile 
+        with without_rowid creates a WITHOUT ROWID table, stored in node_id order 
+        in the primary key B-tree. An existing table keeps its layout, and with the 
+        other key type raises a ValueError.
+        
+        Each of the indexes gets a column "ix_<name>" with an index on it. The 
+        columns missing from an existing table are added and filled from the 
+        stored nodes.'''
+        try:
+            await self.run(self._create)
+        except sqlite3.Error as error:
             LOG.exception(f'create: {error}')
             raise
         except Exception as error:
@@ -89,26 +221,15 @@ class AsyncDataBase:
             LOG.info(f'Table "{self.table_name}" successfully created.')
             return None
 
-    async def write(self, values: tuple | dict) -> None:
+    async def write(self, values: tuple | dict, hot_keys: list | None = None, deletes: list | None = None) -> None:
         '''This method writes values to the database. The values can be a tuple 
         or list when inserting single key-value pairs, and a dict when inserting 
-        multiple key-value pairs.'''
+        multiple key-value pairs. If hot_keys is given, the stored hot key list is 
+        replaced in the same transaction, and the node_ids in deletes are 
+        deleted in it.'''
         try:
-            if isinstance(values, (tuple, list)):
-                await self.cursor.execute(
-                    f"INSERT OR REPLACE INTO {self.table_name} VALUES(?, ?)", 
-                    list(values))
-            
-            elif isinstance(values, dict):
-                await self.cursor.executemany(
-                    f"INSERT OR REPLACE INTO {self.table_name} VALUES(?, ?)", 
-                    self._value_string(values))
-
-            else:
-                raise TypeError(f'values must be of type list, tuple or dict. type={type(values)}')
-
-            await self.sqliteConnection.commit()
-        except aiosqlite.Error as error:
+            await self.run(self._write, values, hot_keys, deletes)
+        except sqlite3.Error as error:
             LOG.exception(f'write: {error}')
             raise
         except Exception as error:
@@ -119,36 +240,13 @@ class AsyncDataBase:
             
     async def read(self, node_id: str | list) -> Node | list:
         '''This method reads values from the database using a node_id. The node_id 
-        can be a string, bytes, list, or tuple.'''
-        try:
-            if isinstance(node_id, (str, bytes)):
-                await self.cursor.execute(
-                    f"SELECT * FROM {self.table_name} WHERE node_id=?", 
-                    list([node_id]))
-                row = await self.cursor.fetchall()
-                results = self.Node(*row[0])
-                
-            elif isinstance(node_id, (list, tuple)):
-                await self.cursor.execute(
-                    f"SELECT * FROM {self.table_name} WHERE node_id IN ({', '.join('?' for _ in node_id)})", 
-                    list(node_id))
-                row = await self.cursor.fetchall()
-                results = [self.Node(*x) for x in row] 
-                
-            else:
-                raise TypeError(f'values must be of type str, bytes, list or tuple. type={type(node_id)}')
-
-            await self.sqliteConnection.commit()
-        except aiosqlite.Error as error:
+        can be a string, bytes, list, or tuple. A single node_id returns a Node, 
+        or None if it is not in the database, a list returns a list of Nodes.'''
+        try:
+            results = await self.run(self._read, node_id)
+        except sqlite3.Error as error:
             LOG.exception(f'read: {error}')
             raise
-        except IndexError as error:
-            if not row:
-                LOG.debug(f'Read returned NONE, node_id={node_id}, table_name={self.table_name}')
-                return None
-            else:
-                LOG.exception(f'read: {error}')
-                raise
         except Exception as error:
             LOG.exception(f'read: {error}')
             raise
@@ -159,11 +257,8 @@ class AsyncDataBase:
     async def node_keys(self) -> list:
         '''This method retrieves all the node_ids from the database.'''
         try:
-            await self.cursor.execute(f"SELECT node_id FROM {self.table_name}")
-            row = await self.cursor.fetchall()
-            results = [x[0] for x in row]
-            await self.sqliteConnection.commit()
-        except aiosqlite.Error as error:
+            results = await self.run(self._node_keys)
+        except sqlite3.Error as error:
             LOG.exception(f'node_keys: {error}')
             raise
         except Exception as error:
@@ -173,14 +268,13 @@ class AsyncDataBase:
             LOG.debug(f'Node keys read successful, table_name={self.table_name}')
             return results
 
-    async def delete_node(self, node_id: str) -> None:
-        '''This method deletes a node from the database using a node_id.'''
+    async def delete_node(self, node_id: str | list) -> None:
+        '''This method deletes a node from the database using a node_id. A list 
+        of node_ids is deleted in batched DELETE ... IN statements and one 
+        commit.'''
         try:
-            await self.cursor.execute(
-                f"DELETE FROM {self.table_name} WHERE node_id=?", 
-                list([node_id]))
-            await self.sqliteConnection.commit()
-        except aiosqlite.Error as error:
+            await self.run(self._delete_node, node_id)
+        except sqlite3.Error as error:
             LOG.exception(f'delete_node: {error}')
             raise
         except Exception as error:
@@ -189,12 +283,240 @@ class AsyncDataBase:
         else:
             LOG.debug(f'Delete node successful, node_id={node_id}, table_name={self.table_name}')
 
+    async def read_range(self, node_id: str | int, offset: int = 0, size: int = -1) -> bytes | None:
+        '''This method reads size bytes of the node of a node_id from offset, to 
+        the end if size is negative, with SQLite incremental blob I/O, so the 
+        rest of the node is not loaded. Returns None if the node_id is not in 
+        the database.'''
+        try:
+            results = await self.run(self._read_range, node_id, offset, size)
+        except sqlite3.Error as error:
+            LOG.exception(f'read_range: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'read_range: {error}')
+            raise
+        else:
+            LOG.debug(f'Read range successful, node_id={node_id}, offset={offset}, size={size}, table_name={self.table_name}')
+            return results
+
+    async def blob_size(self, node_id: str | int) -> int | None:
+        '''This method returns the size in bytes of the node of a node_id, or 
+        None if the node_id is not in the database.'''
+        try:
+            results = await self.run(self._blob_size, node_id)
+        except sqlite3.Error as error:
+            LOG.exception(f'blob_size: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'blob_size: {error}')
+            raise
+        else:
+            return results
+
+    async def write_stream(self, node_id: str | int, source: Any, size: int, chunk_size: int = CHUNK_SIZE) -> None:
+        '''This method writes a node of size bytes from a binary file or an 
+        iterable of bytes chunks. A zeroblob of size bytes is inserted and the 
+        chunks are written into it with incremental blob I/O, in one 
+        transaction, so the node is never held in memory whole. The source is 
+        consumed on the connection thread. A stream of another size is rolled 
+        back with a ValueError.'''
+        try:
+            await self.run(self._write_stream, node_id, source, size, chunk_size)
+        except sqlite3.Error as error:
+            LOG.exception(f'write_stream: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'write_stream: {error}')
+            raise
+        else:
+            LOG.debug(f'Write stream successful, node_id={node_id}, size={size}, table_name={self.table_name}')
+
+    async def update(self, node_ids: str | int | list, fn: Callable) -> dict:
+        '''This method applies fn(node_id, node) to the stored node of a node_id, 
+        or a list of node_ids, None if it is not stored, and writes the nodes fn 
+        changes, in one IMMEDIATE transaction on the connection thread, so no 
+        other connection writes between the reads and the writes. fn runs on the 
+        connection thread and returns the node it was given to leave it 
+        unchanged. An error in fn rolls the transaction back. Returns the 
+        written nodes.'''
+        try:
+            written = await self.run(self._update, node_ids, fn)
+        except sqlite3.Error as error:
+            LOG.exception(f'update: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'update: {error}')
+            raise
+        else:
+            LOG.debug(f'Update successful, count={len(written)}, table_name={self.table_name}')
+            return written
+
+    async def query(self, conditions: list, keys_only: bool = False) -> list:
+        '''This method returns the Nodes whose indexed fields meet all of the 
+        conditions, (name, op, value) tuples where op is one of ==, !=, <, <=, 
+        >, >= and in, see where. Only the matching rows are read. With 
+        keys_only, returns their node_ids.'''
+        try:
+            results = await self.run(self._query, conditions, keys_only)
+        except sqlite3.Error as error:
+            LOG.exception(f'query: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'query: {error}')
+            raise
+        else:
+            LOG.debug(f'Query successful, count={len(results)}, table_name={self.table_name}')
+            return results
+
+    def index_fields(self, node: Any) -> tuple:
+        '''This method returns the indexed fields of a node, in the order of 
+        indexes. A node index_decoder can't decode, like a streamed value, has 
+        None for every field.'''
+        try:
+            value = node if self.index_decoder is None else self.index_decoder(node)
+        except Exception:
+            return (None,) * len(self.indexes)
+        return tuple(fn(value) for fn in self.indexes.values())
+
+    def where(self, conditions: list) -> tuple:
+        '''This method returns the SQL WHERE clause and parameters of query 
+        conditions. A value of None compares with IS NULL and IS NOT NULL, 
+        otherwise a NULL field matches no condition, as in SQL.'''
+        clauses, params = [], []
+        for name, op, value in conditions:
+            if name not in self.indexes:
+                raise ValueError(f'"{name}" is not an index of table "{self.table_name}", indexes={list(self.indexes)}')
+            if op not in OPERATORS:
+                raise ValueError(f'unknown operator "{op}", expected one of {list(OPERATORS)}')
+            column = f'"ix_{name}"'
+            if op == 'in':
+                values = list(value)
+                clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                params.extend(values)
+            elif value is None and op in ('==', '!='):
+                clauses.append(f"{column} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                clauses.append(f'{column} {OPERATORS[op]} ?')
+                params.append(value)
+        return ' AND '.join(clauses) or '1', params
+
+    async def bulk_load(self, source: Any, batch_size: int | None = None) -> int:
+        '''This method writes the (node_id, node) pairs of a dict, an iterable or 
+        a dump file written by export, see lib.storage.iter_rows, and returns the 
+        number of pairs. The pairs are sorted by node_id and inserted batch_size 
+        (bulk_batch) at a time, one transaction per batch, with synchronous off 
+        and a larger page cache until the load ends. The source is consumed on 
+        the connection thread. A failed batch is rolled back, the batches before 
+        it stay written.'''
+        try:
+            count = await self.run(self._bulk_load, source, batch_size or self.bulk_batch)
+        except sqlite3.Error as error:
+            LOG.exception(f'bulk_load: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'bulk_load: {error}')
+            raise
+        else:
+            LOG.info(f'Bulk load successful, count={count}, table_name={self.table_name}')
+            return count
+
+    async def export(self, dest: Any, batch_size: int | None = None) -> int:
+        '''This method writes the table to a dump file, a path or a binary file, 
+        in node_id order, see lib.storage.write_dump, and returns the number of 
+        nodes. The rows are streamed from one query, a consistent snapshot of 
+        the table, on the connection thread.'''
+        try:
+            count = await self.run(self._export, dest)
+        except sqlite3.Error as error:
+            LOG.exception(f'export: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'export: {error}')
+            raise
+        else:
+            LOG.info(f'Export successful, count={count}, table_name={self.table_name}')
+            return count
+
+    async def backup(self, dest: str | Path, pages: int | None = None, sleep: float | None = None) -> dict:
+        '''This method copies the database file to dest with the SQLite online 
+        backup API while the connection stays in use. The copy runs on a worker 
+        thread with a connection of its own, pages pages per step, backup_pages 
+        by default and -1 for one step, with a pause of sleep seconds, 
+        backup_sleep by default, between steps. This bounds the rate of the 
+        copy, and writers wait for one step at most, not at all in WAL mode. A 
+        commit of another connection, this one included, restarts the copy, 
+        and after backup_restarts restarts the file is copied again in one 
+        step. Every table of the file is copied, with the committed writes 
+        only. Returns the pages, steps, restarts and seconds of the copy.'''
+        try:
+            stats = await asyncio.to_thread(self._backup_file, dest, pages, sleep)
+        except sqlite3.Error as error:
+            LOG.exception(f'backup: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'backup: {error}')
+            raise
+        else:
+            LOG.info(f'Backup successful, dest={dest}, pages={stats["pages"]}, restarts={stats["restarts"]}')
+            return stats
+
+    async def changes(self, since: int | None) -> tuple:
+        '''This method returns the node_ids changed by other connections since the 
+        change log sequence number since, as a (last sequence number, node_ids) 
+        pair. The node_ids are None if the log was trimmed past since, in which 
+        case every key may have changed. since=None returns the current sequence 
+        number and no node_ids. The log is only read when PRAGMA data_version 
+        shows that another connection committed since the last call.'''
+        try:
+            results = await self.run(self._changes, since)
+        except sqlite3.Error as error:
+            LOG.exception(f'changes: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'changes: {error}')
+            raise
+        else:
+            return results
+
+    async def write_hot_keys(self, node_ids: list) -> None:
+        '''This method replaces the stored hot key list. The node_ids should be 
+        ordered from the least to the most recently used.'''
+        try:
+            await self.run(self._write_hot_keys, node_ids)
+        except sqlite3.Error as error:
+            LOG.exception(f'write_hot_keys: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'write_hot_keys: {error}')
+            raise
+        else:
+            LOG.debug(f'Hot keys write successful, count={len(node_ids)}, table_name={self.table_name}')
+
+    async def read_hot_keys(self) -> list:
+        '''This method retrieves the stored hot key list, ordered from the least 
+        to the most recently used.'''
+        try:
+            results = await self.run(self._read_hot_keys)
+        except sqlite3.Error as error:
+            LOG.exception(f'read_hot_keys: {error}')
+            raise
+        except Exception as error:
+            LOG.exception(f'read_hot_keys: {error}')
+            raise
+        else:
+            LOG.debug(f'Hot keys read successful, count={len(results)}, table_name={self.table_name}')
+            return results
+
     async def close(self) -> None:
-        '''This method closes the cursor and the connection to the database.'''
+        '''This method closes the cursor and the connection to the database. A 
+        database returned by table() leaves the shared connection open.'''
+        if self.shared:
+            return
         try:
-            await self.cursor.close()
-            await self.sqliteConnection.close()
-        except aiosqlite.Error as error:
+            await self.run(sqlite3.Connection.close)
+            self._executor.shutdown()
+        except sqlite3.Error as error:
             LOG.exception(f'close: {error}')
             raise
         except Exception as error:
@@ -203,16 +525,530 @@ class AsyncDataBase:
         else:
             LOG.info(f'Connection closed, table_name={self.table_name}')
 
+    # Units of work. These run on the thread that owns the sqlite3 connection, 
+    # see run(), and are shared with SyncDataBase.
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute_batch(self, conn: sqlite3.Connection, statements: list, commit: bool) -> list:
+        results = []
+        try:
+            for statement in statements:
+                if isinstance(statement, str):
+                    statement = (statement, ())
+                results.append(conn.execute(*statement).fetchall())
+        except Exception:
+            if commit:
+                conn.rollback()
+            raise
+        if commit:
+            conn.commit()
+        return results
+
+    def _set_pragmas(self, conn: sqlite3.Connection) -> None:
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}").fetchall()
+
+    def _create(self, conn: sqlite3.Connection) -> None:
+        key_type = 'integer' if self.integer_keys else 'text'
+        for name in self.indexes:
+            if not name.isidentifier():
+                raise ValueError(f'index names must be identifiers. name={name!r}')
+        # An INTEGER PRIMARY KEY is already the rowid, the clustered key
+        options = ' WITHOUT ROWID' if self.without_rowid and not self.integer_keys else ''
+        index_columns = ''.join(f',\n            "ix_{name}"' for name in self.indexes)
+        conn.execute(
+            f'''CREATE TABLE IF NOT EXISTS {self.table_name} (
+            "node_id" {key_type} PRIMARY KEY,
+            "node" blob{index_columns}){options}''')
+        conn.execute(
+            f'''CREATE TABLE IF NOT EXISTS {self.table_name}_hot (
+            "rank" integer PRIMARY KEY,
+            "node_id" {key_type})''')
+        conn.execute(
+            f'''CREATE TABLE IF NOT EXISTS {self.table_name}_log (
+            "seq" integer PRIMARY KEY AUTOINCREMENT,
+            "node_id" {key_type},
+            "origin" text)''')
+        conn.commit()
+
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", [self.table_name]).fetchone()[0]
+        self.without_rowid = sql.upper().rstrip().endswith('WITHOUT ROWID')
+
+        columns = {row[1]: row[2].lower() for row in conn.execute(f"PRAGMA table_info({self.table_name})")}
+        if columns['node_id'] != key_type:
+            raise ValueError(f'table "{self.table_name}" has {columns["node_id"]} keys, integer_keys={self.integer_keys}')
+
+        added = [name for name in self.indexes if f'ix_{name}' not in columns]
+        for name in added:
+            conn.execute(f'ALTER TABLE {self.table_name} ADD COLUMN "ix_{name}"')
+        if added:
+            self._reindex(conn)
+        for name in self.indexes:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.table_name}_ix_{name}" ON {self.table_name} ("ix_{name}")')
+        conn.commit()
+
+    def _reindex(self, conn: sqlite3.Connection) -> None:
+        node_ids = self._node_keys(conn)
+        assignments = ', '.join(f'"ix_{name}"=?' for name in self.indexes)
+        for i in range(0, len(node_ids), MAX_PARAMETERS):
+            conn.executemany(
+                f"UPDATE {self.table_name} SET {assignments} WHERE node_id=?", 
+                [(*self.index_fields(node), node_id) for node_id, node in self._read(conn, node_ids[i:i + MAX_PARAMETERS])])
+
+    def _write(self, conn: sqlite3.Connection, values: tuple | dict, hot_keys: list | None = None, deletes: list | None = None, commit: bool = True) -> None:
+        # With commit unset the caller owns the transaction and rolls it back
+        try:
+            if isinstance(values, (tuple, list)):
+                conn.execute(self._insert_sql(), self._row(*values))
+                self._log(conn, [values[0]])
+
+            elif isinstance(values, dict):
+                conn.executemany(self._insert_sql(), self._value_string(values))
+                self._log(conn, values)
+
+            else:
+                raise TypeError(f'values must be of type list, tuple or dict. type={type(values)}')
+
+            if deletes:
+                self._delete_node(conn, deletes, commit=False)
+
+            if hot_keys is not None:
+                self._write_hot_keys(conn, hot_keys, commit=False)
+        except Exception:
+            if commit:
+                conn.rollback()
+            raise
+
+        if commit:
+            conn.commit()
+
+    def _read(self, conn: sqlite3.Connection, node_id: str | list) -> Node | list:
+        if isinstance(node_id, (str, bytes, int)):
+            row = conn.execute(
+                f"SELECT node_id, node FROM {self.table_name} WHERE node_id=?", 
+                [node_id]).fetchone()
+            return None if row is None else self.Node(*row)
+            
+        elif isinstance(node_id, (list, tuple)):
+            results = []
+            # Stay under the SQLite limit on host parameters per statement
+            for i in range(0, len(node_id), MAX_PARAMETERS):
+                chunk = list(node_id[i:i + MAX_PARAMETERS])
+                rows = conn.execute(
+                    f"SELECT node_id, node FROM {self.table_name} WHERE node_id IN ({', '.join('?' for _ in chunk)})", 
+                    chunk).fetchall()
+                results.extend(self.Node(*x) for x in rows)
+            return results
+            
+        else:
+            raise TypeError(f'values must be of type str, bytes, int, list or tuple. type={type(node_id)}')
+
+    def _insert_sql(self) -> str:
+        columns = ''.join(f', "ix_{name}"' for name in self.indexes)
+        params = ', ?' * len(self.indexes)
+        return f"INSERT OR REPLACE INTO {self.table_name} (node_id, node{columns}) VALUES(?, ?{params})"
+
+    def _row(self, node_id: str | int, node: Any) -> tuple:
+        if not self.indexes:
+            return (node_id, node)
+        return (node_id, node, *self.index_fields(node))
+
+    def _rowid(self, conn: sqlite3.Connection, node_id: str | int) -> int | None:
+        row = conn.execute(f"SELECT rowid FROM {self.table_name} WHERE node_id=?", [node_id]).fetchone()
+        return None if row is None else row[0]
+
+    def _read_range(self, conn: sqlite3.Connection, node_id: str | int, offset: int, size: int) -> bytes | None:
+        if self.without_rowid:
+            # Blob I/O needs a rowid, substr reads the range in SQLite instead
+            length, args = (', ?', [size]) if size >= 0 else ('', [])
+            row = conn.execute(
+                f"SELECT substr(node, ?{length}) FROM {self.table_name} WHERE node_id=?", 
+                [offset + 1, *args, node_id]).fetchone()
+            return None if row is None else bytes(row[0])
+        rowid = self._rowid(conn, node_id)
+        if rowid is None:
+            return None
+        with conn.blobopen(self.table_name, 'node', rowid, readonly=True) as blob:
+            blob.seek(min(offset, len(blob)))
+            return blob.read(size)
+
+    def _blob_size(self, conn: sqlite3.Connection, node_id: str | int) -> int | None:
+        row = conn.execute(f"SELECT length(node) FROM {self.table_name} WHERE node_id=?", [node_id]).fetchone()
+        return None if row is None else row[0]
+
+    def _write_stream(self, conn: sqlite3.Connection, node_id: str | int, source: Any, size: int, chunk_size: int) -> None:
+        if self.without_rowid:
+            return self._write_joined(conn, node_id, source, size, chunk_size)
+        try:
+            # A streamed node is not decoded, so its indexed fields are NULL
+            conn.execute(f"INSERT OR REPLACE INTO {self.table_name} (node_id, node) VALUES(?, zeroblob(?))", [node_id, size])
+            with conn.blobopen(self.table_name, 'node', self._rowid(conn, node_id)) as blob:
+                for chunk in iter_chunks(source, chunk_size):
+                    if blob.tell() + len(chunk) > size:
+                        raise ValueError(f'stream is longer than {size} bytes')
+                    blob.write(chunk)
+                if blob.tell() != size:
+                    raise ValueError(f'stream has {blob.tell()} bytes, expected {size}')
+            self._log(conn, [node_id])
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _write_joined(self, conn: sqlite3.Connection, node_id: str | int, source: Any, size: int, chunk_size: int) -> None:
+        # Without a rowid there is no blob I/O, the chunks are joined in memory
+        node = bytearray()
+        for chunk in iter_chunks(source, chunk_size):
+            if len(node) + len(chunk) > size:
+                raise ValueError(f'stream is longer than {size} bytes')
+            node += chunk
+        if len(node) != size:
+            raise ValueError(f'stream has {len(node)} bytes, expected {size}')
+        conn.execute(f"INSERT OR REPLACE INTO {self.table_name} (node_id, node) VALUES(?, ?)", [node_id, bytes(node)])
+        self._log(conn, [node_id])
+        conn.commit()
+
+    def _update(self, conn: sqlite3.Connection, node_ids: str | int | list, fn: Callable) -> dict:
+        ids = node_ids if isinstance(node_ids, list) else [node_ids]
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = {blob.node_id: blob.node for blob in self._read(conn, ids)}
+            written = {}
+            for node_id in ids:
+                node = written.get(node_id, stored.get(node_id))
+                new = fn(node_id, node)
+                if new is not node:
+                    written[node_id] = new
+            if written:
+                self._write(conn, written, commit=False)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        return written
+
+    def _bulk_load(self, conn: sqlite3.Connection, source: Any, batch_size: int) -> int:
+        saved = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in BULK_PRAGMAS}
+        for name, value in BULK_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        count = 0
+        try:
+            rows = iter_rows(source)
+            while batch := list(itertools.islice(rows, batch_size)):
+                # Sorted keys fill the primary key B-tree in order. The sort is 
+                # stable, so the last of duplicate keys is written last and wins.
+                batch.sort(key=lambda row: row[0])
+                conn.executemany(self._insert_sql(), [self._row(*row) for row in batch] if self.indexes else batch)
+                self._log(conn, [row[0] for row in batch])
+                conn.commit()
+                count += len(batch)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            for name, value in saved.items():
+                conn.execute(f"PRAGMA {name}={value}")
+        return count
+
+    def _export(self, conn: sqlite3.Connection, dest: Any) -> int:
+        rows = conn.execute(f"SELECT node_id, node FROM {self.table_name} ORDER BY node_id")
+        return write_dump(dest, rows)
+
+    def _backup(self, conn: sqlite3.Connection, dest: str | Path, pages: int | None, sleep: float | None) -> dict:
+        pages = self.backup_pages if pages is None else pages
+        sleep = self.backup_sleep if sleep is None else sleep
+        stats = {'pages': 0, 'steps': 0, 'restarts': 0}
+        previous = None
+
+        # Called after each step. sqlite3 only sleeps when the source is busy, 
+        # so the pause between steps is taken here. Each step copies pages, so 
+        # the remaining pages only stay or grow after a step that restarted 
+        # the copy.
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal previous
+            stats['steps'] += 1
+            stats['pages'] = total
+            if status != sqlite3.SQLITE_OK:
+                return
+            if previous is not None and remaining >= previous:
+                stats['restarts'] += 1
+                if stats['restarts'] > self.backup_restarts:
+                    raise RuntimeError(f'backup restarted {stats["restarts"]} times')
+            previous = remaining
+            if sleep > 0:
+                time.sleep(sleep)
+
+        start = time.perf_counter()
+        Path(dest).parent.mkdir(parents=True, exist_ok=True)
+        target = sqlite3.connect(dest)
+        try:
+            try:
+                conn.backup(target, pages=pages, progress=progress, sleep=sleep)
+            except RuntimeError:
+                if stats['restarts'] <= self.backup_restarts:
+                    raise
+                previous = None
+                conn.backup(target, progress=progress, sleep=sleep)
+        finally:
+            target.close()
+        stats['seconds'] = time.perf_counter() - start
+        return stats
+
+    def _backup_file(self, dest: str | Path, pages: int | None, sleep: float | None) -> dict:
+        # Runs on a worker thread, which can't use the connection of the connection thread
+        conn = sqlite3.connect(self.database_path)
+        try:
+            return self._backup(conn, dest, pages, sleep)
+        finally:
+            conn.close()
+
+    def _query(self, conn: sqlite3.Connection, conditions: list, keys_only: bool) -> list:
+        clause, params = self.where(conditions)
+        columns = 'node_id' if keys_only else 'node_id, node'
+        rows = conn.execute(f"SELECT {columns} FROM {self.table_name} WHERE {clause}", params).fetchall()
+        return [row[0] for row in rows] if keys_only else [self.Node(*row) for row in rows]
+
+    def _node_keys(self, conn: sqlite3.Connection) -> list:
+        return [x[0] for x in conn.execute(f"SELECT node_id FROM {self.table_name}").fetchall()]
+
+    def _delete_node(self, conn: sqlite3.Connection, node_id: str | list, commit: bool = True) -> None:
+        try:
+            if isinstance(node_id, (list, tuple, set)):
+                node_id = list(node_id)
+                for i in range(0, len(node_id), MAX_PARAMETERS):
+                    chunk = node_id[i:i + MAX_PARAMETERS]
+                    conn.execute(
+                        f"DELETE FROM {self.table_name} WHERE node_id IN ({', '.join('?' for _ in chunk)})", 
+                        chunk)
+            else:
+                conn.execute(f"DELETE FROM {self.table_name} WHERE node_id=?", [node_id])
+                node_id = [node_id]
+            self._log(conn, node_id)
+        except Exception:
+            if commit:
+                conn.rollback()
+            raise
+        if commit:
+            conn.commit()
+
+    def _write_hot_keys(self, conn: sqlite3.Connection, node_ids: list, commit: bool = True) -> None:
+        try:
+            conn.execute(f"DELETE FROM {self.table_name}_hot")
+            conn.executemany(
+                f"INSERT INTO {self.table_name}_hot VALUES(?, ?)", 
+                list(enumerate(node_ids)))
+        except Exception:
+            if commit:
+                conn.rollback()
+            raise
+        if commit:
+            conn.commit()
+
+    def _read_hot_keys(self, conn: sqlite3.Connection) -> list:
+        return [x[0] for x in conn.execute(f"SELECT node_id FROM {self.table_name}_hot ORDER BY rank").fetchall()]
+
+    def _log(self, conn: sqlite3.Connection, node_ids) -> None:
+        '''Records changed node_ids in the change log, keeping the last 
+        log_retention entries. Nothing is recorded unless origin is set.'''
+        if self.origin is None or not node_ids:
+            return
+        conn.executemany(
+            f"INSERT INTO {self.table_name}_log (node_id, origin) VALUES(?, ?)", 
+            [(k, self.origin) for k in node_ids])
+        conn.execute(
+            f"DELETE FROM {self.table_name}_log WHERE seq <= (SELECT max(seq) FROM {self.table_name}_log) - ?", 
+            [self.log_retention])
+
+    def _changes(self, conn: sqlite3.Connection, since: int | None) -> tuple:
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if since is not None and version == self._data_version:
+            return since, []
+        self._data_version = version
+
+        first, last = conn.execute(f"SELECT min(seq), coalesce(max(seq), 0) FROM {self.table_name}_log").fetchone()
+        if since is None:
+            return last, []
+        if first is not None and first > since + 1:
+            return last, None
+
+        rows = conn.execute(
+            f"SELECT DISTINCT node_id FROM {self.table_name}_log WHERE seq > ? AND seq <= ? AND origin != ?", 
+            [since, last, self.origin]).fetchall()
+        return last, [x[0] for x in rows]
+
     def _value_string(self, values: dict) -> list:
         '''This is a helper method that converts a dictionary 
         into a list of tuples. It's used in the write method when 
         inserting multiple key-value pairs into the database.'''
         value_store = []
         for k, v in values.items():
-            value_store.append((k, v))
+            value_store.append(self._row(k, v))
         return value_store
 
 
+def matches(fields: dict, conditions: list) -> bool:
+    '''Checks indexed fields, a dict by name, against query conditions in 
+    Python, with the semantics of AsyncDataBase.where.'''
+    for name, op, value in conditions:
+        field = fields[name]
+        if op == 'in':
+            found = field is not None and field in value
+        elif value is None and op in ('==', '!='):
+            found = (field is None) == (op == '==')
+        elif field is None or value is None:
+            found = False
+        else:
+            try:
+                found = COMPARE[op](field, value)
+            except TypeError:
+                found = False
+        if not found:
+            return False
+    return True
+
+
+class SyncDataBase(AsyncDataBase):
+    '''The code is a Python class named SyncDataBase that provides the 
+    AsyncDataBase interface as plain synchronous methods on top of the standard 
+    library sqlite3 module. It runs the same units of work as AsyncDataBase, 
+    but on the calling thread, so there is no hop to a connection thread and no 
+    event loop round trip per call.
+    
+    This class is useful for single threaded, CPU bound users, where the 
+    overhead of awaiting the connection thread rivals the cost of SQLite itself.
+    '''
+    sqliteConnection: sqlite3.Connection
+
+    def open_connection(self) -> None:
+        '''This method opens a connection to the SQLite database. It also sets the 
+        row factory to sqlite3.Row which allows you to access rows by their column 
+        names, and the pragmas of the storage profile.'''
+        try:
+            self.database_path.parent.mkdir(parents=True, exist_ok=True)
+            self.sqliteConnection = sqlite3.connect(self.database_path)
+            self.sqliteConnection.row_factory = sqlite3.Row
+            self.cursor = self.sqliteConnection.cursor()
+            self._set_pragmas(self.sqliteConnection)
+        except sqlite3.Error as error:
+            LOG.exception(f'open_connection: {error}')
+            raise
+        else:
+            LOG.info(f'Connection to "{self.file_name}" established.')
+
+    def run(self, fn: Callable, *args) -> Any:
+        '''This method runs fn(connection, *args) against the sqlite3 connection.'''
+        return fn(self.sqliteConnection, *args)
+
+    def execute_batch(self, statements: list, commit: bool = True) -> list:
+        '''This method runs a list of statements, see AsyncDataBase.execute_batch.'''
+        return self._call('execute_batch', self._execute_batch, statements, commit)
+
+    def create(self) -> None:
+        '''This method creates the table and its companion hot key table if they 
+        don't already exist. See AsyncDataBase.create.'''
+        self._call('create', self._create)
+        LOG.info(f'Table "{self.table_name}" successfully created.')
+
+    def write(self, values: tuple | dict, hot_keys: list | None = None, deletes: list | None = None) -> None:
+        '''This method writes values to the database. See AsyncDataBase.write.'''
+        self._call('write', self._write, values, hot_keys, deletes)
+
+    def read(self, node_id: str | list) -> Node | list:
+        '''This method reads values from the database using a node_id. See 
+        AsyncDataBase.read.'''
+        return self._call('read', self._read, node_id)
+
+    def node_keys(self) -> list:
+        '''This method retrieves all the node_ids from the database.'''
+        return self._call('node_keys', self._node_keys)
+
+    def delete_node(self, node_id: str | list) -> None:
+        '''This method deletes a node, or a list of nodes, from the database. See 
+        AsyncDataBase.delete_node.'''
+        self._call('delete_node', self._delete_node, node_id)
+
+    def read_range(self, node_id: str | int, offset: int = 0, size: int = -1) -> bytes | None:
+        '''This method reads a byte range of a node with incremental blob I/O. 
+        See AsyncDataBase.read_range.'''
+        return self._call('read_range', self._read_range, node_id, offset, size)
+
+    def blob_size(self, node_id: str | int) -> int | None:
+        '''This method returns the size in bytes of a node.'''
+        return self._call('blob_size', self._blob_size, node_id)
+
+    def write_stream(self, node_id: str | int, source: Any, size: int, chunk_size: int = CHUNK_SIZE) -> None:
+        '''This method writes a node in chunks with incremental blob I/O. See 
+        AsyncDataBase.write_stream.'''
+        self._call('write_stream', self._write_stream, node_id, source, size, chunk_size)
+
+    def update(self, node_ids: str | int | list, fn: Callable) -> dict:
+        '''This method applies fn to stored nodes and writes the nodes it changes 
+        in one transaction. See AsyncDataBase.update.'''
+        return self._call('update', self._update, node_ids, fn)
+
+    def query(self, conditions: list, keys_only: bool = False) -> list:
+        '''This method returns the Nodes, or node_ids, whose indexed fields meet 
+        the conditions. See AsyncDataBase.query.'''
+        return self._call('query', self._query, conditions, keys_only)
+
+    def bulk_load(self, source: Any, batch_size: int | None = None) -> int:
+        '''This method writes (node_id, node) pairs in large sorted batches. See 
+        AsyncDataBase.bulk_load.'''
+        count = self._call('bulk_load', self._bulk_load, source, batch_size or self.bulk_batch)
+        LOG.info(f'Bulk load successful, count={count}, table_name={self.table_name}')
+        return count
+
+    def export(self, dest: Any, batch_size: int | None = None) -> int:
+        '''This method writes the table to a dump file. See AsyncDataBase.export.'''
+        count = self._call('export', self._export, dest)
+        LOG.info(f'Export successful, count={count}, table_name={self.table_name}')
+        return count
+
+    def backup(self, dest: str | Path, pages: int | None = None, sleep: float | None = None) -> dict:
+        '''This method copies the database file to dest with the SQLite online 
+        backup API, on this connection, so writes of this connection never 
+        restart it. See AsyncDataBase.backup.'''
+        stats = self._call('backup', self._backup, dest, pages, sleep)
+        LOG.info(f'Backup successful, dest={dest}, pages={stats["pages"]}, restarts={stats["restarts"]}')
+        return stats
+
+    def changes(self, since: int | None) -> tuple:
+        '''This method returns the node_ids changed by other connections. See 
+        AsyncDataBase.changes.'''
+        return self._call('changes', self._changes, since)
+
+    def write_hot_keys(self, node_ids: list) -> None:
+        '''This method replaces the stored hot key list. See 
+        AsyncDataBase.write_hot_keys.'''
+        self._call('write_hot_keys', self._write_hot_keys, node_ids)
+
+    def read_hot_keys(self) -> list:
+        '''This method retrieves the stored hot key list, ordered from the least 
+        to the most recently used.'''
+        return self._call('read_hot_keys', self._read_hot_keys)
+
+    def close(self) -> None:
+        '''This method closes the cursor and the connection to the database. A 
+        database returned by table() leaves the shared connection open.'''
+        if self.shared:
+            return
+        self._call('close', lambda conn: (self.cursor.close(), conn.close()))
+        LOG.info(f'Connection closed, table_name={self.table_name}')
+
+    def _call(self, name: str, fn: Callable, *args) -> Any:
+        '''Runs a unit of work, logging and re-raising any error under the name 
+        of the public method.'''
+        try:
+            return self.run(fn, *args)
+        except Exception as error:
+            LOG.exception(f'{name}: {error}')
+            raise
+
+
 # Tests
 async def _test_type_write(database: AsyncDataBase) -> None:
     try:
@@ -261,6 +1097,36 @@ async def test() -> bool:
             if node.node_id in data:
                 assert node.node == data[node.node_id][1], f'{node.node_id} read failed, {node.node}'
 
+        # Test a batch of statements in one hop
+        rows = await db.execute_batch([
+            (f"INSERT OR REPLACE INTO {db.table_name} VALUES(?, ?)", ['_batch', b'fgh']),
+            (f"SELECT node FROM {db.table_name} WHERE node_id=?", ['_batch']),
+            f"DELETE FROM {db.table_name} WHERE node_id='_batch'",
+        ])
+        assert rows[1][0][0] == b'fgh', f'execute_batch failed, {rows}'
+        assert await db.read('_batch') is None, 'execute_batch delete failed'
+
+        # Test that failed units of work are rolled back, not committed by the
+        # next write. Should log errors, this is expected
+        try:
+            await db.execute_batch([(f"INSERT INTO {db.table_name} VALUES(?, ?)", ['_batch', b'ijk']), "SELECT nothing"])
+        except sqlite3.OperationalError:
+            pass
+        ints = db.table('test_ints')
+        ints.integer_keys = True
+        await ints.create()
+        try:
+            await ints.write({1: b'a', 'x': b'b'})
+        except sqlite3.IntegrityError:
+            pass
+        await ints.write((2, b'c'))
+        assert await ints.node_keys() == [2], 'failed write was committed'
+        assert await db.read('_batch') is None, 'failed execute_batch was committed'
+
+        # Test hot keys
+        await db.write_hot_keys(['_list', '_tuple'])
+        assert await db.read_hot_keys() == ['_list', '_tuple'], 'hot keys read failed'
+
         # Test delete and node_keys
         await db.delete_node('_tuple')
         node_keys = await db.node_keys()
@@ -290,3 +1156,166 @@ async def test() -> bool:
         LOG.info('AsyncDataBase Test completed successfully.')
         return True
 
+
+def test_sync() -> bool:
+    db = SyncDataBase('zkp_test_sync_db', 'test_case')
+    try:
+        db.open_connection()
+        db.create()
+
+        db.write(('_tuple', b'123'))
+        db.write({'_dict0': b'789', '_dict1': b'0ab'})
+        assert db.read('_tuple').node == b'123', '_tuple read failed'
+        assert {n.node_id for n in db.read(['_dict0', '_dict1'])} == {'_dict0', '_dict1'}, 'multi read failed'
+        assert db.read('not_in_db') is None, 'read not_in_db failed'
+
+        db.delete_node('_tuple')
+        assert sorted(db.node_keys()) == ['_dict0', '_dict1'], 'delete or node_keys failed'
+
+        db.write({'_dict2': b'cde'}, deletes=['_dict0'])
+        db.delete_node(['_dict2', 'not_in_db'])
+        assert db.node_keys() == ['_dict1'], 'batched deletes failed'
+        db.write({'_dict0': b'789'})
+
+        db.write_hot_keys(['_dict1', '_dict0'])
+        assert db.read_hot_keys() == ['_dict1', '_dict0'], 'hot keys read failed'
+
+        # Incremental blob I/O
+        db.write_stream('_stream', (bytes([i]) * 100 for i in range(10)), 1000, chunk_size=100)
+        assert db.blob_size('_stream') == 1000, 'blob_size failed'
+        assert db.read_range('_stream', 150, 100) == bytes([1]) * 50 + bytes([2]) * 50, 'read_range failed'
+        assert db.read_range('_stream', 990) == bytes([9]) * 10, 'read_range to the end failed'
+        assert db.read_range('not_in_db') is None, 'read_range not_in_db failed'
+        try:
+            db.write_stream('_stream', [b'short'], 1000)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('short stream was written')
+        assert db.read_range('_stream', 0, 1) == bytes([0]), 'short stream was not rolled back'
+
+        # Bulk load and export to a dump, the last of duplicate keys wins
+        from io import BytesIO
+        pairs = [(f'_bulk{i % 500:03}', bytes([i % 256])) for i in range(999, -1, -1)]
+        assert db.bulk_load(iter(pairs), batch_size=300) == 1000, 'bulk_load count failed'
+        assert db.read('_bulk007').node == bytes([7]), 'bulk_load duplicate key failed'
+        assert db.execute_batch(['PRAGMA synchronous'])[0][0][0] == 2, 'bulk_load pragmas were not restored'
+        dump = BytesIO()
+        assert db.export(dump) == len(db.node_keys()), 'export count failed'
+        copy = db.table('test_copy')
+        copy.create()
+        dump.seek(0)
+        copy.bulk_load(dump)
+        assert copy.read(['_bulk123'])[0].node == bytes([123]) and len(copy.node_keys()) == len(db.node_keys()), 'dump load failed'
+        db.close()
+    except Exception as error:
+        LOG.exception(f'SyncDataBase Test Failed: {error}', exc_info=True)
+        raise
+    finally:
+        db.database_path.unlink()
+    LOG.info('SyncDataBase Test completed successfully.')
+    return True
+
+
+async def test_profiles() -> bool:
+    '''Opens a database under each storage profile and checks the pragmas, the 
+    table layout and the blob reads and writes, which fall back to substr and 
+    joined chunks on WITHOUT ROWID tables.'''
+    for name, profile in PROFILES.items():
+        db = AsyncDataBase('zkp_test_profile_db', 'test_case', configs={'profile': name})
+        try:
+            await db.open_connection()
+            await db.create()
+            assert db.without_rowid == profile['without_rowid'], f'{name}: table layout failed'
+            mode = profile['pragmas'].get('journal_mode', 'delete').lower()
+            assert (await db.execute_batch(['PRAGMA journal_mode']))[0][0][0] == mode, f'{name}: pragmas failed'
+
+            await db.write({'_a': b'123', '_b': b'456'})
+            await db.write_stream('_stream', (bytes([i]) * 100 for i in range(10)), 1000, chunk_size=100)
+            assert await db.read_range('_stream', 150, 100) == bytes([1]) * 50 + bytes([2]) * 50, f'{name}: read_range failed'
+            assert await db.read_range('_stream', 990) == bytes([9]) * 10, f'{name}: read_range to the end failed'
+            assert await db.read_range('_stream', 2000) == b'', f'{name}: read_range past the end failed'
+            assert await db.read_range('not_in_db') is None, f'{name}: read_range not_in_db failed'
+            assert await db.bulk_load([('_c', b'789')]) == 1, f'{name}: bulk_load failed'
+            assert sorted(await db.node_keys()) == ['_a', '_b', '_c', '_stream'], f'{name}: node_keys failed'
+            await db.close()
+            for suffix in ('-wal', '-shm'):
+                assert not Path(f'{db.database_path}{suffix}').exists(), f'{name}: {suffix} file left after close'
+        finally:
+            db.database_path.unlink()
+
+    # An existing table keeps its layout under another profile
+    db = SyncDataBase('zkp_test_profile_db', 'test_case')
+    try:
+        db.open_connection()
+        db.create()
+        db.close()
+        db = SyncDataBase('zkp_test_profile_db', 'test_case', configs={'profile': 'throughput', 'pragmas': {'cache_size': -1024}})
+        db.open_connection()
+        db.create()
+        assert not db.without_rowid, 'existing table layout failed'
+        assert db.execute_batch(['PRAGMA cache_size'])[0][0][0] == -1024, 'pragmas setting failed'
+        db.write_stream('_stream', [b'12345'], 5)
+        assert db.read_range('_stream', 1, 2) == b'23', 'blob I/O on an existing table failed'
+        db.close()
+    finally:
+        db.database_path.unlink()
+
+    try:
+        AsyncDataBase('zkp_test_profile_db', 'test_case', configs={'profile': 'fast'})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('unknown profile was accepted')
+    LOG.info('Storage profile test completed successfully.')
+    return True
+
+
+async def test_backup() -> bool:
+    '''Backs up a database while a task writes to it, and checks the copy, the 
+    restart limit and the synchronous backup.'''
+    db = AsyncDataBase('zkp_test_backup_db', 'test_case', configs={'backup_restarts': 0})
+    dest = db.database_path.with_name('zkp_test_backup_copy.db')
+    try:
+        await db.open_connection()
+        await db.create()
+        await db.bulk_load({f'_{i:03}': bytes(1000) for i in range(500)})
+
+        # An idle database is copied in steps of 4 pages
+        stats = await db.backup(dest, pages=4, sleep=0)
+        assert stats['restarts'] == 0 and stats['steps'] == -(-stats['pages'] // 4), f'paced backup failed: {stats}'
+        copy = SyncDataBase('zkp_test_backup_copy', 'test_case')
+        copy.open_connection()
+        assert len(copy.node_keys()) == 500 and copy.read('_499').node == bytes(1000), 'backup copy failed'
+        copy.close()
+
+        # Commits during the copy restart it, and past backup_restarts the file 
+        # is copied again in one step
+        backup = asyncio.create_task(db.backup(dest, pages=4, sleep=0.01))
+        written = 0
+        while not backup.done():
+            await db.write((f'_new{written}', b'1'))
+            written += 1
+            await asyncio.sleep(0.001)
+        stats = await backup
+        assert stats['restarts'] == 1, f'backup restarts failed: {stats}'
+        copy.open_connection()
+        assert 500 < len(copy.node_keys()) <= 500 + written, 'restarted backup copy failed'
+        copy.close()
+        await db.close()
+
+        # The synchronous backup runs on the connection of the database
+        db = SyncDataBase('zkp_test_backup_db', 'test_case')
+        db.open_connection()
+        db.delete_node('_000')
+        stats = db.backup(dest, pages=-1)
+        assert stats['steps'] == 1 and stats['restarts'] == 0, f'sync backup failed: {stats}'
+        copy.open_connection()
+        assert copy.read('_000') is None and copy.read('_001').node == bytes(1000), 'sync backup copy failed'
+        copy.close()
+        db.close()
+    finally:
+        db.database_path.unlink()
+        dest.unlink(missing_ok=True)
+    LOG.info('Backup test completed successfully.')
+    return True
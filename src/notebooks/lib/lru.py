@@ -16,16 +16,170 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
-from collections import deque
+import logging
+import sys
+from collections import OrderedDict, deque
 from typing import Any
+from zlib import crc32
 
-from lib.utilities import setup_logging, load_yaml
+from lib.utilities import Configs, get_configs, resolve_configs
 
-logging = setup_logging(path = 'configs/logging_config.yaml')
 LOG = logging.getLogger('LRU')
-LOG.setLevel(logging.DEBUG)
 
-CONFIGS = load_yaml('configs/config.yaml')['LRU']
+# Keys are sampled when the low 24 bits of their hash fall under the threshold.
+SHARDS_MODULUS = 1 << 24
+
+# Hash masks, and the rows, seeds and counter limit of the TinyLFU sketch
+MASK32 = (1 << 32) - 1
+MASK64 = (1 << 64) - 1
+SKETCH_DEPTH = 4
+SKETCH_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+SKETCH_MAX = 15
+
+# Byte translation table that halves every counter of a sketch
+HALVE = bytes(i >> 1 for i in range(256))
+
+# Floor of the per row cost of adaptive sync in seconds, for timers too coarse
+# to measure a sync
+MIN_ROW_SECONDS = 1e-9
+
+
+class FenwickTree:
+    '''This class is a Fenwick (binary indexed) tree of counts over positions 
+    0 to size - 1, which adds to a position and sums a prefix of positions in 
+    O(log size).'''
+
+    def __init__(self, size: int, ones: int = 0) -> None:
+        '''This is the constructor method. It initializes the tree with a count 
+        of 1 at positions 0 to ones - 1 and 0 elsewhere.'''
+        self.size = size
+        self.tree = [0] * (size + 1)
+        for i in range(1, ones + 1):
+            self.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, position: int, delta: int) -> None:
+        '''This method adds delta to the count at a position.'''
+        i = position + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, position: int) -> int:
+        '''This method returns the sum of the counts at positions 0 to position.'''
+        total = 0
+        i = position + 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class MissRatioCurve:
+    '''This class estimates the miss ratio curve (MRC) of an LRU cache online
+    using SHARDS-style spatial sampling. Only keys whose hash falls under a 
+    threshold are tracked, so the reuse distance histogram is built from a 
+    small, representative subset of the reference stream. Distances measured 
+    in the sample are scaled by 1 / sample_rate to estimate the distances of 
+    the full stream.
+
+    The number of tracked keys is bounded by max_samples. When the bound is 
+    exceeded the least recently used sampled key is forgotten, which makes the 
+    curve conservative for cache sizes larger than max_samples / sample_rate.
+
+    As in SHARDS, each sampled key keeps the time of its last reference, and a 
+    Fenwick tree marks the times that are the last reference of a key, so the 
+    reuse distance is the number of marks after the key's time, in O(log 
+    max_samples). When the clock reaches the end of the tree, the times of the 
+    tracked keys are renumbered from 0.'''
+
+    def __init__(self, sample_rate: float = 0.01, max_samples: int = 8192) -> None:
+        '''This is the constructor method. It initializes the sampler with a 
+        sampling rate and the maximum number of sampled keys to track.'''
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.threshold = int(SHARDS_MODULUS * sample_rate)
+        self.reset()
+
+    def reset(self) -> None:
+        '''This method clears the sampled keys and the distance histogram.'''
+        # Sampled keys and the time of their last reference, oldest first
+        self.stack = OrderedDict()
+        self.clock = 0
+        self.times = FenwickTree(2 * self.max_samples)
+        self.histogram = {}
+        self.references = 0
+        self.cold_misses = 0
+
+    def sampled(self, key: Any) -> bool:
+        '''This method returns True if the key belongs to the spatial sample.'''
+        if not isinstance(key, bytes):
+            key = str(key).encode()
+        return (crc32(key) & (SHARDS_MODULUS - 1)) < self.threshold
+
+    def record(self, key: Any) -> None:
+        '''This method records a reference to the key. If the key is sampled, 
+        its reuse distance (the number of distinct sampled keys referenced since 
+        its last reference) is added to the histogram.'''
+        if not self.sampled(key):
+            return
+
+        self.references += 1
+
+        if self.clock == self.times.size:
+            self._renumber()
+
+        last = self.stack.get(key)
+        if last is not None:
+            # The keys referenced since are the marks after the last reference
+            distance = len(self.stack) - self.times.prefix(last)
+            self.histogram[distance] = self.histogram.get(distance, 0) + 1
+            self.times.add(last, -1)
+            self.stack.move_to_end(key)
+        else:
+            self.cold_misses += 1
+            if len(self.stack) >= self.max_samples:
+                _, oldest = self.stack.popitem(last=False)
+                self.times.add(oldest, -1)
+
+        self.stack[key] = self.clock
+        self.times.add(self.clock, 1)
+        self.clock += 1
+
+    def _renumber(self) -> None:
+        '''Renumbers the times of the tracked keys 0 to len - 1, in order.'''
+        for i, key in enumerate(self.stack):
+            self.stack[key] = i
+        self.clock = len(self.stack)
+        self.times = FenwickTree(self.times.size, self.clock)
+
+    def hit_ratio(self, size: int) -> float:
+        '''This method returns the predicted hit ratio of an LRU cache holding 
+        "size" entries.'''
+        if not self.references:
+            return 0.0
+
+        # A reference hits when its scaled reuse distance is below the size
+        limit = size * self.sample_rate
+        hits = sum(cnt for d, cnt in self.histogram.items() if d < limit)
+        return hits / self.references
+
+    def curve(self, sizes: list) -> dict:
+        '''This method returns a dictionary of cache size to predicted hit ratio.'''
+        return {size: self.hit_ratio(size) for size in sizes}
+
+    def size_for(self, target: float) -> int | None:
+        '''This method returns the smallest cache size that is predicted to reach 
+        the target hit ratio, or None if the target can not be reached.'''
+        needed = target * self.references
+        hits = 0
+        for d in sorted(self.histogram):
+            hits += self.histogram[d]
+            if hits >= needed:
+                return int(d / self.sample_rate) + 1
+        return None
 
 
 class LRU:
@@ -39,12 +193,32 @@ class LRU:
     is full. It also provides methods to sync the cache with 
     a database.'''
 
-    def __init__(self, configs: dict = CONFIGS):
+    def __init__(self, configs: Configs | dict | None = None):
         '''This is the constructor method. It initializes the LRU cache with a 
-        given configuration.'''
+        given configuration, either a Configs object or the "LRU" section as a 
+        dict. The default configuration is loaded on first use.'''
+        configs, _ = resolve_configs(configs, 'LRU')
         self.__dict__.update(configs)
         self._create_empty_deck(maxlen=configs['maxlen'])
 
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self._last_miss = None
+        self._references = 0
+
+        # Adaptive eviction batch sizing. The cost model of a database write 
+        # is fitted as sync_cost[0] + sync_cost[1] * rows seconds.
+        self.sync_batch = max(1, int(self.maxlen * self.sync_fraction))
+        self.sync_cost = (0.0, 0.0)
+        self._sync_sums = [0.0] * 5
+
+        # Miss ratio curve estimation, disabled when the sample rate is 0
+        if self.mrc_sample_rate:
+            self.mrc = MissRatioCurve(self.mrc_sample_rate, self.mrc_max_samples)
+        else:
+            self.mrc = None
+
     def __setattr__(self, __name: str, __value: Any) -> None:
         '''This method is used to set the value of an attribute. If the attribute 
         being set is 'count', it checks if the deck is full and sets the 'deck_full' 
@@ -74,7 +248,7 @@ class LRU:
         '''This method removes an item from the cache and the deck, 
         and decrements the count.'''
         if key in self.cache:
-            self.cache.pop(key)
+            self.size_bytes -= self._sizeof(self.cache.pop(key))
             self.deck.remove(key)
             self.count -= 1
 
@@ -91,24 +265,37 @@ class LRU:
         '''This method retrieves an item from the cache. If the key is found, 
         it reorders the deck and returns the value. If the key is not found, 
         it raises a KeyError.'''
+        self._record(key)
+
         try:
             value = self.cache[key]
             # Reorder the deck
             self.deck.remove(key)
             self.deck.append(key)
         except KeyError:
+            self.misses += 1
+            self._last_miss = key
             raise
         except ValueError as error:
             # Exception occurs when key is not in the deck. CRITICAL ERROR
             LOG.critical(f'__getitem__, deck={self.deck}')
             raise
         else:
+            self.hits += 1
             return value
 
     def __setitem__(self, key: str, value: Any) -> None:  
         '''This method adds an item to the cache. If the key already exists, 
         it updates the value and reorders the deck. If the key does not exist, 
         it adds the key to the deck and increments the count.''' 
+        # A write that admits a key which just missed is the same reference
+        if key == self._last_miss:
+            self._last_miss = None
+        else:
+            self._record(key)
+
+        self.size_bytes += self._sizeof(value) - self._sizeof(self.cache.get(key))
+
         try:
             # Update the cache
             self.cache[key] = value
@@ -130,9 +317,25 @@ class LRU:
         self.deck = deque(maxlen=self.maxlen)
         self.cache = {}
         self.count = 0
+        self.size_bytes = 0
 
         LOG.info(f'cache initialized with deque of max size={self.maxlen}.')
 
+    def warm(self, key: str, value: Any) -> bool:
+        '''This method adds an item at the least recently used end of the deck 
+        without counting it as a reference. Items already cached are left as is, 
+        and nothing is added once the cache is one item short of full, so warming 
+        never displaces or syncs items written by the application. Returns True 
+        if the item was added.'''
+        if key in self.cache or self.count >= self.maxlen - 1:
+            return False
+
+        self.cache[key] = value
+        self.deck.appendleft(key)
+        self.size_bytes += self._sizeof(value)
+        self.count += 1
+        return True
+
     def get(self, key: str, default: Any = None) -> Any:
         '''This method retrieves an item from the cache. 
         If the key is not found, it returns a default value.'''
@@ -140,11 +343,28 @@ class LRU:
             return self[key]
         return default
     
+    def peek(self, key: str, default: Any = None) -> Any:
+        '''This method returns the cached value of a key, or a default value, 
+        without counting a reference or reordering the deck.'''
+        return self.cache.get(key, default)
+
+    def oldest(self) -> Any:
+        '''This method returns the least recently used key, the next to be 
+        evicted, or None if the cache is empty.'''
+        return self.deck[0] if self.deck else None
+
     def _split_deck(self) -> list:
         '''This method splits the deck into two lists, the oldest 
         and the newest keys. The oldest keys are returned, and the 
         newest keys are kept in the deck.'''
-        split = int(self.maxlen * self.sync_fraction)
+        # Evict down to the number of keys kept after a sync. After the deck 
+        # has been shrunk by resize() it may hold more than maxlen keys.
+        if self.adaptive_sync:
+            batch = min(self.sync_batch, self._sync_limit())
+        else:
+            batch = max(1, int(self.maxlen * self.sync_fraction))
+        keep = self.maxlen - batch
+        split = max(0, len(self.deck) - keep)
         
         # New keys to be kept in the deck
         old_keys = list(self.deck)[:split]
@@ -165,15 +385,467 @@ class LRU:
         # Split the deck and move the old keys to the sync_store
         for key in self._split_deck():
             sync_store[key] = self.cache.pop(key)
+            self.size_bytes -= self._sizeof(sync_store[key])
             self.count -= 1
 
         LOG.info(f'sync_store created with "{len(sync_store)}" keys.')
 
         return sync_store
 
+    def record_sync(self, rows: int, seconds: float) -> None:
+        '''This method records the latency of a database write of "rows" items. 
+        When adaptive_sync is enabled, it refits the write cost model and picks 
+        the largest eviction batch predicted to stall for at most target_stall 
+        seconds. The batch leaves at least one item in the cache, so a sync 
+        never evicts the item that triggered it.'''
+        if not self.adaptive_sync or rows <= 0:
+            return
+
+        # Exponentially decayed sums for a least squares fit of seconds ~ rows
+        decay = self.sync_decay
+        sums = self._sync_sums
+        for i, v in enumerate((1.0, rows, seconds, rows * rows, rows * seconds)):
+            sums[i] = sums[i] * decay + v
+        n, sx, sy, sxx, sxy = sums
+
+        denominator = n * sxx - sx * sx
+        if denominator > 1e-9 * n * sxx:
+            per_row = (n * sxy - sx * sy) / denominator
+            fixed = (sy - per_row * sx) / n
+        else:
+            # All observations at the same batch size, attribute the cost to rows
+            per_row, fixed = sy / sx, 0.0
+
+        if per_row <= 0:
+            per_row, fixed = sy / sx, 0.0
+        per_row = max(per_row, MIN_ROW_SECONDS)
+        fixed = max(0.0, fixed)
+        self.sync_cost = (fixed, per_row)
+
+        batch = int((self.target_stall - fixed) / per_row)
+        self.sync_batch = min(max(batch, self.min_sync_batch), self._sync_limit())
+
+        LOG.debug(f'record_sync: rows={rows}, seconds={seconds:.6f}, sync_batch={self.sync_batch}')
+
+    def _sync_limit(self) -> int:
+        '''Largest adaptive sync batch, one less than maxlen.'''
+        return max(1, self.maxlen - 1)
+
+    def resize(self, maxlen: int) -> None:
+        '''This method changes the maximum number of items in the cache without 
+        dropping any items. When the cache shrinks below its current count the 
+        deck_full flag is set, so the next write syncs the excess to the database.'''
+        maxlen = max(1, int(maxlen))
+        old_maxlen, self.maxlen = self.maxlen, maxlen
+
+        # Leave room for one append, the deque must never drop keys on its own
+        self.deck = deque(self.deck, maxlen=max(maxlen, len(self.deck) + 1))
+        self.count = self.count
+
+        LOG.info(f'cache resized from {old_maxlen} to {maxlen}.')
+
+    def hit_ratio_curve(self, sizes: list | None = None) -> dict:
+        '''This method returns the predicted hit ratio for a range of cache sizes. 
+        By default the sizes are fractions and multiples of the current maxlen.'''
+        if self.mrc is None:
+            return {}
+        if sizes is None:
+            sizes = [max(1, int(self.maxlen * f)) for f in (0.25, 0.5, 1, 2, 4, 8)]
+        return self.mrc.curve(sizes)
+
+    def stats(self) -> dict:
+        '''This method returns a dictionary of cache statistics.'''
+        lookups = self.hits + self.misses
+        return {
+            'maxlen': self.maxlen,
+            'count': self.count,
+            'size_bytes': self.size_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'sync_batch': self.sync_batch if self.adaptive_sync else max(1, int(self.maxlen * self.sync_fraction)),
+            'sync_cost': self.sync_cost,
+            'hit_ratio_curve': self.hit_ratio_curve(),
+        }
+
+    def _record(self, key: Any) -> None:
+        '''This method records a key reference with the miss ratio curve estimator 
+        and periodically resizes the cache when auto_resize is enabled.'''
+        if self.mrc is None:
+            return
+
+        self.mrc.record(key)
+        self._references += 1
+
+        if self.auto_resize and self._references % self.resize_interval == 0:
+            self._auto_resize()
+
+    def _auto_resize(self) -> None:
+        '''This method resizes the cache toward the smallest size predicted to 
+        reach target_hit_ratio, bounded by min_maxlen and by memory_budget.'''
+        if self.mrc.references < self.mrc_min_samples:
+            return
+
+        # Largest size that fits the memory budget, using the mean entry size
+        upper = None
+        if self.memory_budget and self.count:
+            upper = int(self.memory_budget / (self.size_bytes / self.count))
+
+        target = self.mrc.size_for(self.target_hit_ratio)
+        if target is None:
+            target = upper if upper is not None else self.maxlen
+        if upper is not None:
+            target = min(target, upper)
+        target = max(target, self.min_maxlen)
+
+        # Hysteresis, ignore changes smaller than 10%
+        if abs(target - self.maxlen) > 0.1 * self.maxlen:
+            self.resize(target)
+
+    @staticmethod
+    def _sizeof(value: Any) -> int:
+        '''This method returns the size in bytes of a cached value.'''
+        if value is None:
+            return 0
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        return sys.getsizeof(value)
+
+
+class ObjectCache:
+    '''This class is a small LRU of deserialized values, the first tier (L1) of 
+    the tiered cache of LRUDataBase. It holds the objects of at most maxlen of 
+    the keys cached as serialized values in the LRU (L2), so a hit skips 
+    unpickling. The size is counted in items, as the size of a live object 
+    is not known.'''
+
+    def __init__(self, maxlen: int = 0) -> None:
+        '''This is the constructor method. It initializes an empty cache of at 
+        most maxlen objects, 0 disables the cache.'''
+        self.maxlen = maxlen
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.promotions = 0
+        self.demotions = 0
+
+    def __contains__(self, key: Any) -> bool:
+        '''This method checks if a key is in the cache.'''
+        return key in self.cache
+
+    def __len__(self) -> int:
+        '''This method returns the number of objects in the cache.'''
+        return len(self.cache)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        '''This method returns the object of a key and marks it most recently 
+        used. If the key is not found, it returns a default value.'''
+        try:
+            value = self.cache[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Any, value: Any) -> None:
+        '''This method adds an object, promoted from L2, and demotes the least 
+        recently used object if the cache is over maxlen. Its serialized value 
+        stays in L2.'''
+        if not self.maxlen:
+            return
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        self.promotions += 1
+        if len(self.cache) > self.maxlen:
+            self.cache.popitem(last=False)
+            self.demotions += 1
+
+    def discard(self, key: Any) -> None:
+        '''This method removes the object of a key, if cached.'''
+        self.cache.pop(key, None)
+
+    def clear(self) -> None:
+        '''This method removes every object.'''
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        '''This method returns a dictionary of cache statistics.'''
+        lookups = self.hits + self.misses
+        return {
+            'maxlen': self.maxlen,
+            'count': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'promotions': self.promotions,
+            'demotions': self.demotions,
+        }
+
+
+class Admission:
+    '''This class is the interface of the admission filters of LRUDataBase. 
+    Every read and write of a key is recorded, and when a key is read from the 
+    database the filter decides whether it is cached, before the miss itself 
+    is recorded. When the key would fill the cache it is weighed against the 
+    least recently used key, the next to be evicted. The base class admits 
+    every key.'''
+
+    def __init__(self, size: int) -> None:
+        '''This is the constructor method. size is the number of keys the 
+        filter is sized for, usually the maxlen of the cache.'''
+        self.size = max(1, size)
+
+    def record(self, key: Any) -> None:
+        '''This method records a reference to a key.'''
+
+    def admit(self, key: Any, victim: Any) -> bool:
+        '''This method returns True if key should be cached in place of victim, 
+        the least recently used key, which is None when the cache has room or 
+        the key is not known.'''
+        return True
+
+    def stats(self) -> dict:
+        '''This method returns a dictionary of filter statistics.'''
+        return {'filter': type(self).__name__, 'size': self.size}
+
+
+class Doorkeeper(Admission):
+    '''This class is an admission filter that caches a key on its second 
+    reference. The keys seen are remembered in a Bloom filter of 8 bits per 
+    key of size, which is cleared after size references, so a key read once 
+    by a scan never displaces a cached key.'''
+
+    def __init__(self, size: int) -> None:
+        '''This is the constructor method. It initializes an empty filter for 
+        size keys.'''
+        super().__init__(size)
+        self.bits = bytearray(self.size)
+        self._nbits = self.size * 8
+        self._references = 0
+
+    def __contains__(self, key: Any) -> bool:
+        '''This method checks if a key was seen since the last reset.'''
+        bits = self.bits
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in self._bit_indexes(key))
+
+    def add(self, key: Any) -> bool:
+        '''This method marks a key as seen. Returns True if it already was.'''
+        seen = True
+        bits = self.bits
+        for i in self._bit_indexes(key):
+            if not bits[i >> 3] & (1 << (i & 7)):
+                bits[i >> 3] |= 1 << (i & 7)
+                seen = False
+        self._references += 1
+        if self._references >= self.size:
+            self.reset()
+        return seen
+
+    def reset(self) -> None:
+        '''This method forgets every key.'''
+        self.bits = bytearray(self.size)
+        self._references = 0
+
+    def record(self, key: Any) -> None:
+        '''This method records a reference to a key.'''
+        self.add(key)
+
+    def admit(self, key: Any, victim: Any) -> bool:
+        '''This method admits a key that was referenced before.'''
+        return key in self
+
+    def _bit_indexes(self, key: Any) -> tuple:
+        '''Two bit positions of a key, from the halves of its hash.'''
+        h = hash(key) & MASK64
+        return (h & MASK32) % self._nbits, (h >> 32) % self._nbits
+
+
+class TinyLFU(Admission):
+    '''This class is the TinyLFU admission filter. A count-min sketch of 4 rows 
+    of 4 bit counters estimates how often each key was referenced, and a key 
+    read from the database is only cached if it is referenced more often than 
+    the least recently used key it would evict. A Doorkeeper sized for the 
+    sample of 10 * size references absorbs the first reference of each key, 
+    so keys seen once never reach the sketch. After each sample every counter 
+    is halved and the doorkeeper cleared, so old popularity fades.'''
+
+    def __init__(self, size: int) -> None:
+        '''This is the constructor method. It initializes an empty sketch of 
+        about one counter byte per key of size in each row.'''
+        super().__init__(size)
+        self.width = 1 << max(4, (self.size - 1).bit_length())
+        self.table = bytearray(SKETCH_DEPTH * self.width)
+        self.sample_size = 10 * self.size
+        self.doorkeeper = Doorkeeper(self.sample_size)
+        self._shift = 64 - (self.width.bit_length() - 1)
+        self._references = 0
+        self.resets = 0
+
+    def record(self, key: Any) -> None:
+        '''This method counts a reference to a key, the first one in the 
+        doorkeeper.'''
+        if self.doorkeeper.add(key):
+            table = self.table
+            for i in self._indexes(key):
+                if table[i] < SKETCH_MAX:
+                    table[i] += 1
+        self._references += 1
+        if self._references >= self.sample_size:
+            self.reset()
+
+    def frequency(self, key: Any) -> int:
+        '''This method returns the estimated number of references to a key.'''
+        table = self.table
+        count = min(table[i] for i in self._indexes(key))
+        return count + (key in self.doorkeeper)
+
+    def admit(self, key: Any, victim: Any) -> bool:
+        '''This method admits a key referenced more often than the victim, or, 
+        if there is no victim, a key that passed the doorkeeper, referenced 
+        twice within the sample. A key read once by each scan is then kept out 
+        of the room a sync leaves in the cache.'''
+        if victim is None:
+            return self.frequency(key) > 1
+        return self.frequency(key) > self.frequency(victim)
+
+    def reset(self) -> None:
+        '''This method halves every counter and clears the doorkeeper.'''
+        self.table = self.table.translate(HALVE)
+        self.doorkeeper.reset()
+        self._references = 0
+        self.resets += 1
+
+    def stats(self) -> dict:
+        '''This method returns a dictionary of filter statistics.'''
+        return {**super().stats(), 'width': self.width, 'resets': self.resets}
+
+    def _indexes(self, key: Any) -> list:
+        '''One counter of each row of the sketch for a key, by multiplicative 
+        hashing with a seed per row.'''
+        h = hash(key) & MASK64
+        return [row * self.width + (((h * seed) & MASK64) >> self._shift) for row, seed in enumerate(SKETCH_SEEDS)]
+
+
+# Admission filters selected by the "admission_filter" setting of LRU_db
+ADMISSION_FILTERS = {
+    'none': None,
+    'doorkeeper': Doorkeeper,
+    'tinylfu': TinyLFU,
+}
+
+
+class LRUView:
+    '''This class is a view of one namespace of a shared LRU cache. Items are 
+    stored in the shared LRU under (namespace, key) pairs, so every namespace 
+    competes for the same maxlen and memory budget, and the least recently 
+    used items are evicted whichever namespace they belong to.
+    
+    The view supports the LRU methods used by LRUDataBase. Evicting with 
+    sync_make_ready is left to the owner of the shared LRU, which writes the 
+    evicted items of every namespace together.'''
+
+    def __init__(self, lru: LRU, namespace: str) -> None:
+        '''This is the constructor method. It initializes the view with the 
+        shared LRU and the namespace of its keys.'''
+        self.lru = lru
+        self.namespace = namespace
+
+    def __contains__(self, key: Any) -> bool:
+        '''This method checks if a key of the namespace is in the cache.'''
+        return (self.namespace, key) in self.lru
+
+    def __len__(self) -> int:
+        '''This method returns the number of items of the namespace in the cache.'''
+        return sum(1 for k in self.lru.cache if k[0] == self.namespace)
+
+    def __getitem__(self, key: Any) -> Any:
+        '''This method retrieves an item from the shared cache, see LRU.__getitem__.'''
+        return self.lru[(self.namespace, key)]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        '''This method adds an item to the shared cache, see LRU.__setitem__.'''
+        self.lru[(self.namespace, key)] = value
+
+    def __delitem__(self, key: Any) -> None:
+        '''This method removes an item from the shared cache.'''
+        del self.lru[(self.namespace, key)]
+
+    def __iter__(self):
+        '''This method iterates through the keys of the namespace, starting with 
+        the most recently used key.'''
+        for namespace, key in self.lru:
+            if namespace == self.namespace:
+                yield key
+
+    @property
+    def deck(self) -> list:
+        '''The keys of the namespace, from the least to the most recently used.'''
+        return [k for n, k in self.lru.deck if n == self.namespace]
+
+    @property
+    def cache(self) -> dict:
+        '''The cached items of the namespace.'''
+        return {k: v for (n, k), v in self.lru.cache.items() if n == self.namespace}
+
+    @property
+    def deck_full(self) -> bool:
+        '''The deck_full flag of the shared cache.'''
+        return self.lru.deck_full
+
+    @property
+    def count(self) -> int:
+        '''The number of items in the shared cache.'''
+        return self.lru.count
+
+    @property
+    def maxlen(self) -> int:
+        '''The maximum number of items in the shared cache.'''
+        return self.lru.maxlen
+
+    def warm(self, key: Any, value: Any) -> bool:
+        '''This method adds an item at the least recently used end of the shared 
+        deck, see LRU.warm.'''
+        return self.lru.warm((self.namespace, key), value)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        '''This method retrieves an item from the cache. 
+        If the key is not found, it returns a default value.'''
+        return self.lru.get((self.namespace, key), default)
+
+    def peek(self, key: Any, default: Any = None) -> Any:
+        '''This method returns the cached value of a key, see LRU.peek.'''
+        return self.lru.peek((self.namespace, key), default)
+
+    def oldest(self) -> Any:
+        '''This method returns the least recently used key of the shared cache 
+        if it belongs to the namespace, otherwise None.'''
+        oldest = self.lru.oldest()
+        return oldest[1] if oldest is not None and oldest[0] == self.namespace else None
+
+    def clear(self) -> None:
+        '''This method removes the items of the namespace from the shared cache, 
+        the items of the other namespaces keep their order.'''
+        lru = self.lru
+        for k in [k for k in lru.cache if k[0] == self.namespace]:
+            lru.size_bytes -= lru._sizeof(lru.cache.pop(k))
+        lru.deck = deque((k for k in lru.deck if k[0] != self.namespace), maxlen=lru.deck.maxlen)
+        lru.count = len(lru.deck)
+
+    def stats(self) -> dict:
+        '''This method returns the share of the shared cache held by the namespace.'''
+        cache = self.cache
+        return {
+            'namespace': self.namespace,
+            'count': len(cache),
+            'size_bytes': sum(self.lru._sizeof(v) for v in cache.values()),
+            'share': len(cache) / self.lru.count if self.lru.count else 0.0,
+        }
+
 
 def test():
-    configs = load_yaml('configs/config.yaml')['LRU']
+    configs = get_configs()['LRU']
 
     try:
         # Init and fill LRU
@@ -211,6 +883,95 @@ def test():
         assert '2' in sync_store, f'LRU: sync store fail, 2 not in {sync_store}'
         assert '0' not in sync_store, f'LRU: sync store fail, 0 in {sync_store}'
         assert '3' not in sync_store, f'LRU: sync store fail, 3 in {sync_store}'
+
+        # Warm adds to the oldest end and never fills the deck, [9, 0, 3]
+        assert lru.warm('9', 9), 'LRU: warm fail'
+        assert not lru.warm('0', 'stale'), 'LRU: warm replaced a cached item'
+        assert not lru.warm('8', 8), 'LRU: warm filled the deck'
+        assert list(lru.deck) == ['9', '0', '3'], f'LRU: warm order fail, {lru.deck}'
+
+        # Resize below the count, the next write should request a sync
+        lru = LRU()
+        for i in range(8):
+            lru[f'{i}'] = i
+        lru.resize(4)
+        assert lru.deck_full, 'LRU: resize did not flag the deck as full'
+        lru['8'] = 8
+        sync_store = lru.sync_make_ready()
+        assert len(sync_store) == 7, f'LRU: resize sync fail, {sync_store}'
+        assert len(lru.deck) == len(lru.cache) == lru.count == 2, 'LRU: resize lost keys'
+
+        # Miss ratio curve, a cyclic scan over 200 keys hits only when the 
+        # cache holds all of them
+        configs = dict(configs, mrc_sample_rate=1.0, maxlen=1000)
+        lru = LRU(configs)
+        for _ in range(5):
+            for i in range(200):
+                lru[f'{i}'] = i
+        curve = lru.hit_ratio_curve([100, 201])
+        assert curve[100] == 0.0, f'LRU: hit_ratio_curve fail, {curve}'
+        assert curve[201] == 0.8, f'LRU: hit_ratio_curve fail, {curve}'
+        assert lru.mrc.size_for(0.8) == 200, f'LRU: size_for fail, {lru.mrc.size_for(0.8)}'
+
+        # Reuse distances match a walk of the recency stack, across evictions 
+        # and renumbering of the times
+        mrc = MissRatioCurve(1.0, 16)
+        stack, histogram = [], {}
+        for i in range(500):
+            key = f'{(i * i * 7 + i) % 37}'
+            mrc.record(key)
+            if key in stack:
+                distance = len(stack) - 1 - stack.index(key)
+                histogram[distance] = histogram.get(distance, 0) + 1
+                stack.remove(key)
+            stack = (stack + [key])[-16:]
+        assert mrc.histogram == histogram, f'LRU: reuse distance fail, {mrc.histogram}'
+
+        # Auto resize shrinks the cache to the size that reaches the target
+        configs = dict(configs, auto_resize=True, target_hit_ratio=0.8, resize_interval=500)
+        lru = LRU(configs)
+        for _ in range(5):
+            for i in range(200):
+                lru[f'{i}'] = i
+        assert lru.maxlen == 200, f'LRU: auto resize fail, maxlen={lru.maxlen}'
+
+        # Adaptive sync, 1ms fixed cost plus 0.1ms per row fits 40 rows in 5ms
+        configs = dict(configs, adaptive_sync=True, target_stall=0.005, maxlen=100)
+        lru = LRU(configs)
+        for rows in (10, 50, 20, 80):
+            lru.record_sync(rows, 0.001 + 0.0001 * rows)
+        assert 39 <= lru.sync_batch <= 40, f'LRU: adaptive sync fail, sync_batch={lru.sync_batch}'
+        for i in range(100):
+            lru[f'{i}'] = i
+        assert len(lru.sync_make_ready()) == lru.sync_batch, 'LRU: adaptive sync did not use sync_batch'
+
+        # A timer too coarse to measure a sync neither divides by zero nor 
+        # empties the cache
+        coarse = LRU(configs)
+        coarse.record_sync(10, 0.0)
+        coarse.record_sync(10, 0.0)
+        assert coarse.sync_batch == coarse.maxlen - 1, f'LRU: adaptive sync limit fail, sync_batch={coarse.sync_batch}'
+
+        # Admission filters, the doorkeeper admits on the second reference and 
+        # TinyLFU admits keys referenced more often than the victim
+        assert lru.oldest() == lru.deck[0], 'LRU: oldest fail'
+        doorkeeper = Doorkeeper(100)
+        assert not doorkeeper.admit('a', None), 'Doorkeeper: admitted a new key'
+        doorkeeper.record('a')
+        assert doorkeeper.admit('a', None), 'Doorkeeper: did not admit a seen key'
+        for i in range(99):
+            doorkeeper.record(i)
+        assert 'a' not in doorkeeper, 'Doorkeeper: reset fail'
+
+        sketch = TinyLFU(100)
+        for i in range(20):
+            for _ in range(i % 5):
+                sketch.record(f'{i}')
+        assert [sketch.frequency(f'{i}') for i in range(5)] == [0, 1, 2, 3, 4], 'TinyLFU: frequency fail'
+        assert sketch.admit('4', '1') and not sketch.admit('new', '1'), 'TinyLFU: admit fail'
+        assert sketch.admit('2', None) and not sketch.admit('1', None), 'TinyLFU: admit without a victim fail'
+        sketch.reset()
+        assert sketch.frequency('4') == 1 and sketch.resets == 1, 'TinyLFU: reset did not halve the counters'
     except Exception as error:
         LOG.exception(f'LRU Test Failed: {error}', exc_info=True)
         raise
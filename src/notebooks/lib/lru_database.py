@@ -20,27 +20,50 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 '''
 
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+import zlib
 from collections import namedtuple
 from io import BytesIO
 from pickle import DEFAULT_PROTOCOL, Pickler, Unpickler
-from typing import Any
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator
 
-from lib.utilities import setup_logging, load_yaml
-from lib.database import AsyncDataBase
+from lib.utilities import Configs, resolve_configs
+from lib.database import AsyncDataBase, SyncDataBase, matches
 from lib.database import test as AsyncDataBase_test
-from lib.lru import LRU
+from lib.database import test_sync as SyncDataBase_test
+from lib.database import test_profiles as DataBaseProfiles_test
+from lib.database import test_backup as DataBaseBackup_test
+from lib.lru import ADMISSION_FILTERS, LRU, Admission, ObjectCache
 from lib.lru import test as LRU_test
+from lib.storage import get_backend, is_dump
 
-CONFIGS = load_yaml('configs/config.yaml')['Application']
-LRU_CONFIGS = load_yaml('configs/config.yaml')['LRU_db']
-LRU_CONFIGS['protocol'] = DEFAULT_PROTOCOL
-
-logging = setup_logging(path = CONFIGS['loggingConfigPath'])
-LOG = logging.getLogger(LRU_CONFIGS['logger'])
-LOG.setLevel(CONFIGS['logging_level'])
+LOG = logging.getLogger('LRU_db')
 
 Node = namedtuple('Node', ['node_id', 'node'])
 
+# Cached in place of the value of a key deleted with deferred_deletes, until 
+# the delete is flushed to the database by sync or flush_cache.
+TOMBSTONE = object()
+
+# Returned by lookups of keys that are not in the object cache
+MISSING = object()
+
+# Cache hints of read and get. True caches a value read from the database, 
+# subject to the admission filter, False serves it without caching it, and 
+# LOW_PRIORITY caches it at the least recently used end if there is room.
+LOW_PRIORITY = 'low-priority'
+CACHE_HINTS = (True, False, LOW_PRIORITY)
+ADMISSION_COUNTS = ('admitted', 'rejected', 'low_priority', 'uncached')
+
+
+class Compressed(bytes):
+    '''A zlib compressed serialized value in the LRU, see LRUDataBase._pack.'''
+    __slots__ = ()
+
 
 class LRUDataBase:
     '''The code is a Python class named LRUDataBase that implements a 
@@ -52,12 +75,22 @@ class LRUDataBase:
     data in memory for quick access, but also want to persist all data 
     in a database for long-term storage.'''
     
-    def __init__(self, file_name: str, table_name: str, configs: dict = LRU_CONFIGS) -> None:
+    def __init__(self, file_name: str, table_name: str, configs: Configs | dict | None = None, indexes: dict | None = None) -> None:
         '''This is the constructor method. It initializes the instance with a file 
-        name, a table name, and a configuration dictionary.'''
+        name, a table name, and a configuration. A Configs object configures the 
+        LRU and AsyncDataBase as well, a dict is taken as the "LRU_db" section. 
+        The default configuration is loaded on first use. indexes maps the names 
+        of indexed fields to functions of a value, see query.'''
         self.file_name = file_name
         self.table_name = table_name
-        self.__dict__.update(configs)
+        section, self.configs = resolve_configs(configs, 'LRU_db')
+        self.__dict__.update(section)
+        self.indexes = dict(indexes or {})
+
+        if self.protocol in (None, 'None'):
+            self.protocol = DEFAULT_PROTOCOL
+        if self.large_value_threshold in (None, 'None'):
+            self.large_value_threshold = None
     
     async def __aenter__(self):
         '''These methods are used to make the class compatible with the async context 
@@ -86,18 +119,10 @@ class LRUDataBase:
         Called by: async for x in self:'''
         try:
             if not hasattr(self, '_database_keys'):
-                # Get the keys from the database, returns a list of keys: str
-                self._database_keys = await self.node_keys()
-                
-                # Add the LRU keys to the database keys. The LRU
-                # can be updated without writing to the database.
-                # The deck is a deque of bytes.
-                for k in list(self.lru.deck):
-                    key = self._decode_key(k)
-                    if key in self._database_keys:
-                        pass
-                    else:
-                        self._database_keys.append(key)
+                # Get the keys from the database, returns a list of keys: str,
+                # and add the LRU keys. The LRU can be updated without writing
+                # to the database.
+                self._database_keys = self._with_cached_keys(await self.node_keys())
 
             # Removes the last key from the list, this will 
             # generally be the most recently used key.
@@ -109,32 +134,175 @@ class LRUDataBase:
             return _next
 
     async def connect(self, database_path: str | None = None) -> None:
-        '''This method connects to the database and initializes the LRU cache.'''
-        self.lru = LRU()
-    
-        # Creates the connection thread and the cursor
-        # Create(if not already made) a table named 'table_name'
-        if database_path is not None:
-            self.db = AsyncDataBase(self.file_name, self.table_name, database_path=database_path)
-        else:
-            self.db = AsyncDataBase(self.file_name, self.table_name)
-
+        '''This method connects to the database and initializes the LRU cache. The 
+        storage backend is chosen by the "backend" setting, see lib.storage.'''
+        # Creates the connection thread and the cursor, or opens the storage
+        # of another backend. Create(if not already made) a table named 'table_name'
+        self._open(get_backend(self.backend), database_path)
         await self.db.open_connection()
         await self.db.create()
+        await self._start()
+
+    async def _start(self) -> None:
+        '''Resets the session state once the LRU and database are ready, see
+        _reset. With warm_start enabled, the hot set of the previous session is
+        reloaded in the background.'''
+        self._reset()
+        if self.coherence:
+            self._log_seq, _ = await self.db.changes(None)
+        self._open_shared()
+        if self.warm_start:
+            self._warm_task = asyncio.create_task(self._warm())
+        if self.checkpoint_interval:
+            self._checkpoint_task = asyncio.create_task(self._checkpointer())
+
+    def _open(self, backend: type, database_path: str | None) -> None:
+        '''Creates the LRU and the database object of the table, with the
+        integer key and index settings, for connect to open.'''
+        self.lru = self._new_lru()
+        self.db = backend(self.file_name, self.table_name, database_path=database_path, configs=self.configs)
+        self._set_integer_keys()
+        self._set_indexes()
+
+    def _reset(self) -> None:
+        '''Resets the session state shared by both front ends, before the change
+        log position is read and the background work is started.'''
+        # Keys written since they were last synced, only these are written
+        # back, with the monotonic time of the first unsynced write, oldest first
+        self._dirty = {}
+
+        # Deserialized values of cached keys, the first tier of the cache
+        self.objects = ObjectCache(self.object_cache_size)
+        self._packed = [0, 0]
+
+        # Admission of values read from the database into the LRU
+        self.admission = self._new_admission()
+        self._admissions = dict.fromkeys(ADMISSION_COUNTS, 0)
+
+        # Cache coherence with other connections to the same file
+        self._log_seq = None
+        self._next_poll = 0.0
+        if self.coherence:
+            self._require('changes', 'coherence')
+            self.db.origin = uuid.uuid4().hex
+
+        self._pending_reads = 0
+        self._warm_touched = set()
+        self._warm_task = None
+        self._checkpoint_task = None
+
+    def _require(self, attribute: str, feature: str) -> None:
+        '''Raises a ValueError if the database lacks attribute, which feature
+        needs, for storage backends that do not support it.'''
+        if not hasattr(self.db, attribute):
+            raise ValueError(f'{feature} is not supported by the "{self.backend}" backend')
+
+    def _new_lru(self) -> LRU:
+        '''Returns the LRU index chosen by lru_index, the dict and deque LRU or 
+        the array backed CompactLRU, see lib.compact_lru.'''
+        if self.lru_index == 'compact':
+            from lib.compact_lru import CompactLRU
+            return CompactLRU(self.configs)
+        if self.lru_index != 'dict':
+            raise ValueError(f'unknown lru_index "{self.lru_index}", expected "dict" or "compact"')
+        return LRU(self.configs)
+
+    def _new_admission(self) -> Admission | None:
+        '''Returns the admission filter chosen by admission_filter, sized for 
+        admission_size keys or the maxlen of the LRU, or None to admit every 
+        value read, see lib.lru.ADMISSION_FILTERS.'''
+        try:
+            cls = ADMISSION_FILTERS[self.admission_filter]
+        except KeyError:
+            raise ValueError(f'unknown admission_filter "{self.admission_filter}", expected one of {list(ADMISSION_FILTERS)}') from None
+        return None if cls is None else cls(self.admission_size or self.lru.maxlen)
+
+    def _set_integer_keys(self) -> None:
+        '''Switches the database to an INTEGER PRIMARY KEY table when integer_keys 
+        is enabled.'''
+        if self.integer_keys:
+            self._require('integer_keys', 'integer_keys')
+            self.db.integer_keys = True
+
+    def _set_indexes(self) -> None:
+        '''Declares the indexed fields on the database, which computes them from 
+        the unpickled values it writes.'''
+        if self.indexes:
+            if not hasattr(self.db, 'indexes'):
+                raise ValueError(f'indexes are not supported by the "{self.backend}" backend')
+            self.db.indexes = self.indexes
+            self.db.index_decoder = self._un_serialize
+
+    def _open_shared(self) -> None:
+        '''Attaches to the shared memory tier of the table, see lib.shared_cache, 
+        when shared_cache is enabled.'''
+        self.shared = None
+        if self.shared_cache:
+            from lib.shared_cache import SharedCache
+            self.shared = SharedCache(self.db.database_path, self.table_name, self.configs).open()
+
+    async def _warm(self) -> int:
+        '''This method reloads the hot key list saved by flush_cache into the LRU. 
+        The most recently used keys are read first, in batches of warm_batch keys. 
+        Batches wait while foreground reads are waiting on the database, and 
+        between batches, so warming does not compete with cache misses. Returns 
+        the number of keys loaded.'''
+        warmed = 0
+        try:
+            for batch in self._warm_batches(await self.db.read_hot_keys()):
+                while self._pending_reads:
+                    await asyncio.sleep(self.warm_interval)
+
+                loaded, full = self._warm_batch(batch, await self.db.read(batch) or [])
+                warmed += loaded
+                if full:
+                    return warmed
+
+                await asyncio.sleep(self.warm_interval)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            LOG.exception(f'_warm: {error}')
+        finally:
+            self._warm_touched = set()
+            LOG.info(f'Warm start loaded {warmed} keys, shelve_name={self.table_name}')
+        return warmed
                 
     async def write(self, key: str, value: Any) -> None:
         '''This method first writes to the LRU cache. If the cache is full it prepares 
         the oldest data in the LRU for offloading to the database, then writes to the 
-        database by calling sync().'''
-        self.lru[self._encode_key(key)] = self._serialize(value)
+        database by calling sync(). Values of large_value_threshold bytes or more 
+        are written to the database directly.'''
+        key, value = self._prepare_write(key, value)
+        if self._is_large(value):
+            await self.db.write((key, value))
+            self._uncache(key)
+            return
+
+        self._written(key)
+        await self._cache(key, value)
+
+    async def _cache(self, key: bytes, value: Any) -> None:
+        '''Adds a serialized value to the LRU, syncing the oldest items if the LRU 
+        is full. Values read from the database are cached clean, so they are 
+        not written back when they are evicted.'''
+        self.lru[key] = self._pack(value)
 
         if self.lru.deck_full:
             await self.sync()
         
-    async def read(self, key: str | list) -> Any | list:
+    async def read(self, key: str | list, cache: bool | str = True) -> Any | list:
         '''This method reads a value from the LRU cache or the database using a key. 
-        If the key is not found, it returns None.'''
-        if isinstance(key, str):
+        If the key is not found, it returns None. With coherence enabled, keys 
+        changed by other connections are dropped from the LRU first. cache is 
+        the hint for values read from the database: True caches them, if the 
+        admission filter admits them, False does not, and 'low-priority' 
+        caches them at the least recently used end if the LRU has room.'''
+        self._check_hint(cache)
+        if self.coherence:
+            await self._poll_changes()
+
+        if isinstance(key, (str, int)):
             try:
                 key = self._encode_key(key)
 
@@ -142,144 +310,811 @@ class LRUDataBase:
                 value = self.lru[key]
             except KeyError:
                 # Key is not in the LRU, check the database. blob is a Node object
-                blob = await self.db.read(key)
+                blob = await self._db_read(key)
 
                 if blob:
-                    # Add the key and serialized value to the LRU
-                    await self.write(key, blob.node)
-
-                    # Un_serialize the value and return
-                    return self._un_serialize(blob.node)
+                    # Un_serialize the value, add the key and serialized value
+                    # to the LRU and the value to the object cache, unless large
+                    # or not admitted
+                    value, admitted = self._read_miss(blob, cache)
+                    if admitted:
+                        await self._cache(key, blob.node)
+                        self.objects.put(key, value)
+                    return value
                 else:
                     # No blob was returned, key is not in the database or LRU
                     return None
             else:
                 # Key is in the LRU, return the value
-                return self._un_serialize(value)
+                self._referenced(key)
+                return self._load(key, value)
             
         elif isinstance(key, list):
-            return await self._read_many(key)
+            return await self._read_many(key, cache)
         
-    async def _read_many(self, keys: list) -> dict:
+    async def _read_many(self, keys: list, cache: bool | str = True) -> dict:
         '''Reads a list of keys from the LRU and database. Returns a dictionary of
         key, value pairs. If a key is not found, the value is None.'''
-        read_from_db = []
-        results = {}
-
         # First check the LRU for the keys
-        for key in keys:
-            try:
-                _key = self._encode_key(key)
+        results, read_from_db = self._read_cached(keys)
 
-                value = self.lru[_key]
-            except KeyError:
-                # If key not in the LRU, add to the read list
-                results[key] = None
-                read_from_db.append(_key)
-                continue
-            else:
-                # If key is in the LRU, add to the results dict
-                results[key] = self._un_serialize(value)
-        
-        # If all keys are in the LRU, return the results, 
+        # If all keys are in the LRU, return the results,
         # else read from the database to get the missing keys
         if read_from_db:
             # Send the list to the database and get a list of Node objects
-            blob_list = await self.db.read(read_from_db)
-            
+            blob_list = await self._db_read(read_from_db)
+
             for blob in blob_list:
-                # Update the LRU
-                await self.write(blob.node_id, blob.node)
+                # Un_serialize the next node, then update the LRU and the object cache
+                value, admitted = self._read_miss(blob, cache)
+                if admitted:
+                    await self._cache(blob.node_id, blob.node)
+                    self.objects.put(blob.node_id, value)
 
-                # Get the next node in the blob and un_serialize
-                key = self._decode_key(blob.node_id)
-                value = self._un_serialize(blob.node)
-                
                 # Update the results dict
-                results[key] = value
+                results[self._decode_key(blob.node_id)] = value
 
         return results
     
-    async def get(self, key: str, default: Any = None) -> Any:
+    async def _poll_changes(self) -> None:
+        '''Reads the keys changed by other connections from the change log, at 
+        most every coherence_interval seconds, and invalidates them.'''
+        if not self._poll_due():
+            return
+        self._log_seq, changed = await self.db.changes(self._log_seq)
+        self._invalidate(changed)
+
+    def _invalidate(self, changed: list | None) -> None:
+        '''Drops changed keys from the LRU, or every key if changed is None. Keys 
+        with unsynced writes are kept, the last write to reach the database wins.'''
+        if changed is None:
+            changed = list(self.lru.cache)
+            LOG.warning(f'Change log trimmed past the last poll, invalidating the LRU, shelve_name={self.table_name}')
+
+        if self.shared is not None:
+            self.shared.discard([self._encode_key(k) for k in changed])
+
+        dropped = 0
+        for key in map(self._encode_key, changed):
+            if key in self.lru and key not in self._dirty:
+                del self.lru[key]
+                self.objects.discard(key)
+                dropped += 1
+        if dropped:
+            LOG.debug(f'Invalidated {dropped} keys changed by other connections, shelve_name={self.table_name}')
+
+    async def _db_read(self, key: bytes | list) -> Any:
+        '''Reads from the database while keeping count of the foreground reads 
+        in flight, which the warm start task yields to.'''
+        self._pending_reads += 1
+        try:
+            if self.shared is None:
+                return await self.db.read(key)
+
+            hits, missing, stamps = self._shared_get(key)
+            blobs = await self.db.read(missing) if missing else []
+            return self._shared_fill(key, hits, blobs, stamps)
+        finally:
+            self._pending_reads -= 1
+
+    def _shared_get(self, key: bytes | list) -> tuple:
+        '''Looks up keys in the shared tier. Returns the Nodes found, the keys 
+        to read from the database and their write stamps, taken before the 
+        read, see SharedCache.fill.'''
+        keys = key if isinstance(key, list) else [key]
+        found = self.shared.get_many(keys)
+        missing = [k for k in keys if k not in found]
+        return [Node(k, v) for k, v in found.items()], missing, self.shared.stamps(missing)
+
+    def _shared_fill(self, key: bytes | list, hits: list, blobs: list | None, stamps: dict) -> Any:
+        '''Adds the Nodes read from the database to the shared tier, unless 
+        another process wrote or deleted them since the stamps were taken, 
+        and returns the result of the read of key.'''
+        blobs = blobs or []
+        if blobs:
+            self.shared.fill({self._encode_key(blob.node_id): blob.node for blob in blobs}, stamps)
+        blobs = hits + blobs
+        if isinstance(key, list):
+            return blobs
+        return blobs[0] if blobs else None
+
+    def _publish(self, values: dict, deletes: list) -> None:
+        '''Updates the shared tier with the values and deletes written to the 
+        database.'''
+        if self.shared is not None:
+            self.shared.put({self._encode_key(k): v for k, v in values.items()})
+            self.shared.discard([self._encode_key(k) for k in deletes])
+
+    async def get(self, key: str, default: Any = None, cache: bool | str = True) -> Any:
         '''Returns the unserialized value of the key. If not in the 
-        database or LRU, returns default.'''
-        results = await self.read(key)
+        database or LRU, returns default. See read for cache.'''
+        results = await self.read(key, cache)
         if results is None:
             return default
         return results
 
+    async def update(self, key: str | int, fn: Callable, default: Any = None) -> Any:
+        '''This method replaces the value of a key with fn(value), fn(default) if 
+        the key is missing, and returns the new value. See update_many.'''
+        return (await self.update_many([key], fn, default))[key]
+
+    async def update_many(self, keys: list, fn: Callable, default: Any = None) -> dict:
+        '''This method replaces the value of each key with fn(value), fn(default) 
+        if the key is missing, and returns a dict of the new values. Cached keys 
+        are updated in place in the LRU, the other keys in one database 
+        transaction, where fn runs on the connection thread, without admitting 
+        them to the LRU. Each value is unpickled and pickled once, and no other 
+        call on the shelf reads or writes a key between its read and its write. 
+        fn gets its own copy of the value, never an object of the object cache.'''
+        values = {}
+        await self._update([self._encode_key(k) for k in keys], self._apply_fn(fn, default, values))
+        return {key: values[self._encode_key(key)] for key in keys}
+
+    async def version(self, key: str | int) -> str | None:
+        '''This method returns the version of the value of a key, a hash of its
+        serialized value, or None if the key is missing. See compare_and_set.'''
+        if self.coherence:
+            await self._poll_changes()
+        _key = self._encode_key(key)
+        version = self._cached_version(_key)
+        if version is not MISSING:
+            return version
+        blob = await self.db.read(_key)
+        return self._version(None if blob is None else blob.node)
+
+    async def compare_and_set(self, key: str | int, version: str | None, value: Any) -> bool:
+        '''This method writes value only if the version of the stored value is 
+        still version, as returned by the version method, None if the key must 
+        be missing. The check and the write are done like update_many, without 
+        unpickling the stored value. Returns True if the value was written.'''
+        new = self._serialize(value)
+        _key = self._encode_key(key)
+        return (await self._update([_key], self._compare_fn(version, new)))[_key] is new
+
+    async def _update(self, keys: list, fn: Callable) -> dict:
+        '''Applies fn(key, blob) to the serialized values of encoded keys, see 
+        _update_cached, and returns the new serialized values.'''
+        if self.coherence:
+            await self._poll_changes()
+        blobs, missing, large = self._update_cached(keys, fn)
+        if large:
+            await self.db.write(large)
+            for key in large:
+                self._uncache(key)
+        if missing:
+            self._updated(await self.db.update(missing, self._record_fn(fn, blobs)))
+        if self.lru.deck_full:
+            await self.sync()
+        return blobs
+
+    async def query(self, *conditions: tuple) -> dict:
+        '''This method returns a dict of the keys and values whose indexed fields 
+        meet all of the conditions, (name, op, value) tuples where op is one of 
+        ==, !=, <, <=, >, >= and in. The database finds the matching rows with its 
+        indexes, and only those are unpickled. Dirty keys, whose database rows 
+        are stale, are checked against their cached values instead. Matches are 
+        not admitted to the LRU.'''
+        if self.coherence:
+            await self._poll_changes()
+        blobs = await self.db.query(list(conditions))
+        return self._query_results(blobs, conditions)
+
+    async def query_keys(self, *conditions: tuple) -> list:
+        '''This method returns the keys whose indexed fields meet all of the 
+        conditions, without reading or unpickling values, see query.'''
+        if self.coherence:
+            await self._poll_changes()
+        node_ids = await self.db.query(list(conditions), keys_only=True)
+        return self._query_keys(node_ids, conditions)
+
+    async def read_range(self, key: str, offset: int = 0, size: int = -1) -> bytes | None:
+        '''This method reads size bytes of the stored value of a key from offset, 
+        to the end if size is negative, without loading the whole value from the 
+        database. These are the bytes of the serialized value, or the raw bytes 
+        written by write_stream. Returns None if the key is not found.'''
+        if self.coherence:
+            await self._poll_changes()
+
+        key = self._encode_key(key)
+        if key in self.lru:
+            return self._slice(self._unpack(self.lru[key]), offset, size)
+        return await self.db.read_range(key, offset, size)
+
+    async def read_stream(self, key: str) -> AsyncIterator[bytes]:
+        '''This method yields the stored bytes of a key in chunks of 
+        stream_chunk_size bytes, see read_range. A value written while it is 
+        streamed may be seen partly old and partly new.
+        
+        async for chunk in shelf.read_stream(key):'''
+        _key = self._encode_key(key)
+        size = self._cached_size(_key)
+        if size is MISSING:
+            size = await self.db.blob_size(_key)
+        if size is None:
+            return
+
+        for offset in range(0, size, self.stream_chunk_size):
+            yield await self.read_range(key, offset, self.stream_chunk_size)
+
+    async def write_stream(self, key: str, source: Any, size: int) -> None:
+        '''This method writes size bytes from a binary file or an iterable of 
+        bytes chunks as the value of a key, straight to the database in chunks, 
+        so a large value is never held in memory whole. The bytes are stored 
+        as they are: read them back with read_range or read_stream, or with 
+        read if they are a pickle. A cached value of the key is dropped.'''
+        key = self._encode_key(key)
+        await self.db.write_stream(key, source, size, self.stream_chunk_size)
+        self._uncache(key)
+
+    async def bulk_load(self, source: Any, batch_size: int | None = None) -> int:
+        '''This method loads a dict or an iterable of (key, value) pairs, or a 
+        dump file written by export, straight into the database, bypassing the 
+        LRU, see AsyncDataBase.bulk_load. The keys and values of a dump are 
+        stored as they are. The LRU is flushed first, so no cached value hides 
+        a loaded one. Returns the number of pairs loaded.'''
+        await self.flush_cache()
+        if self.shared is not None:
+            self.shared.clear()
+        return await self.db.bulk_load(self._bulk_rows(source), batch_size)
+
+    async def export(self, dest: Any) -> int:
+        '''This method writes every stored key and serialized value to a dump 
+        file, a path or a binary file, see AsyncDataBase.export. Unsynced 
+        writes are checkpointed first. Returns the number of keys written.'''
+        await self.checkpoint(max_age=0)
+        return await self.db.export(dest)
+
+    async def backup(self, dest: Any, pages: int | None = None, sleep: float | None = None) -> dict:
+        '''This method copies the database file to dest, a path, while the shelf 
+        stays in use, pages at a time with a pause of sleep seconds between 
+        steps, see AsyncDataBase.backup. The dirty keys are checkpointed first, 
+        and with warm_start the hot key list is saved, so the copy holds every 
+        write made before the call and opens with a warm LRU. Writes made while 
+        it runs may or may not be in the copy. Returns the statistics of the 
+        copy and the number of keys checkpointed.'''
+        self._require('backup', 'backup')
+        checkpointed = await self.checkpoint(max_age=0)
+        if self.warm_start:
+            await self.db.write_hot_keys(self._hot_keys())
+        stats = await self.db.backup(dest, pages, sleep)
+        return {**stats, 'checkpointed': checkpointed}
+
     async def node_keys(self) -> list:
-        '''Retrieves all the keys from the database'''
+        '''Retrieves all the keys from the database, less the keys with a 
+        pending deferred delete.'''
         keys = await self.db.node_keys()
-        return [self._decode_key(key) for key in keys]
+        tombstones = self._tombstones()
+        return [self._decode_key(key) for key in keys if self._encode_key(key) not in tombstones]
     
-    async def delete(self, key: str) -> None:
-        '''This method deletes a key-value pair from the database 
-        and the LRU cache.
+    async def delete(self, key: str | list) -> None:
+        '''This method deletes a key-value pair, or a list of keys, from the 
+        database and the LRU cache. With deferred_deletes enabled, a tombstone 
+        is cached instead and the database delete is batched with the next 
+        sync or flush_cache.
         
         del self[key]'''
-        key = self._encode_key(key)
+        keys = self._delete_keys(key)
+        if self.deferred_deletes:
+            for key in keys:
+                self._written(key)
+                await self._cache(key, TOMBSTONE)
+            return
 
-        await self.db.delete_node(key)
-        
-        try:
-            del self.lru[key]
-        except KeyError:
-            pass
+        await self.db.delete_node(keys if len(keys) > 1 else keys[0])
+        self._deleted(keys)
 
     async def flush_cache(self):
-        '''This method flushes the LRU cache to the database.'''
+        '''This method flushes the LRU cache to the database. With warm_start 
+        enabled, the cached keys are saved in recency order so the next connect 
+        can reload them.'''
         try:
-            # Flush the LRU cache to the database
-            await self.db.write(self.lru.cache)    
-            cache_size = len(self.lru)
+            # Flush the changed items, the pending deletes and the hot key
+            # list to the database in one transaction
+            values, deletes, hot_keys = self._flush_writes()
+            await self.db.write(values, hot_keys=hot_keys, deletes=deletes)
+            self._flushed(values, deletes)
         except Exception as error:
             LOG.exception(f'flush_cache: {error}')
             raise
-        else:
-            self.lru._create_empty_deck()
-            LOG.info(f'Flushed the LRU cache, shelve_name={self.table_name}, count={cache_size}')
-            
+
     async def sync(self):
         '''This method offloads old items from the LRU cache to the database.'''
         try:
-            sync_store = self.lru.sync_make_ready()
-
-            # Write the sync_store (old items in LRU cahce) to the database
-            await self.db.write(sync_store)
-
-            if len(self.lru.cache) != self.lru.count:
-                raise ValueError(f'Sync did not off load all LRU cache items. len_lru={len(self.lru.cache)} != cnt_lru={self.lru.count}')
+            # Write the changed items of the sync_store (old items in LRU
+            # cahce) to the database, and delete the tombstoned keys. The
+            # latency tunes the eviction batch size in adaptive mode.
+            sync_store, values, deletes = self._sync_writes()
+            start = time.perf_counter()
+            await self.db.write(values, deletes=deletes)
+            self._synced(sync_store, values, deletes, time.perf_counter() - start)
         except Exception as error:
             LOG.exception(f'sync: {error}')
             raise
         else:
             LOG.info(f'Sync offloaded old cached items to the database, shelve_name={self.table_name}, count={len(sync_store)}')
    
+    def stats(self) -> dict:
+        '''This method returns a dictionary of LRU cache statistics, including the 
+        eviction batch size chosen by adaptive sync.'''
+        stats = self.lru.stats()
+        stats['objects'] = self.objects.stats()
+        oldest = next(iter(self._dirty.values()), None)
+        stats['dirty'] = len(self._dirty)
+        stats['dirty_age'] = 0.0 if oldest is None else time.monotonic() - oldest
+        raw, packed = self._packed
+        stats['compression'] = {'raw_bytes': raw, 'packed_bytes': packed, 'ratio': raw / packed if packed else 1.0}
+        stats['admission'] = dict(self._admissions)
+        if self.admission is not None:
+            stats['admission'].update(self.admission.stats())
+        return stats
+
+    async def checkpoint(self, max_age: float | None = None, limit: int | None = None) -> int:
+        '''This method writes the values of dirty keys first written at least 
+        max_age seconds ago, checkpoint_age by default, to the database in one 
+        transaction, oldest first and at most limit keys, all if None. The keys 
+        stay in the LRU, clean. Returns the number of keys written.'''
+        items = self._checkpoint_items(max_age, limit)
+        if not items:
+            return 0
+        try:
+            values, deletes = self._pending_writes(items)
+            await self.db.write(values, deletes=deletes)
+            self._publish(values, deletes)
+            self._checkpointed(items)
+        except Exception as error:
+            LOG.exception(f'checkpoint: {error}')
+            raise
+        else:
+            LOG.debug(f'Checkpoint wrote {len(items)} dirty keys, shelve_name={self.table_name}')
+        return len(items)
+
+    async def _checkpointer(self) -> None:
+        '''Checkpoints up to checkpoint_batch keys older than checkpoint_age 
+        every checkpoint_interval seconds, until cancelled by close. A failed 
+        checkpoint is logged and retried on the next round.'''
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                await self.checkpoint(limit=self.checkpoint_batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    async def _cancel_tasks(self) -> None:
+        '''Stops the warm start and checkpoint tasks.'''
+        for task in (self._warm_task, self._checkpoint_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
     async def close(self):
         '''This method flushes the cache to the database and 
         closes the database connection.'''
         try:
+            await self._cancel_tasks()
+
             await self.flush_cache()
             await self.db.close()
+            if self.shared is not None:
+                self.shared.close()
         except Exception as error:
             LOG.exception(f'close: {error}')
             raise     
         else:
             self.lru = None
             self.db = None
+            self.shared = None
             LOG.info(f'Closed LRUDataBase table: {self.table_name}')       
 
-    def _encode_key(self, key: str) -> bytes:
-        '''helper methods for encoding keys.'''
+    def _tombstones(self) -> set:
+        '''Returns the keys with a pending deferred delete.'''
+        return {k for k, v in self.lru.cache.items() if v is TOMBSTONE}
+
+    def _pending_writes(self, items: dict) -> tuple:
+        '''Splits the changed items among the cached items into the values to 
+        write and the keys to delete. Clean items are already in the database.'''
+        values, deletes = {}, []
+        for k, v in items.items():
+            if k not in self._dirty:
+                continue
+            if v is TOMBSTONE:
+                deletes.append(k)
+            else:
+                values[k] = self._unpack(v)
+        return values, deletes
+
+    def _flush_writes(self) -> tuple:
+        '''Returns the values, deletes and hot key list that flush_cache writes.'''
+        values, deletes = self._pending_writes(self.lru.cache)
+        return values, deletes, self._hot_keys() if self.warm_start else None
+
+    def _flushed(self, values: dict, deletes: list) -> None:
+        '''Publishes a flush written to the database and empties the LRU.'''
+        self._publish(values, deletes)
+        self._dirty.clear()
+        cache_size = len(self.lru)
+        self.lru._create_empty_deck()
+        self.objects.clear()
+        LOG.info(f'Flushed the LRU cache, shelve_name={self.table_name}, count={cache_size}')
+
+    def _sync_writes(self) -> tuple:
+        '''Takes the oldest items out of the LRU for a sync. Returns them with
+        the values and deletes to write.'''
+        sync_store = self.lru.sync_make_ready()
+        self._evicted(sync_store)
+        return (sync_store, *self._pending_writes(sync_store))
+
+    def _synced(self, sync_store: dict, values: dict, deletes: list, seconds: float) -> None:
+        '''Publishes a sync written to the database in seconds, marks its keys
+        clean and records its latency for adaptive sync.'''
+        self._publish(values, deletes)
+        self._clean(sync_store)
+        self.lru.record_sync(len(sync_store), seconds)
+
+        if len(self.lru) != self.lru.count:
+            raise ValueError(f'Sync did not off load all LRU cache items. len_lru={len(self.lru)} != cnt_lru={self.lru.count}')
+
+    def _warm_batches(self, hot_keys: list) -> Iterator[list]:
+        '''Yields the hot keys that fit the LRU in batches of warm_batch keys,
+        the most recently used first.'''
+        hot_keys = hot_keys[-self.lru.maxlen:]
+        hot_keys.reverse()
+        for i in range(0, len(hot_keys), self.warm_batch):
+            yield hot_keys[i:i + self.warm_batch]
+
+    def _warm_batch(self, batch: list, blobs: list) -> tuple:
+        '''Loads the Nodes read for a batch of hot keys at the least recently
+        used end of the LRU, less large values and keys written or deleted
+        meanwhile, see _touched. Returns the number of keys loaded and True
+        once the LRU is full.'''
+        found = {blob.node_id: blob.node for blob in blobs}
+        warmed = 0
+        for key in batch:
+            if key in found and key not in self._warm_touched and not self._is_large(found[key]):
+                if self.lru.count >= self.lru.maxlen - 1:
+                    return warmed, True
+                warmed += self.lru.warm(key, self._pack(found[key]))
+        return warmed, False
+
+    def _with_cached_keys(self, keys: list) -> list:
+        '''Adds the cached keys that are not in the database yet, less the
+        tombstones, to a list of database keys.'''
+        database_keys = set(keys)
+        cache = self.lru.cache
+        for k in list(self.lru.deck):
+            key = self._decode_key(k)
+            if key not in database_keys and cache[k] is not TOMBSTONE:
+                keys.append(key)
+        return keys
+
+    def _prepare_write(self, key: str | int, value: Any) -> tuple:
+        '''Encodes the key and serializes the value of a write.'''
+        key = self._encode_key(key)
+        self._referenced(key)
+        return key, self._serialize(value)
+
+    def _written(self, key: bytes | int) -> None:
+        '''Marks a key dirty before its new value or tombstone is cached.'''
+        self._dirty.setdefault(key, time.monotonic())
+        self.objects.discard(key)
+        self._touched([key])
+
+    def _touched(self, keys: Iterable) -> None:
+        '''Records keys written or deleted while the warm start task runs, which 
+        it must not reload, since it may have read their old values.'''
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_touched.update(keys)
+
+    def _read_cached(self, keys: list) -> tuple:
+        '''Reads a list of keys from the LRU. Returns the results dict, with
+        None for the keys that are not cached, and the encoded keys to read
+        from the database.'''
+        read_from_db = []
+        results = {}
+        for key in keys:
+            _key = self._encode_key(key)
+            try:
+                value = self.lru[_key]
+            except KeyError:
+                results[key] = None
+                read_from_db.append(_key)
+            else:
+                self._referenced(_key)
+                results[key] = self._load(_key, value)
+        return results, read_from_db
+
+    def _read_miss(self, blob: Node, cache: bool | str) -> tuple:
+        '''Unserializes a Node read from the database. Returns the value and
+        whether to cache it, see _should_cache. Large values are never cached.'''
+        value = self._un_serialize(blob.node)
+        return value, not self._is_large(blob.node) and self._should_cache(blob.node_id, blob.node, cache)
+
+    def _poll_due(self) -> bool:
+        '''Returns True if the change log is due to be polled, at most every
+        coherence_interval seconds.'''
+        if time.monotonic() < self._next_poll:
+            return False
+        self._next_poll = time.monotonic() + self.coherence_interval
+        return True
+
+    def _apply_fn(self, fn: Callable, default: Any, values: dict) -> Callable:
+        '''Returns the fn(key, blob) of _update for update_many, which applies fn
+        to the unpickled value, or to default for a missing key, and records
+        the new value in values.'''
+        def apply(node_id: Any, blob: bytes | None) -> bytes:
+            value = fn(default if blob is None else self._un_serialize(blob))
+            values[node_id] = value
+            return self._serialize(value)
+        return apply
+
+    def _compare_fn(self, version: str | None, new: bytes) -> Callable:
+        '''Returns the fn(key, blob) of _update for compare_and_set, which
+        replaces the blob with new only if it has the given version.'''
+        def apply(node_id: Any, blob: bytes | None) -> bytes | None:
+            return new if self._version(blob) == version else blob
+        return apply
+
+    @staticmethod
+    def _record_fn(fn: Callable, blobs: dict) -> Callable:
+        '''Returns fn(key, blob) recording the new blobs, for the keys _update
+        applies fn to in the database.'''
+        def apply(node_id: Any, blob: bytes | None) -> bytes | None:
+            blobs[node_id] = fn(node_id, blob)
+            return blobs[node_id]
+        return apply
+
+    def _cached_version(self, key: bytes | int) -> str | None:
+        '''Returns the version of a cached value, see version, or MISSING if
+        the key is not cached.'''
+        if key not in self.lru:
+            return MISSING
+        value = self.lru.peek(key)
+        return self._version(None if value is TOMBSTONE else self._unpack(value))
+
+    def _cached_size(self, key: bytes | int) -> int | None:
+        '''Returns the size of a cached serialized value, None for a tombstone,
+        or MISSING if the key is not cached.'''
+        if key not in self.lru:
+            return MISSING
+        value = self._unpack(self.lru.peek(key))
+        return None if value is TOMBSTONE else len(value)
+
+    def _delete_keys(self, key: str | list) -> list:
+        '''Encodes the key or list of keys of a delete and drops their objects.'''
+        keys = [self._encode_key(k) for k in (key if isinstance(key, list) else [key])]
+        for key in keys:
+            self.objects.discard(key)
+        self._touched(keys)
+        return keys
+
+    def _deleted(self, keys: list) -> None:
+        '''Publishes keys deleted from the database and drops them from the LRU.'''
+        self._publish({}, keys)
+        for key in keys:
+            self._dirty.pop(key, None)
+            try:
+                del self.lru[key]
+            except KeyError:
+                pass
+
+    def _bulk_rows(self, source: Any) -> Any:
+        '''Returns the (node_id, node) pairs of a bulk_load source, encoding and 
+        serializing the pairs unless they come from a dump file.'''
+        if is_dump(source):
+            return source
+        items = source.items() if isinstance(source, dict) else source
+        return ((self._encode_key(k), self._serialize(v)) for k, v in items)
+
+    def _dirty_matches(self, conditions: tuple) -> dict:
+        '''Returns the serialized values of the dirty keys whose cached values 
+        meet the query conditions. Tombstones never match.'''
+        found = {}
+        names = list(self.indexes)
+        for key in self._dirty:
+            value = self.lru.peek(key, MISSING)
+            if value is MISSING or value is TOMBSTONE:
+                continue
+            blob = self._unpack(value)
+            if matches(dict(zip(names, self.db.index_fields(blob))), conditions):
+                found[key] = blob
+        return found
+
+    def _query_results(self, blobs: list, conditions: tuple) -> dict:
+        '''Merges the rows a query matched in the database, less the dirty keys, 
+        with the matching dirty keys, see query.'''
+        results = {}
+        for node_id, node in blobs:
+            if node_id not in self._dirty:
+                obj = self.objects.get(node_id, MISSING) if node_id in self.lru else MISSING
+                results[self._decode_key(node_id)] = self._un_serialize(node) if obj is MISSING else obj
+        for key, blob in self._dirty_matches(conditions).items():
+            results[self._decode_key(key)] = self._load(key, blob)
+        return results
+
+    def _query_keys(self, node_ids: list, conditions: tuple) -> list:
+        '''Merges the keys a query matched in the database, less the dirty keys, 
+        with the matching dirty keys, see query_keys.'''
+        keys = [self._decode_key(k) for k in node_ids if k not in self._dirty]
+        keys.extend(self._decode_key(k) for k in self._dirty_matches(conditions))
+        return keys
+
+    def _update_cached(self, keys: list, fn: Callable) -> tuple:
+        '''Applies fn(key, blob) to the serialized values of the cached keys in 
+        place, with a blob of None for a tombstone. fn returns the blob it was 
+        given to leave the value unchanged. Returns the new blobs, the keys that 
+        are not cached, and the new values of large_value_threshold bytes or 
+        more, which go to the database instead of the LRU.'''
+        blobs, missing, large = {}, [], {}
+        for key in keys:
+            if key not in self.lru:
+                missing.append(key)
+                continue
+            value = self.lru[key]
+            blob = None if value is TOMBSTONE else self._unpack(value)
+            new = blobs[key] = fn(key, blob)
+            if new is blob:
+                continue
+            if self._is_large(new):
+                large[key] = new
+                continue
+            self._written(key)
+            self.lru[key] = self._pack(new)
+        return blobs, missing, large
+
+    def _updated(self, written: dict) -> None:
+        '''Publishes the values an update wrote to the database and drops clean 
+        cached copies of them, read by another call during the update.'''
+        self._publish(written, [])
+        self._touched(written)
+        for key in written:
+            if key in self.lru and key not in self._dirty:
+                del self.lru[key]
+                self.objects.discard(key)
+
+    @staticmethod
+    def _version(blob: bytes | None) -> str | None:
+        '''Returns the version of a serialized value, a blake2b hash of it.'''
+        return None if blob is None else hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+    def _clean(self, keys: Iterable) -> None:
+        '''Marks keys written to the database by a sync as clean, unless they 
+        were cached again while the sync was being written, by a write that 
+        the sync did not include.'''
+        for key in keys:
+            if key not in self.lru:
+                self._dirty.pop(key, None)
+
+    def _checkpoint_items(self, max_age: float | None, limit: int | None) -> dict:
+        '''Returns the cached values of the dirty keys first written at least 
+        max_age seconds ago, oldest first and at most limit of them.'''
+        if max_age is None:
+            max_age = self.checkpoint_age
+        deadline = time.monotonic() - max_age
+        items = {}
+        for key, since in self._dirty.items():
+            if since > deadline or len(items) == limit:
+                break
+            value = self.lru.peek(key, MISSING)
+            if value is not MISSING:
+                items[key] = value
+        return items
+
+    def _checkpointed(self, items: dict) -> None:
+        '''Marks checkpointed keys clean, unless they were written again while 
+        the checkpoint was being written.'''
+        for key, value in items.items():
+            if self.lru.peek(key, MISSING) is value:
+                self._dirty.pop(key, None)
+
+    def _check_hint(self, cache: Any) -> None:
+        '''Raises a ValueError for an unknown cache hint.'''
+        if cache not in CACHE_HINTS:
+            raise ValueError(f'unknown cache hint {cache!r}, expected one of {CACHE_HINTS}')
+
+    def _referenced(self, key: bytes | int) -> None:
+        '''Records a read hit or a write of a key in the admission filter.'''
+        if self.admission is not None:
+            self.admission.record(key)
+
+    def _should_cache(self, key: bytes | int, blob: bytes, cache: bool | str) -> bool:
+        '''Decides if a value read from the database is cached, by the cache 
+        hint of the read and the admission filter, which weighs the key against 
+        the least recently used key when the value would fill the LRU, and is 
+        then told of the miss. The filter is consulted when the LRU has room as 
+        well, with no victim, since a sync leaves part of it free and every 
+        scan would fill it. Returns True to cache the value like a write. A 
+        low-priority value is placed at the least recently used end here, 
+        without a sync, if the LRU has room.'''
+        if cache == LOW_PRIORITY:
+            admitted = False
+            self._admissions['low_priority' if self.lru.warm(key, self._pack(blob)) else 'uncached'] += 1
+        elif cache:
+            if self.admission is None:
+                admitted = True
+            else:
+                full = self.lru.count + 1 >= self.lru.maxlen
+                admitted = self.admission.admit(key, self.lru.oldest() if full else None)
+            self._admissions['admitted' if admitted else 'rejected'] += 1
+        else:
+            admitted = False
+            self._admissions['uncached'] += 1
+        self._referenced(key)
+        return admitted
+
+    def _evicted(self, keys: Iterable) -> None:
+        '''Demotes the keys evicted from the LRU out of the object cache too, 
+        which only holds objects of keys in the LRU.'''
+        for key in keys:
+            self.objects.discard(key)
+
+    def _load(self, key: bytes, value: Any) -> Any:
+        '''Unserializes a value cached in the LRU, from the object cache when it 
+        holds the key, otherwise the object is promoted to it.'''
+        obj = self.objects.get(key, MISSING) if self.objects.maxlen else MISSING
+        if obj is MISSING:
+            obj = self._un_serialize(self._unpack(value))
+            if value is not TOMBSTONE:
+                self.objects.put(key, obj)
+        return obj
+
+    def _pack(self, value: Any) -> Any:
+        '''Compresses a serialized value for the LRU with zlib at compress_level, 
+        when it is at least compress_min_size bytes and it gets smaller.'''
+        if not self.compress_level or value is TOMBSTONE or len(value) < self.compress_min_size:
+            return value
+        packed = zlib.compress(value, self.compress_level)
+        if len(packed) >= len(value):
+            return value
+        self._packed[0] += len(value)
+        self._packed[1] += len(packed)
+        return Compressed(packed)
+
+    def _unpack(self, value: Any) -> Any:
+        '''Returns the serialized value of an LRU entry, see _pack.'''
+        if type(value) is Compressed:
+            return zlib.decompress(value)
+        return value
+
+    def _is_large(self, value: bytes) -> bool:
+        '''Checks if a serialized value is too large for the LRU.'''
+        return self.large_value_threshold is not None and len(value) >= self.large_value_threshold
+
+    def _uncache(self, key: bytes) -> None:
+        '''Drops the cached value of a key written to the database directly.'''
+        self._touched([key])
+        self._dirty.pop(key, None)
+        self.objects.discard(key)
+        if key in self.lru:
+            del self.lru[key]
+        self._publish({}, [key])
+
+    def _slice(self, value: bytes, offset: int, size: int) -> bytes | None:
+        '''Byte range of a cached serialized value, see read_range.'''
+        if value is TOMBSTONE:
+            return None
+        return value[offset:None if size < 0 else offset + size]
+
+    def _hot_keys(self) -> list:
+        '''Returns the cached keys, less the tombstones, in recency order.'''
+        cache = self.lru.cache
+        return [k for k in self.lru.deck if cache[k] is not TOMBSTONE]
+
+    def _encode_key(self, key: str | int) -> bytes | int:
+        '''helper methods for encoding keys. With integer_keys, keys are ints and 
+        are used as they are.'''
+        if self.integer_keys:
+            if isinstance(key, int):
+                return key
+            raise TypeError(f'keys must be of type int with integer_keys. type={type(key)}')
         if isinstance(key, bytes):
             return key
         else:
             return key.encode(self.keyencoding)
     
-    def _decode_key(self, key: bytes) -> str:
+    def _decode_key(self, key: bytes | int) -> str | int:
         '''helper methods for decoding keys.'''
-        if isinstance(key, str):
+        if isinstance(key, (str, int)):
             return key
         else:
             return key.decode(self.keyencoding)
@@ -295,21 +1130,941 @@ class LRUDataBase:
             return f.getvalue()
     
     def _un_serialize(self, blob: bytes) -> Any:
-        '''helper methods for unserializing values.'''
-        if not isinstance(blob, bytes):
+        '''helper methods for unserializing values. A tombstone reads as None.'''
+        if blob is TOMBSTONE:
+            return None
+        elif not isinstance(blob, bytes):
             return blob
         else:
             f = BytesIO(blob)
             return Unpickler(f).load()      
         
+
+
+class SyncLRUDataBase(LRUDataBase):
+    '''The code is a Python class named SyncLRUDataBase, a synchronous variant 
+    of LRUDataBase backed by SyncDataBase (the standard library sqlite3 module). 
+    It shares the LRU cache, configuration and key and value codecs with 
+    LRUDataBase and has the same semantics, but every method is a plain call, 
+    so single threaded users skip the connection thread hop and event loop.
+
+    with SyncLRUDataBase('file_name', 'table_name') as shelf:
+        shelf.write('key', value)
+        for key in shelf: ...
+    '''
+
+    def __enter__(self):
+        '''Connects to the database, the with statement counterpart of __aenter__.'''
+        self.connect()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        '''Closes the connection, the with statement counterpart of __aexit__.'''
+        self.close()
+
+    def __iter__(self):
+        '''Iterates over the keys in the database and the LRU cache, the most 
+        recently used LRU keys first.'''
+        keys = self._with_cached_keys(self.node_keys())
+        while keys:
+            yield keys.pop()
+
+    def connect(self, database_path: str | None = None) -> None:
+        '''This method connects to the database and initializes the LRU cache. 
+        With warm_start enabled, the hot key list of the previous session is 
+        reloaded before returning. Only the sqlite backend has a synchronous 
+        database, other backend settings raise a ValueError.'''
+        if self.backend != 'sqlite':
+            raise ValueError(f'SyncLRUDataBase supports the "sqlite" backend only, backend="{self.backend}"')
+        self._open(SyncDataBase, database_path)
+        self.db.open_connection()
+        self.db.create()
+
+        self._reset()
+        if self.coherence:
+            self._log_seq, _ = self.db.changes(None)
+        self._open_shared()
+        if self.warm_start:
+            self._warm()
+
+    def _warm(self) -> int:
+        '''This method reloads the hot key list saved by flush_cache into the LRU 
+        in batches of warm_batch keys. Returns the number of keys loaded.'''
+        warmed = 0
+        for batch in self._warm_batches(self.db.read_hot_keys()):
+            loaded, full = self._warm_batch(batch, self.db.read(batch))
+            warmed += loaded
+            if full:
+                break
+
+        LOG.info(f'Warm start loaded {warmed} keys, shelve_name={self.table_name}')
+        return warmed
+
+    def write(self, key: str, value: Any) -> None:
+        '''This method writes to the LRU cache and syncs the oldest items to the 
+        database when the cache is full. Large values are written to the 
+        database directly, see LRUDataBase.write.'''
+        key, value = self._prepare_write(key, value)
+        if self._is_large(value):
+            self.db.write((key, value))
+            self._uncache(key)
+            return
+
+        self._written(key)
+        self._cache(key, value)
+
+    def _cache(self, key: bytes, value: Any) -> None:
+        '''Adds a serialized value to the LRU, see LRUDataBase._cache.'''
+        self.lru[key] = self._pack(value)
+
+        if self.lru.deck_full:
+            self.sync()
+
+    def read(self, key: str | list, cache: bool | str = True) -> Any | dict:
+        '''This method reads a value from the LRU cache or the database using a key. 
+        If the key is not found, it returns None. A list of keys returns a dict. 
+        See LRUDataBase.read for cache.'''
+        self._check_hint(cache)
+        if self.coherence:
+            self._poll_changes()
+
+        if isinstance(key, list):
+            return self._read_many(key, cache)
+
+        key = self._encode_key(key)
+        try:
+            value = self.lru[key]
+        except KeyError:
+            blob = self._db_read(key)
+            if blob is None:
+                return None
+            value, admitted = self._read_miss(blob, cache)
+            if admitted:
+                self._cache(key, blob.node)
+                self.objects.put(key, value)
+            return value
+        else:
+            self._referenced(key)
+            return self._load(key, value)
+
+    def _poll_changes(self) -> None:
+        '''Invalidates the keys changed by other connections, see 
+        LRUDataBase._poll_changes.'''
+        if not self._poll_due():
+            return
+        self._log_seq, changed = self.db.changes(self._log_seq)
+        self._invalidate(changed)
+
+    def _db_read(self, key: bytes | list) -> Any:
+        '''Reads from the shared tier, if enabled, and the database.'''
+        if self.shared is None:
+            return self.db.read(key)
+
+        hits, missing, stamps = self._shared_get(key)
+        blobs = self.db.read(missing) if missing else []
+        return self._shared_fill(key, hits, blobs, stamps)
+
+    def _read_many(self, keys: list, cache: bool | str = True) -> dict:
+        '''Reads a list of keys from the LRU and database. Returns a dictionary of
+        key, value pairs. If a key is not found, the value is None.'''
+        results, read_from_db = self._read_cached(keys)
+
+        if read_from_db:
+            for blob in self._db_read(read_from_db):
+                value, admitted = self._read_miss(blob, cache)
+                if admitted:
+                    self._cache(blob.node_id, blob.node)
+                    self.objects.put(blob.node_id, value)
+                results[self._decode_key(blob.node_id)] = value
+
+        return results
+
+    def get(self, key: str, default: Any = None, cache: bool | str = True) -> Any:
+        '''Returns the unserialized value of the key. If not in the 
+        database or LRU, returns default. See read for cache.'''
+        results = self.read(key, cache)
+        if results is None:
+            return default
+        return results
+
+    def update(self, key: str | int, fn: Callable, default: Any = None) -> Any:
+        '''This method replaces the value of a key with fn(value), see 
+        LRUDataBase.update.'''
+        return self.update_many([key], fn, default)[key]
+
+    def update_many(self, keys: list, fn: Callable, default: Any = None) -> dict:
+        '''This method replaces the values of keys with fn(value), see 
+        LRUDataBase.update_many.'''
+        values = {}
+        self._update([self._encode_key(k) for k in keys], self._apply_fn(fn, default, values))
+        return {key: values[self._encode_key(key)] for key in keys}
+
+    def version(self, key: str | int) -> str | None:
+        '''This method returns the version of the value of a key, see 
+        LRUDataBase.version.'''
+        if self.coherence:
+            self._poll_changes()
+        _key = self._encode_key(key)
+        version = self._cached_version(_key)
+        if version is not MISSING:
+            return version
+        blob = self.db.read(_key)
+        return self._version(None if blob is None else blob.node)
+
+    def compare_and_set(self, key: str | int, version: str | None, value: Any) -> bool:
+        '''This method writes value only if the stored value has the given 
+        version, see LRUDataBase.compare_and_set.'''
+        new = self._serialize(value)
+        _key = self._encode_key(key)
+        return self._update([_key], self._compare_fn(version, new))[_key] is new
+
+    def _update(self, keys: list, fn: Callable) -> dict:
+        '''Applies fn(key, blob) to serialized values, see LRUDataBase._update.'''
+        if self.coherence:
+            self._poll_changes()
+        blobs, missing, large = self._update_cached(keys, fn)
+        if large:
+            self.db.write(large)
+            for key in large:
+                self._uncache(key)
+        if missing:
+            self._updated(self.db.update(missing, self._record_fn(fn, blobs)))
+        if self.lru.deck_full:
+            self.sync()
+        return blobs
+
+    def query(self, *conditions: tuple) -> dict:
+        '''This method returns the keys and values whose indexed fields meet the 
+        conditions. See LRUDataBase.query.'''
+        if self.coherence:
+            self._poll_changes()
+        return self._query_results(self.db.query(list(conditions)), conditions)
+
+    def query_keys(self, *conditions: tuple) -> list:
+        '''This method returns the keys whose indexed fields meet the conditions. 
+        See LRUDataBase.query_keys.'''
+        if self.coherence:
+            self._poll_changes()
+        return self._query_keys(self.db.query(list(conditions), keys_only=True), conditions)
+
+    def read_range(self, key: str, offset: int = 0, size: int = -1) -> bytes | None:
+        '''This method reads a byte range of the stored value of a key, see 
+        LRUDataBase.read_range.'''
+        if self.coherence:
+            self._poll_changes()
+
+        key = self._encode_key(key)
+        if key in self.lru:
+            return self._slice(self._unpack(self.lru[key]), offset, size)
+        return self.db.read_range(key, offset, size)
+
+    def read_stream(self, key: str) -> Iterator[bytes]:
+        '''This method yields the stored bytes of a key in chunks, see 
+        LRUDataBase.read_stream.'''
+        _key = self._encode_key(key)
+        size = self._cached_size(_key)
+        if size is MISSING:
+            size = self.db.blob_size(_key)
+        if size is None:
+            return
+
+        for offset in range(0, size, self.stream_chunk_size):
+            yield self.read_range(key, offset, self.stream_chunk_size)
+
+    def write_stream(self, key: str, source: Any, size: int) -> None:
+        '''This method writes a value in chunks straight to the database, see 
+        LRUDataBase.write_stream.'''
+        key = self._encode_key(key)
+        self.db.write_stream(key, source, size, self.stream_chunk_size)
+        self._uncache(key)
+
+    def bulk_load(self, source: Any, batch_size: int | None = None) -> int:
+        '''This method loads pairs straight into the database, see 
+        LRUDataBase.bulk_load.'''
+        self.flush_cache()
+        if self.shared is not None:
+            self.shared.clear()
+        return self.db.bulk_load(self._bulk_rows(source), batch_size)
+
+    def export(self, dest: Any) -> int:
+        '''This method writes the stored values to a dump file, see 
+        LRUDataBase.export.'''
+        self.checkpoint(max_age=0)
+        return self.db.export(dest)
+
+    def backup(self, dest: Any, pages: int | None = None, sleep: float | None = None) -> dict:
+        '''This method copies the database file to dest, see 
+        LRUDataBase.backup. The copy runs on the calling thread.'''
+        self._require('backup', 'backup')
+        checkpointed = self.checkpoint(max_age=0)
+        if self.warm_start:
+            self.db.write_hot_keys(self._hot_keys())
+        stats = self.db.backup(dest, pages, sleep)
+        return {**stats, 'checkpointed': checkpointed}
+
+    def node_keys(self) -> list:
+        '''Retrieves all the keys from the database, less the keys with a 
+        pending deferred delete.'''
+        tombstones = self._tombstones()
+        return [self._decode_key(key) for key in self.db.node_keys() if self._encode_key(key) not in tombstones]
+
+    def delete(self, key: str | list) -> None:
+        '''This method deletes a key-value pair, or a list of keys, from the 
+        database and the LRU cache, or caches tombstones with deferred_deletes. 
+        See LRUDataBase.delete.'''
+        keys = self._delete_keys(key)
+        if self.deferred_deletes:
+            for key in keys:
+                self._written(key)
+                self._cache(key, TOMBSTONE)
+            return
+
+        self.db.delete_node(keys if len(keys) > 1 else keys[0])
+        self._deleted(keys)
+
+    def flush_cache(self) -> None:
+        '''This method flushes the LRU cache to the database, saving the hot key 
+        list when warm_start is enabled.'''
+        try:
+            values, deletes, hot_keys = self._flush_writes()
+            self.db.write(values, hot_keys=hot_keys, deletes=deletes)
+            self._flushed(values, deletes)
+        except Exception as error:
+            LOG.exception(f'flush_cache: {error}')
+            raise
+
+    def sync(self) -> None:
+        '''This method offloads old items from the LRU cache to the database.'''
+        try:
+            sync_store, values, deletes = self._sync_writes()
+            start = time.perf_counter()
+            self.db.write(values, deletes=deletes)
+            self._synced(sync_store, values, deletes, time.perf_counter() - start)
+        except Exception as error:
+            LOG.exception(f'sync: {error}')
+            raise
+        else:
+            LOG.info(f'Sync offloaded old cached items to the database, shelve_name={self.table_name}, count={len(sync_store)}')
+
+    def checkpoint(self, max_age: float | None = None, limit: int | None = None) -> int:
+        '''This method writes the dirty keys older than max_age to the database, 
+        see LRUDataBase.checkpoint. There is no background checkpointer, call it 
+        periodically instead.'''
+        items = self._checkpoint_items(max_age, limit)
+        if not items:
+            return 0
+        try:
+            values, deletes = self._pending_writes(items)
+            self.db.write(values, deletes=deletes)
+            self._publish(values, deletes)
+            self._checkpointed(items)
+        except Exception as error:
+            LOG.exception(f'checkpoint: {error}')
+            raise
+        else:
+            LOG.debug(f'Checkpoint wrote {len(items)} dirty keys, shelve_name={self.table_name}')
+        return len(items)
+
+    def close(self) -> None:
+        '''This method flushes the cache to the database and 
+        closes the database connection.'''
+        try:
+            self.flush_cache()
+            self.db.close()
+            if self.shared is not None:
+                self.shared.close()
+        except Exception as error:
+            LOG.exception(f'close: {error}')
+            raise
+        else:
+            self.lru = None
+            self.db = None
+            self.shared = None
+            LOG.info(f'Closed SyncLRUDataBase table: {self.table_name}')
+
+
+async def _test_warm_start(lru_configs: dict) -> bool:
+    '''Closes a shelf with a hot set and checks that the next connect reloads 
+    it in recency order, without replacing keys written in the meantime.'''
+    shelf = LRUDataBase('test_warm_database', 'test_case', configs=lru_configs)
+    await shelf.connect()
+    try:
+        for i in range(5):
+            await shelf.write(f'key{i}', i)
+        await shelf.read('key0')
+        await shelf.close()
+
+        await shelf.connect()
+        await shelf.write('key4', 'new')
+        await shelf._warm_task
+
+        assert list(shelf.lru.deck) == [b'key1', b'key2', b'key3', b'key0', b'key4'], f'warm start order failed: {shelf.lru.deck}'
+        assert await shelf.read('key4') == 'new', 'warm start replaced a newer value'
+        assert await shelf.read('key2') == 2, 'warm start value failed'
+    finally:
+        database_path = shelf.db.database_path
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_warm_race() -> bool:
+    '''Writes a key and syncs it out of the LRU while warm start is reading its 
+    old value, and checks that the old value is not reloaded.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 6, 'sync_fraction': 0.5}, 'LRU_db': {'warm_start': True}})
+    shelf = LRUDataBase('test_warm_race', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        await shelf.write('k', 'old')
+        await shelf.close()
+
+        await shelf.connect()
+        db_read = shelf.db.read
+
+        async def read(keys: list) -> list:
+            blobs = await db_read(keys)
+            if keys == [b'k']:
+                await shelf.write('k', 'new')
+                for i in range(5):
+                    await shelf.write(f'fill{i}', i)
+                assert b'k' not in shelf.lru, 'the write of k was not synced'
+            return blobs
+
+        shelf.db.read = read
+        await shelf._warm_task
+        shelf.db.read = db_read
+        assert await shelf.read('k') == 'new', 'warm start reloaded a value written meanwhile'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_integer_keys() -> bool:
+    '''Runs a shelf keyed by ints through the LRU and an INTEGER PRIMARY KEY 
+    table, and checks that string keys and a text keyed table are refused.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 6}, 'LRU_db': {'integer_keys': True}})
+    shelf = LRUDataBase('test_integer_keys', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        for i in range(10):
+            await shelf.write(i, f'value{i}')
+        assert await shelf.read(0) == 'value0', 'integer key read from the database failed'
+        assert await shelf.read([1, 9, 100]) == {1: 'value1', 9: 'value9', 100: None}, 'integer key read_many failed'
+        await shelf.delete(2)
+        assert sorted([k async for k in shelf]) == [i for i in range(10) if i != 2], 'integer key iteration failed'
+
+        try:
+            await shelf.write('key0', 0)
+        except TypeError:
+            pass
+        else:
+            raise AssertionError('string key was accepted with integer_keys')
+
+        await shelf.close()
+        await shelf.connect()
+        await shelf._warm_task
+        assert 9 in shelf.lru and await shelf.read(9) == 'value9', 'integer key warm start failed'
+    finally:
+        await shelf.close()
+
+    text = LRUDataBase('test_integer_keys', 'test_case', configs=Configs())
+    try:
+        await text.connect()
+    except ValueError:
+        await text.db.close()
+    else:
+        await text.close()
+        raise AssertionError('text keys were accepted on an integer keyed table')
+    finally:
+        database_path.unlink()
+    return True
+
+
+async def _test_large_values() -> bool:
+    '''Writes values above large_value_threshold, with write and write_stream, 
+    and checks that they bypass the LRU and read back whole and in ranges.'''
+    import numpy as np
+
+    configs = Configs(overrides={'LRU_db': {'large_value_threshold': 1000, 'stream_chunk_size': 256}})
+    shelf = LRUDataBase('test_large_values', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        array = np.arange(1000, dtype=np.float64)
+        await shelf.write('small', 'value')
+        await shelf.write('array', array)
+        assert b'array' not in shelf.lru and b'small' in shelf.lru, 'large value was cached'
+        assert np.array_equal(await shelf.read('array'), array), 'large value read failed'
+        assert b'array' not in shelf.lru, 'large value read was cached'
+
+        # A cached value is dropped when a stream replaces it
+        data = bytes(range(256)) * 20
+        await shelf.write('small', 'cached')
+        await shelf.write_stream('small', BytesIO(data), len(data))
+        assert b'small' not in shelf.lru, 'stream did not drop the cached value'
+        assert await shelf.read_range('small', 250, 10) == data[250:260], 'read_range failed'
+        chunks = [chunk async for chunk in shelf.read_stream('small')]
+        assert b''.join(chunks) == data and max(map(len, chunks)) == 256, 'read_stream failed'
+        assert await shelf.read_range('nokey') is None, 'read_range of a missing key failed'
+
+        # Ranges of cached values come from the LRU
+        await shelf.write('cached', 'value')
+        assert await shelf.read_range('cached') == shelf._serialize('value'), 'cached read_range failed'
+        hits, oldest = shelf.lru.hits, shelf.lru.oldest()
+        assert shelf._cached_size(b'cached') == len(shelf._serialize('value')), 'cached size failed'
+        assert (shelf.lru.hits, shelf.lru.oldest()) == (hits, oldest), 'cached size counted a reference'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_tiers() -> bool:
+    '''Enables the object cache and compression, and checks that repeated 
+    reads return the cached object, that writes invalidate it, and that values 
+    are compressed in the LRU but not in the database.'''
+    configs = Configs(overrides={
+        'LRU': {'maxlen': 4, 'sync_fraction': 0.5},
+        'LRU_db': {'object_cache_size': 2, 'compress_level': 6, 'compress_min_size': 64}})
+    shelf = LRUDataBase('test_tiers', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        value = {'text': 'abc' * 200, 'list': list(range(10))}
+        await shelf.write('key', value)
+        assert type(shelf.lru[b'key']) is Compressed, 'value was not compressed in the LRU'
+        first = await shelf.read('key')
+        assert first == value and await shelf.read('key') is first, 'object cache hit failed'
+
+        await shelf.write('key', {'new': 1})
+        assert await shelf.read('key') == {'new': 1}, 'write did not invalidate the object cache'
+        await shelf.write('short', 'x')
+        assert type(shelf.lru[b'short']) is bytes, 'short value was compressed'
+
+        # Evicted values are written to the database uncompressed
+        await shelf.write('big', value)
+        for i in range(8):
+            await shelf.write(f'key{i}', i)
+        assert b'big' not in shelf.lru and b'big' not in shelf.objects, 'big was not evicted'
+        assert (await shelf.db.read(b'big')).node == shelf._serialize(value), 'database value was compressed'
+        assert await shelf.read('big') == value, 'read of an evicted value failed'
+
+        stats = shelf.stats()
+        assert stats['objects']['hits'] >= 1 and stats['compression']['ratio'] > 1, f'stats failed: {stats}'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_checkpoint() -> bool:
+    '''Runs the background checkpointer and checks that old dirty keys reach 
+    the database in batches while they stay cached, and that a key written 
+    again during a checkpoint stays dirty.'''
+    configs = Configs(overrides={'LRU_db': {
+        'checkpoint_interval': 0.01, 'checkpoint_age': 0.05, 'checkpoint_batch': 2, 'warm_start': False}})
+    shelf = LRUDataBase('test_checkpoint', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        for i in range(5):
+            await shelf.write(f'key{i}', i)
+        assert shelf.stats()['dirty'] == 5, 'writes were not dirty'
+        for _ in range(100):
+            if not shelf._dirty:
+                break
+            await asyncio.sleep(0.01)
+        assert not shelf._dirty, f'checkpointer left dirty keys: {shelf._dirty}'
+        assert len(await shelf.db.node_keys()) == 5 and b'key4' in shelf.lru, 'checkpoint failed'
+        assert shelf.lru.count == 5, 'checkpoint evicted keys'
+
+        # A write racing a checkpoint keeps the key dirty
+        shelf._checkpoint_task.cancel()
+        await shelf.write('key0', 'new')
+        items = shelf._checkpoint_items(0, None)
+        await shelf.write('key0', 'newer')
+        shelf._checkpointed(items)
+        assert b'key0' in shelf._dirty, 'rewritten key was marked clean'
+        assert await shelf.checkpoint(max_age=0) == 1 and not shelf._dirty, 'checkpoint failed'
+        assert shelf._un_serialize((await shelf.db.read(b'key0')).node) == 'newer', 'checkpoint wrote a stale value'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_sync_race() -> bool:
+    '''Writes a key evicted by a sync while the sync is being written, and 
+    checks that the new value stays dirty and reaches the database.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 4}, 'LRU_db': {'warm_start': False}})
+    shelf = LRUDataBase('test_sync_race', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        for i in range(3):
+            await shelf.write(f'key{i}', 'old')
+        await asyncio.gather(shelf.write('key3', 'x'), shelf.write('key0', 'new'))
+        assert b'key0' in shelf._dirty, 'write during a sync was marked clean'
+        await shelf.close()
+        await shelf.connect()
+        assert await shelf.read('key0') == 'new', 'write during a sync was lost'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_compact_index() -> bool:
+    '''Runs a shelf on CompactLRU, with tombstones and compressed values in 
+    the cache, and checks the values after evictions and a reconnect.'''
+    configs = Configs(overrides={
+        'LRU': {'maxlen': 8, 'sync_fraction': 0.5},
+        'LRU_db': {'lru_index': 'compact', 'deferred_deletes': True, 'compress_level': 6, 'compress_min_size': 64}})
+    shelf = LRUDataBase('test_compact_index', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    expected = {}
+    try:
+        for i in range(60):
+            key, value = f'key{i % 20}', [i] * (i % 40)
+            await shelf.write(key, value)
+            expected[key] = value
+            if i % 7 == 0:
+                await shelf.delete(f'key{(i * 3) % 20}')
+                expected.pop(f'key{(i * 3) % 20}', None)
+        assert type(shelf.lru).__name__ == 'CompactLRU', 'lru_index was ignored'
+        assert await shelf.read(list(expected)) == expected, 'compact index read failed'
+
+        await shelf.close()
+        await shelf.connect()
+        assert sorted(await shelf.node_keys()) == sorted(expected), 'compact index keys failed'
+        assert await shelf.read(list(expected)) == expected, 'compact index read after reconnect failed'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_bulk() -> bool:
+    '''Bulk loads pairs over cached and unsynced keys, exports the table and 
+    loads the dump into another shelf, on the SQLite and bitcask backends.'''
+    import shutil
+
+    for backend in ('sqlite', 'bitcask'):
+        configs = Configs(overrides={'LRU_db': {'backend': backend}})
+        shelf = LRUDataBase('test_bulk', 'test_case', configs=configs)
+        other = LRUDataBase('test_bulk_copy', 'test_case', configs=configs)
+        await shelf.connect()
+        await other.connect()
+        try:
+            await shelf.write('key1', 'cached')
+            await shelf.write('kept', 'unsynced')
+            count = await shelf.bulk_load(((f'key{i}', [i]) for i in range(100)), batch_size=30)
+            assert count == 100 and len(shelf.lru) == 0, 'bulk_load failed'
+            assert await shelf.read('key1') == [1] and await shelf.read('kept') == 'unsynced', 'bulk_load read failed'
+
+            await shelf.write('late', 'unsynced')
+            dump = BytesIO()
+            assert await shelf.export(dump) == 102, 'export failed'
+            dump.seek(0)
+            assert await other.bulk_load(dump) == 102, 'dump load failed'
+            assert await other.read(['key99', 'late']) == {'key99': [99], 'late': 'unsynced'}, 'dump read failed'
+        finally:
+            for db in (shelf, other):
+                path = db.db.database_path
+                await db.close()
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+    return True
+
+
+async def _test_update() -> bool:
+    '''Updates cached and uncached keys, concurrently, and checks 
+    compare_and_set against the versions of the values.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 4, 'sync_fraction': 0.5}, 'LRU_db': {'warm_start': False}})
+    shelf = LRUDataBase('test_update', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        assert await shelf.update('count', lambda x: x + 1, default=0) == 1, 'update of a missing key failed'
+        assert b'count' not in shelf.lru, 'update admitted an uncached key'
+        await shelf.write('cached', 10)
+        assert await shelf.update('cached', lambda x: x * 2) == 20 and b'cached' in shelf._dirty, 'cached update failed'
+
+        # Concurrent increments of a cached and an uncached key are not lost
+        await asyncio.gather(*(shelf.update(key, lambda x: x + 1) for _ in range(20) for key in ('count', 'cached')))
+        assert await shelf.read(['count', 'cached']) == {'count': 21, 'cached': 40}, 'concurrent updates were lost'
+        values = await shelf.update_many(['a', 'count', 'a'], lambda x: (x or 0) + 1)
+        assert values == {'a': 2, 'count': 22}, f'update_many failed: {values}'
+
+        # Versions are hashes of the serialized values
+        version = await shelf.version('count')
+        assert await shelf.version('missing') is None, 'version of a missing key failed'
+        assert await shelf.compare_and_set('count', version, 100), 'compare_and_set failed'
+        assert not await shelf.compare_and_set('count', version, 200), 'stale compare_and_set was written'
+        assert await shelf.compare_and_set('new', None, 'created'), 'compare_and_set of a missing key failed'
+        assert not await shelf.compare_and_set('new', None, 'again'), 'compare_and_set overwrote a key'
+        assert await shelf.read(['count', 'new']) == {'count': 100, 'new': 'created'}, 'compare_and_set read failed'
+        for i in range(8):
+            await shelf.write(f'key{i}', i)
+        assert b'count' not in shelf.lru and await shelf.version('count') == shelf._version(shelf._serialize(100)), 'evicted version failed'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_indexes() -> bool:
+    '''Queries indexed fields of values in the database and in the LRU, with 
+    dirty cached values that differ from their rows, and adds an index to an 
+    existing table.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 6, 'sync_fraction': 0.5}, 'LRU_db': {'warm_start': False}})
+    indexes = {'x': lambda v: v['x'], 'kind': lambda v: v['kind']}
+    shelf = LRUDataBase('test_indexes', 'test_case', configs=configs, indexes=indexes)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        for i in range(20):
+            await shelf.write(f'e{i}', {'x': i / 10, 'kind': 'a' if i % 2 else 'b'})
+        assert any(k in shelf._dirty for k in (b'e16', b'e17', b'e18', b'e19')), 'no dirty key to query'
+        assert await shelf.query(('x', '>', 1.55)) == {f'e{i}': {'x': i / 10, 'kind': 'a' if i % 2 else 'b'} for i in range(16, 20)}, 'query failed'
+
+        # Dirty values override their stale rows, in both directions
+        await shelf.write('e2', {'x': 5.0, 'kind': 'c'})
+        await shelf.write('e19', {'x': 0.0, 'kind': 'c'})
+        await shelf.delete('e18')
+        assert sorted(await shelf.query_keys(('x', '>', 1.55))) == ['e16', 'e17', 'e2'], 'dirty query failed'
+        keys = await shelf.query_keys(('kind', 'in', ['a', 'c']), ('x', '<', 0.35))
+        assert sorted(keys) == ['e1', 'e19', 'e3'], f'query with two conditions failed: {keys}'
+        assert await shelf.query(('kind', '==', 'c'), ('x', '>=', 5)) == {'e2': {'x': 5.0, 'kind': 'c'}}, 'query values failed'
+
+        # Streamed values are not indexed, and have NULL fields
+        await shelf.write_stream('stream', [b'not a pickle'], 12)
+        assert await shelf.query_keys(('x', '==', None)) == ['stream'], 'NULL query failed'
+        assert 'stream' not in await shelf.query_keys(('x', '!=', 1)), 'NULL field matched !='
+        try:
+            await shelf.query(('y', '==', 1))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('query of an unknown index did not raise')
+    finally:
+        await shelf.close()
+
+    # An index added to an existing table is filled from the stored values
+    indexes['half'] = lambda v: v['x'] >= 1
+    with SyncLRUDataBase('test_indexes', 'test_case', configs=configs, indexes=indexes) as shelf:
+        assert len(shelf.query_keys(('half', '==', True))) == 9, 'added index failed'
+        shelf.write('e0', {'x': 3.0, 'kind': 'b'})
+        assert shelf.query(('half', '==', 1), ('kind', '==', 'b')) == {f'e{i}': {'x': i / 10, 'kind': 'b'} for i in (10, 12, 14, 16)} | {'e0': {'x': 3.0, 'kind': 'b'}}, 'sync query failed'
+    database_path.unlink()
+    return True
+
+
+async def _test_admission() -> bool:
+    '''Scans the table with and without cache hints and checks that the hot 
+    keys stay cached under the TinyLFU admission filter.'''
+    configs = Configs(overrides={
+        'LRU': {'maxlen': 10, 'sync_fraction': 0.5}, 
+        'LRU_db': {'warm_start': False, 'admission_filter': 'tinylfu'}})
+    shelf = LRUDataBase('test_admission', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        await shelf.bulk_load({f'key{i}': i for i in range(40)})
+        hot = [f'key{i}' for i in range(8)]
+        for _ in range(5):
+            await shelf.read(hot)
+
+        # A scan of every key is served without evicting the hot keys
+        assert await shelf.read([f'key{i}' for i in range(40)]) == {f'key{i}': i for i in range(40)}, 'scan read failed'
+        assert all(shelf._encode_key(k) in shelf.lru for k in hot), 'scan evicted hot keys'
+        admission = shelf.stats()['admission']
+        assert admission['rejected'] >= 30 and admission['filter'] == 'TinyLFU', f'admission stats failed: {admission}'
+
+        # Uncached and low-priority reads
+        assert await shelf.read('key30', cache=False) == 30 and b'key30' not in shelf.lru, 'uncached read was cached'
+        room = shelf.lru.count < shelf.lru.maxlen - 1
+        assert await shelf.get('key31', cache=LOW_PRIORITY) == 31, 'low-priority get failed'
+        assert (b'key31' in shelf.lru) == room and not shelf.lru.deck_full, 'low-priority read filled the LRU'
+        await shelf.flush_cache()
+        assert await shelf.read(['key32', 'key33'], cache=LOW_PRIORITY) == {'key32': 32, 'key33': 33}, 'low-priority read failed'
+        assert shelf.lru.oldest() == b'key33' and shelf.lru.count == 2, 'low-priority read was not cached at the cold end'
+        assert shelf.stats()['admission']['low_priority'] == 2 + room, 'low-priority stats failed'
+        try:
+            await shelf.read('key0', cache='never')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('unknown cache hint was accepted')
+    finally:
+        await shelf.close()
+
+    with SyncLRUDataBase('test_admission', 'test_case', configs=configs) as shelf:
+        assert shelf.read('key5', cache=False) == 5 and b'key5' not in shelf.lru, 'sync uncached read was cached'
+        # With room in the LRU, a key is admitted on its third reference
+        for _ in range(2):
+            assert shelf.read(['key6']) == {'key6': 6} and b'key6' not in shelf.lru, 'sync read admitted a new key'
+        assert shelf.read(['key6']) == {'key6': 6} and b'key6' in shelf.lru, 'sync read failed'
+        admission = shelf.stats()['admission']
+        assert (admission['uncached'], admission['rejected'], admission['admitted']) == (1, 2, 1), f'sync admission stats failed: {admission}'
+    database_path.unlink()
+    return True
+
+
+async def _test_backup() -> bool:
+    '''Backs up a shelf with dirty keys while a task writes to it, and opens 
+    the copy with the async and sync front ends.'''
+    configs = Configs(overrides={
+        'LRU': {'maxlen': 20, 'sync_fraction': 0.5}, 
+        'LRU_db': {'warm_start': True}})
+    shelf = LRUDataBase('test_backup', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    dest = database_path.with_name('test_backup_copy.db')
+    try:
+        for i in range(30):
+            await shelf.write(f'key{i}', [i])
+
+        async def writer() -> None:
+            for i in range(30, 60):
+                await shelf.write(f'key{i}', [i])
+                await asyncio.sleep(0)
+
+        stats, _ = await asyncio.gather(shelf.backup(dest, pages=1, sleep=0.001), writer())
+        assert stats['checkpointed'] > 0 and stats['steps'] >= stats['pages'] > 1, f'backup stats failed: {stats}'
+        await shelf.close()
+
+        copy = LRUDataBase('test_backup_copy', 'test_case', configs=configs)
+        await copy.connect()
+        try:
+            assert await copy.read([f'key{i}' for i in range(30)]) == {f'key{i}': [i] for i in range(30)}, 'backup copy failed'
+            assert await copy.db.read_hot_keys(), 'backup hot keys failed'
+        finally:
+            await copy.close()
+
+        with SyncLRUDataBase('test_backup', 'test_case', configs=configs) as sync_shelf:
+            sync_shelf.write('key0', 'sync')
+            assert sync_shelf.backup(dest)['checkpointed'] == 1, 'sync backup failed'
+        with SyncLRUDataBase('test_backup_copy', 'test_case', configs=configs) as sync_copy:
+            assert sync_copy.read(['key0', 'key59']) == {'key0': 'sync', 'key59': [59]}, 'sync backup copy failed'
+    finally:
+        database_path.unlink()
+        dest.unlink(missing_ok=True)
+    return True
+
+
+async def _test_coherence() -> bool:
+    '''Opens two shelves on one file with coherence enabled and checks that 
+    each sees the other's writes and deletes, and that evicting a clean copy 
+    does not overwrite the other shelf's write.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 4}, 'LRU_db': {'coherence': True}})
+    a = LRUDataBase('test_coherence', 'test_case', configs=configs)
+    b = LRUDataBase('test_coherence', 'test_case', configs=configs)
+    await a.connect()
+    await b.connect()
+    database_path = a.db.database_path
+    try:
+        await a.write('key0', 'a0')
+        await a.flush_cache()
+        assert await b.read('key0') == 'a0', 'read of the other shelf write failed'
+
+        # b holds a clean copy of key0, a overwrites it
+        await a.write('key0', 'a1')
+        await a.flush_cache()
+        assert await b.read('key0') == 'a1', 'stale cached value was not invalidated'
+
+        # b caches key0 again, a overwrites it, b evicts its copy
+        await a.write('key0', 'a2')
+        await a.flush_cache()
+        for i in range(1, 8):
+            await b.write(f'key{i}', f'b{i}')
+        assert b'key0' not in b.lru, 'key0 was not evicted'
+        assert await a.read('key0') == 'a2', 'evicted clean copy overwrote the other shelf write'
+
+        await b.flush_cache()
+        await b.delete('key1')
+        assert await a.read('key1') is None and await a.read('key2') == 'b2', 'delete was not seen'
+    finally:
+        await a.close()
+        await b.close()
+        database_path.unlink()
+    return True
+
+
+async def _test_deferred_deletes() -> bool:
+    '''Deletes keys in the LRU and in the database with deferred_deletes and 
+    checks that reads and iteration see them as deleted before and after the 
+    tombstones are flushed.'''
+    configs = Configs(overrides={'LRU': {'maxlen': 6}, 'LRU_db': {'deferred_deletes': True}})
+    shelf = LRUDataBase('test_deferred_deletes', 'test_case', configs=configs)
+    await shelf.connect()
+    database_path = shelf.db.database_path
+    try:
+        for i in range(10):
+            await shelf.write(f'key{i}', i)
+        on_disk = len(await shelf.db.node_keys())
+
+        # key0 is in the database, key9 in the LRU
+        await shelf.delete(['key0', 'key9'])
+        await shelf.delete('key8')
+        assert len(await shelf.db.node_keys()) == on_disk, 'deletes were not deferred'
+        assert await shelf.read('key0') is None and await shelf.get('key9', 'NO KEY') == 'NO KEY', 'tombstone read failed'
+        assert (await shelf.read(['key0', 'key1']))['key0'] is None, 'tombstone read_many failed'
+        expected = sorted(f'key{i}' for i in range(1, 8))
+        assert sorted([k async for k in shelf]) == expected, 'tombstone iteration failed'
+
+        # Writing a deleted key replaces the tombstone
+        await shelf.write('key8', 'new')
+        await shelf.close()
+        await shelf.connect()
+        assert sorted(await shelf.node_keys()) == sorted(expected + ['key8']), 'tombstones were not flushed'
+        assert await shelf.read('key8') == 'new', 'write after delete failed'
+    finally:
+        await shelf.close()
+        database_path.unlink()
+    return True
+
+
+def _test_sync_shelf(lru_configs: dict) -> bool:
+    '''Runs a short workload through SyncLRUDataBase with a small cache.'''
+    with SyncLRUDataBase('test_sync_database', 'test_case', configs=lru_configs) as shelf:
+        database_path = shelf.db.database_path
+        shelf.lru._create_empty_deck(4)
+        for i in range(10):
+            shelf.write(f'key{i}', i)
+
+        assert shelf.read('key0') == 0, 'sync read from database failed'
+        assert shelf.read(['key1', 'key9', 'nokey']) == {'key1': 1, 'key9': 9, 'nokey': None}, 'sync read_many failed'
+        shelf.delete('key1')
+        assert shelf.get('key1', 'NO KEY') == 'NO KEY', 'sync delete failed'
+        assert sorted(shelf) == sorted(f'key{i}' for i in range(10) if i != 1), 'sync iteration failed'
+        assert shelf.update('key0', lambda x: x + 1) == 1, 'sync update failed'
+        assert shelf.update_many(['key2', 'key9'], lambda x: x * 10) == {'key2': 20, 'key9': 90}, 'sync update_many failed'
+        version = shelf.version('key2')
+        assert shelf.compare_and_set('key2', version, 0) and not shelf.compare_and_set('key2', version, 1), 'sync compare_and_set failed'
+        assert shelf.read('key2') == 0, 'sync compare_and_set read failed'
+    database_path.unlink()
+
+    shelf = SyncLRUDataBase('test_sync_database', 'test_case', configs=Configs(overrides={'LRU_db': {'backend': 'bitcask'}}))
+    try:
+        shelf.connect()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('sync shelf accepted the bitcask backend')
+    return True
+
     
-async def test(db_size:int = 10, app_configs: dict = CONFIGS, lru_configs: dict = LRU_CONFIGS, verbose: bool = False) -> bool:
+async def test(db_size:int = 10, lru_configs: Configs | dict | None = None, verbose: bool = False) -> bool:
     import hashlib
     from pathlib import Path
 
-    CWD = app_configs['CWD']
-    test_database = CWD + 'database/zkp_test_db.db'
-
     try:
         # Test data
         data = {}
@@ -325,6 +2080,12 @@ async def test(db_size:int = 10, app_configs: dict = CONFIGS, lru_configs: dict
 
         # Test the LRU
         assert LRU_test(), 'LRU test failed'
+
+        # Test the synchronous front end
+        assert SyncDataBase_test(), 'SyncDataBase test failed'
+        assert await DataBaseProfiles_test(), 'storage profile test failed'
+        assert await DataBaseBackup_test(), 'backup test failed'
+        assert _test_sync_shelf(lru_configs), 'SyncLRUDataBase test failed'
         
         # Test the LRUDataBase
         shelf = LRUDataBase('test_database', 'test_case', configs=lru_configs)
@@ -415,6 +2176,51 @@ async def test(db_size:int = 10, app_configs: dict = CONFIGS, lru_configs: dict
         get = await shelf.get('key0', 'NO KEY')
         assert get == 'NO KEY', f'get failed: {get}'
 
+        # Test warm start
+        assert await _test_warm_start(lru_configs), 'warm start failed'
+        assert await _test_warm_race(), 'warm start race failed'
+
+        # Test deferred deletes
+        assert await _test_deferred_deletes(), 'deferred deletes failed'
+
+        # Test integer keyed tables
+        assert await _test_integer_keys(), 'integer keys failed'
+
+        # Test values that bypass the LRU and streams
+        assert await _test_large_values(), 'large values failed'
+        assert await _test_tiers(), 'tiered cache failed'
+        assert await _test_checkpoint(), 'checkpoint failed'
+        assert await _test_sync_race(), 'sync race failed'
+        assert await _test_compact_index(), 'compact index failed'
+        assert await _test_bulk(), 'bulk load failed'
+        assert await _test_update(), 'update failed'
+        assert await _test_indexes(), 'indexes failed'
+        assert await _test_admission(), 'admission failed'
+        assert await _test_backup(), 'backup failed'
+
+        # Test cache coherence between shelves on one file
+        assert await _test_coherence(), 'cache coherence failed'
+
+        # Test the shared memory tier
+        from lib.shared_cache import test as SharedCache_test
+        assert await SharedCache_test(), 'SharedCache test failed'
+
+        # Test the block storage mode
+        from lib.block_database import test as BlockLRUDataBase_test
+        assert await BlockLRUDataBase_test(), 'BlockLRUDataBase test failed'
+
+        # Test the compact LRU index
+        from lib.compact_lru import test as CompactLRU_test
+        assert CompactLRU_test(), 'CompactLRU test failed'
+
+        # Test namespaces sharing a connection and an LRU
+        from lib.lru_store import test as LRUStore_test
+        assert await LRUStore_test(), 'LRUStore test failed'
+
+        # Test the bitcask storage backend
+        from lib.bitcask import test as BitcaskDataBase_test
+        assert await BitcaskDataBase_test(), 'BitcaskDataBase test failed'
+
     except Exception as err:
         LOG.error(f'LRUDataBase Test Failed: {err}')
         raise
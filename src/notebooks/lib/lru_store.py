@@ -0,0 +1,344 @@
+'''
+The code is a Python class named LRUStore that hosts many named tables
+(namespaces) of LRUDataBase in one database file. The namespaces share one
+connection and one LRU cache, so a single memory budget is spread over all
+tables and follows whichever table is hot.
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import asyncio
+import logging
+import sqlite3
+import time
+
+from lib.utilities import Configs, resolve_configs
+from lib.database import AsyncDataBase
+from lib.lru import LRU, LRUView
+from lib.lru_database import TOMBSTONE, LRUDataBase
+
+LOG = logging.getLogger('LRU_store')
+
+
+class Namespace(LRUDataBase):
+    '''The code is a Python class named Namespace, one table of an LRUStore. It
+    has the LRUDataBase interface, but its LRU is a view of the store's shared
+    LRU and its database borrows the store's connection. When the shared LRU
+    is full, the store evicts the least recently used items of all namespaces.
+
+    Namespaces are created with LRUStore.namespace().'''
+
+    def __init__(self, store: 'LRUStore', table_name: str, indexes: dict | None = None) -> None:
+        '''This is the constructor method. It initializes the namespace with its
+        store and table name, using the store's configuration, and the indexed
+        fields of the table, see LRUDataBase.__init__.'''
+        super().__init__(store.file_name, table_name, store.configs, indexes=indexes)
+        self.store = store
+
+    async def connect(self, database_path: str | None = None) -> None:
+        '''This method creates the table on the store's connection and attaches
+        a view of the store's LRU. With warm_start enabled, the hot key list of
+        the table is reloaded in the background.'''
+        self.lru = LRUView(self.store.lru, self.table_name)
+        self.db = self.store.db.table(self.table_name)
+        self._set_integer_keys()
+        self._set_indexes()
+        await self.db.create()
+        await self._start()
+
+    async def sync(self) -> None:
+        '''This method asks the store to offload the oldest items of the shared
+        LRU, which may belong to any namespace.'''
+        await self.store.sync()
+
+    async def flush_cache(self) -> None:
+        '''This method flushes the items of this namespace to the database and
+        removes them from the shared LRU. With warm_start enabled, the cached
+        keys are saved in recency order.'''
+        try:
+            cache = self.lru.cache
+            values, deletes = self._pending_writes(cache)
+            hot_keys = self._hot_keys() if self.warm_start else None
+            await self.db.write(values, hot_keys=hot_keys, deletes=deletes)
+            self._publish(values, deletes)
+            self._dirty.clear()
+        except Exception as error:
+            LOG.exception(f'flush_cache: {error}')
+            raise
+        else:
+            self.lru.clear()
+            self.objects.clear()
+            LOG.info(f'Flushed the namespace, shelve_name={self.table_name}, count={len(cache)}')
+
+    async def close(self) -> None:
+        '''This method flushes the namespace and detaches it from the store. The
+        store's connection stays open.'''
+        await super().close()
+        self.store.namespaces.pop(self.table_name, None)
+
+
+class LRUStore:
+    '''The code is a Python class named LRUStore that hosts many namespaces, each
+    a table with the LRUDataBase interface, in one database file. All
+    namespaces share one connection thread and one LRU cache of maxlen items,
+    instead of one connection and one cache each.
+
+    When the shared cache is full, the least recently used items are synced
+    whichever namespace they belong to, and the items of all namespaces are
+    written in one transaction. Cache memory therefore moves to the tables that
+    are in use without partitioning it by hand. With auto_resize, the miss
+    ratio curve and memory_budget of the LRU apply to the whole store.
+
+    async with LRUStore('file_name') as store:
+        users = await store.namespace('users')
+        await users.write('key', value)
+    '''
+
+    def __init__(self, file_name: str, configs: Configs | dict | None = None) -> None:
+        '''This is the constructor method. It initializes the store with a file
+        name and a configuration, see LRUDataBase.__init__.'''
+        self.file_name = file_name
+        section, self.configs = resolve_configs(configs, 'LRU_db')
+        self.warm_start = section['warm_start']
+        self.namespaces = {}
+        self.lru = None
+        self.db = None
+
+    async def __aenter__(self):
+        '''Connects to the database, see LRUDataBase.__aenter__.'''
+        await self.connect()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        '''Closes the store, see LRUDataBase.__aexit__.'''
+        await self.close()
+
+    def __getitem__(self, table_name: str) -> Namespace:
+        '''Returns an open namespace.'''
+        return self.namespaces[table_name]
+
+    def __contains__(self, table_name: str) -> bool:
+        '''This method checks if a namespace is open.'''
+        return table_name in self.namespaces
+
+    async def connect(self, database_path: str | None = None) -> None:
+        '''This method opens the shared connection and creates the shared LRU.'''
+        self.lru = LRU(self.configs)
+        self.db = AsyncDataBase(self.file_name, None, database_path=database_path, configs=self.configs)
+        await self.db.open_connection()
+
+    async def namespace(self, table_name: str, indexes: dict | None = None) -> Namespace:
+        '''This method returns the namespace of a table, creating the table and
+        connecting the namespace on first use. indexes declares the indexed
+        fields of the table for query, see LRUDataBase.__init__. It is used
+        when the namespace is opened, and ignored while it is open.'''
+        if table_name not in self.namespaces:
+            namespace = Namespace(self, table_name, indexes)
+            await namespace.connect()
+            self.namespaces[table_name] = namespace
+        return self.namespaces[table_name]
+
+    async def table_names(self) -> list:
+        '''This method returns the names of the namespace tables in the file, open
+        or not.'''
+        rows = await self.db.execute_batch(
+            ["SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"], commit=False)
+        names = [row[0] for row in rows[0]]
+        return [name for name in names if f'{name}_hot' in names]
+
+    async def sync(self) -> None:
+        '''This method offloads the oldest items of the shared LRU to the tables
+        of their namespaces, in one transaction.'''
+        try:
+            sync_store = self.lru.sync_make_ready()
+
+            groups = self._group(sync_store)
+            for name, items in groups.items():
+                self.namespaces[name]._evicted(items)
+            start = time.perf_counter()
+            written = await self.db.run(self._write_namespaces, groups)
+            self.lru.record_sync(len(sync_store), time.perf_counter() - start)
+            self._publish(written)
+            for name, items in groups.items():
+                self.namespaces[name]._clean(items)
+
+            if len(self.lru.cache) != self.lru.count:
+                raise ValueError(f'Sync did not off load all LRU cache items. len_lru={len(self.lru.cache)} != cnt_lru={self.lru.count}')
+        except Exception as error:
+            LOG.exception(f'sync: {error}')
+            raise
+        else:
+            LOG.info(f'Sync offloaded old cached items to the database, file_name={self.file_name}, count={len(sync_store)}')
+
+    async def flush_cache(self) -> None:
+        '''This method flushes the shared LRU to the database in one transaction.
+        With warm_start enabled, the hot key list of each namespace is saved.'''
+        try:
+            hot_keys = None
+            if self.warm_start:
+                hot_keys = {name: [] for name in self.namespaces}
+                for name, key in self.lru.deck:
+                    if self.lru.cache[(name, key)] is not TOMBSTONE:
+                        hot_keys[name].append(key)
+
+            written = await self.db.run(self._write_namespaces, self._group(self.lru.cache), hot_keys)
+            self._publish(written)
+            for namespace in self.namespaces.values():
+                namespace._dirty.clear()
+                namespace.objects.clear()
+            cache_size = len(self.lru)
+        except Exception as error:
+            LOG.exception(f'flush_cache: {error}')
+            raise
+        else:
+            self.lru._create_empty_deck()
+            LOG.info(f'Flushed the LRU cache, file_name={self.file_name}, count={cache_size}')
+
+    def stats(self) -> dict:
+        '''This method returns the statistics of the shared LRU, and the share
+        of the cache held by each namespace.'''
+        stats = self.lru.stats()
+        stats['namespaces'] = {name: ns.lru.stats() for name, ns in self.namespaces.items()}
+        return stats
+
+    async def close(self) -> None:
+        '''This method flushes the shared LRU and closes the connection. The
+        namespaces are closed with it.'''
+        try:
+            for namespace in self.namespaces.values():
+                await namespace._cancel_tasks()
+
+            await self.flush_cache()
+            await self.db.close()
+        except Exception as error:
+            LOG.exception(f'close: {error}')
+            raise
+        else:
+            for namespace in self.namespaces.values():
+                if namespace.shared is not None:
+                    namespace.shared.close()
+                namespace.lru = None
+                namespace.db = None
+                namespace.shared = None
+            self.namespaces = {}
+            self.lru = None
+            self.db = None
+            LOG.info(f'Closed LRUStore: {self.file_name}')
+
+    def _group(self, items: dict) -> dict:
+        '''Splits items keyed by (namespace, key) into a dict of items per
+        namespace.'''
+        groups = {}
+        for (name, key), value in items.items():
+            groups.setdefault(name, {})[key] = value
+        return groups
+
+    def _publish(self, written: dict) -> None:
+        '''Updates the shared tiers of the namespaces with what was written.'''
+        for name, (values, deletes) in written.items():
+            self.namespaces[name]._publish(values, deletes)
+
+    def _write_namespaces(self, conn: sqlite3.Connection, groups: dict, hot_keys: dict | None = None) -> dict:
+        '''Unit of work that writes the changed items, pending deletes and hot
+        keys of each namespace and commits once. Returns the values and deletes
+        written per namespace.'''
+        hot_keys = hot_keys or {}
+        written = {}
+        try:
+            for name in groups.keys() | hot_keys.keys():
+                namespace = self.namespaces[name]
+                values, deletes = namespace._pending_writes(groups.get(name, {}))
+                namespace.db._write(conn, values, hot_keys.get(name), deletes, commit=False)
+                written[name] = (values, deletes)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        return written
+
+
+async def test() -> bool:
+    configs = Configs(overrides={'LRU': {'maxlen': 10, 'sync_fraction': 0.5}})
+    store = LRUStore('test_lru_store', configs=configs)
+    await store.connect()
+    database_path = store.db.database_path
+
+    try:
+        cold = await store.namespace('cold')
+        hot = await store.namespace('hot')
+        assert cold.db.sqliteConnection is hot.db.sqliteConnection, 'namespaces do not share the connection'
+
+        # The cold table fills the cache, then the hot table takes it over
+        for i in range(5):
+            await cold.write(f'key{i}', f'cold{i}')
+        for i in range(20):
+            await hot.write(f'key{i % 8}', f'hot{i}')
+            await hot.read(f'key{i % 8}')
+
+        stats = store.stats()
+        assert stats['namespaces']['cold']['count'] == 0, f'cold items were not evicted: {stats}'
+        assert stats['namespaces']['hot']['count'] == store.lru.count, f'hot share failed: {stats}'
+
+        # Same keys in different namespaces do not collide
+        assert await cold.read('key3') == 'cold3', 'cold read from the database failed'
+        assert await hot.read('key3') == 'hot19', 'hot read failed'
+        assert sorted(await cold.node_keys()) == [f'key{i}' for i in range(5)], 'cold node_keys failed'
+
+        await cold.delete('key0')
+        assert await cold.get('key0', 'NO KEY') == 'NO KEY', 'namespace delete failed'
+
+        # Reconnect, values and the hot sets are persisted per table
+        await store.close()
+        await store.connect()
+        assert sorted(await store.table_names()) == ['cold', 'hot'], 'table_names failed'
+        hot = await store.namespace('hot')
+        cold = await store.namespace('cold')
+        await asyncio.gather(hot._warm_task, cold._warm_task)
+        assert b'key3' in hot.lru and b'key3' in cold.lru, f'warm start failed: {store.lru.deck}'
+        assert await hot.read('key7') == 'hot15', 'hot read after reconnect failed'
+        assert await cold.read('key4') == 'cold4', 'cold read after reconnect failed'
+
+        # Closing a namespace flushes only its items
+        await cold.close()
+        assert 'cold' not in store, 'closed namespace is still open'
+        assert all(name == 'hot' for name, _ in store.lru.deck), 'namespace close left items in the LRU'
+        assert await hot.read('key1') == 'hot17', 'namespace close affected another namespace'
+
+        # A key written again while a sync evicts it stays dirty
+        i = 0
+        while store.lru.count < store.lru.maxlen - 1:
+            await hot.write(f'fill{i}', i)
+            i += 1
+        _, oldest = store.lru.deck[0]
+        await asyncio.gather(hot.write('last', 0), hot.write(oldest.decode(), 'race'))
+        assert oldest in hot._dirty, 'write during a sync was marked clean'
+
+        # A namespace with indexes answers queries, other namespaces have none
+        points = await store.namespace('points', indexes={'x': lambda v: v['x']})
+        await points.write('a', {'x': 1})
+        await points.write('b', {'x': 2})
+        await points.sync()
+        await points.write('c', {'x': 2})
+        assert await points.query(('x', '==', 2)) == {'b': {'x': 2}, 'c': {'x': 2}}, 'namespace query failed'
+        assert hot.db.indexes == {}, 'indexes leaked to another namespace'
+    except Exception as error:
+        LOG.exception(f'LRUStore Test Failed: {error}', exc_info=True)
+        raise
+    finally:
+        await store.close()
+        database_path.unlink()
+
+    LOG.info('LRUStore Test completed successfully.')
+    return True
@@ -0,0 +1,476 @@
+'''
+The code is a Python class named SharedCache, a cache tier in shared memory
+that the LRUDataBase shelves of all local processes using the same table
+consult between their private LRU and the database, so N workers share one
+hot set instead of keeping N copies of it.
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import logging
+import struct
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from hashlib import blake2b
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+from lib.utilities import Configs, resolve_configs
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows
+    fcntl = None
+
+LOG = logging.getLogger('Shared_cache')
+
+# The segment starts with a header, then one clock hand per bucket, then one
+# write stamp per bucket, then the slots, which start on a 64 byte boundary
+HEADER = struct.Struct('<8sIII')
+MAGIC = b'LRUSHM02'
+STAMP = struct.Struct('<I')
+
+# A slot is its sequence number, reference bit, used flag, key size, value
+# size and key hash, then the key and the value. The sequence number is odd
+# while a writer is changing the slot.
+SLOT = struct.Struct('<IBBHIQ')
+SEQ = struct.Struct('<I')
+REF = 4
+USED = 5
+
+# Attempts to read a slot a writer keeps changing before it counts as a miss
+READ_RETRIES = 64
+
+
+class SharedCache:
+    '''The code is a Python class named SharedCache, a fixed size hash table of
+    serialized values in a multiprocessing.shared_memory segment named after
+    the database file and table, so every process that opens the same table
+    attaches to the same segment.
+
+    The table has slots // ways buckets of ways slots of slot_size bytes. A
+    key hashes (blake2b) to one bucket, and when the bucket is full the clock
+    picks the victim: a read sets the reference bit of a slot in the segment,
+    so recency is shared by all processes, and a new value starts with the
+    bit clear. Values that do not fit in a slot
+    are not cached.
+
+    Each bucket has a write stamp, changed by every put and discard of a key
+    of the bucket. A value read from the database is added with fill, which
+    drops it if the stamp changed since the read began, since another process
+    may have written or deleted the key after reading it.
+
+    Writers hold an fcntl lock on a lock file next to the segment. Readers take
+    no lock, each slot is a seqlock and a read that overlaps a write is
+    retried. The segment outlives the processes that use it, until unlink.'''
+
+    def __init__(self, database_path: str, table_name: str, configs: Configs | dict | None = None) -> None:
+        '''This is the constructor method. It initializes the cache of a table
+        with the path of its database file and a configuration, either a Configs
+        object or the "Shared_cache" section as a dict.'''
+        self.configs, _ = resolve_configs(configs, 'Shared_cache')
+        self.slots = self.configs['slots']
+        self.slot_size = self.configs['slot_size']
+        self.ways = self.configs['ways']
+
+        if fcntl is None:
+            raise ImportError('SharedCache needs the fcntl module, which is not available on this platform')
+        if not 0 < self.ways < 256 or self.slots % self.ways:
+            raise ValueError(f'slots must be a multiple of ways, and ways between 1 and 255. slots={self.slots}, ways={self.ways}')
+        if self.slot_size <= SLOT.size:
+            raise ValueError(f'slot_size must be larger than the slot header of {SLOT.size} bytes')
+
+        digest = blake2b(f'{Path(database_path).resolve()}:{table_name}'.encode(), digest_size=10).hexdigest()
+        self.name = f'lrudb_{digest}'
+        self.lock_path = Path(tempfile.gettempdir()) / f'{self.name}.lock'
+
+        self.buckets = self.slots // self.ways
+        self.capacity = self.slot_size - SLOT.size
+        self.stamp_offset = HEADER.size + self.buckets
+        self.offset = -(-(self.stamp_offset + self.buckets * STAMP.size) // 64) * 64
+        self.size = self.offset + self.slots * self.slot_size
+
+        self.hits = 0
+        self.misses = 0
+        self.rejects = 0
+        self.stale = 0
+        self.shm = None
+        self.buf = None
+        self._lock_file = None
+        self._thread_lock = threading.Lock()
+
+    def open(self) -> 'SharedCache':
+        '''This method attaches to the segment of the table, creating it if no
+        other process has.'''
+        try:
+            self._lock_file = open(self.lock_path, 'a+b')
+            with self._locked():
+                try:
+                    self.shm = _open_segment(self.name, create=True, size=self.size)
+                    HEADER.pack_into(self.shm.buf, 0, MAGIC, self.slots, self.slot_size, self.ways)
+                    created = True
+                except FileExistsError:
+                    self.shm = _open_segment(self.name)
+                    created = False
+
+            header = HEADER.unpack_from(self.shm.buf, 0)
+            if header != (MAGIC, self.slots, self.slot_size, self.ways):
+                raise ValueError(f'shared memory "{self.name}" has another layout, {header[1:]} != {(self.slots, self.slot_size, self.ways)}')
+            self.buf = self.shm.buf
+        except Exception as error:
+            LOG.exception(f'open: {error}')
+            self.close()
+            raise
+        else:
+            LOG.info(f'{"Created" if created else "Attached to"} shared cache "{self.name}", bytes={self.size}')
+        return self
+
+    def get(self, key: bytes | int) -> bytes | None:
+        '''This method returns the value of a key, or None if it is not cached.'''
+        key = self._key(key)
+        h = self._hash(key)
+        base = self._bucket(h)
+        for way in range(self.ways):
+            off = base + way * self.slot_size
+            for _ in range(READ_RETRIES):
+                seq, _, used, key_size, value_size, tag = SLOT.unpack_from(self.buf, off)
+                if seq & 1:
+                    continue
+                data = None
+                if used and tag == h and key_size == len(key):
+                    start = off + SLOT.size
+                    data = bytes(self.buf[start:start + key_size + value_size])
+                if SEQ.unpack_from(self.buf, off)[0] == seq:
+                    break
+            else:
+                # The slot is being rewritten, treat the key as missing
+                data = None
+
+            if data is not None and data[:len(key)] == key:
+                self.buf[off + REF] = 1
+                self.hits += 1
+                return data[len(key):]
+
+        self.misses += 1
+        return None
+
+    def get_many(self, keys: list) -> dict:
+        '''This method returns a dict of the cached keys of a list and their
+        values.'''
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def put(self, items: dict) -> None:
+        '''This method caches a dict of keys and serialized values written to the
+        database, replacing the cached values.'''
+        with self._locked():
+            for key, value in items.items():
+                key = self._key(key)
+                h = self._hash(key)
+                self._stamp(h)
+                self._store(key, h, value, replace=True)
+
+    def stamps(self, keys: list) -> dict:
+        '''This method returns the write stamps of the buckets of a list of keys,
+        to take before the keys are read from the database, see fill.'''
+        return {key: self._stamp_of(self._hash(self._key(key))) for key in keys}
+
+    def fill(self, items: dict, stamps: dict) -> None:
+        '''This method caches a dict of keys and serialized values read from the
+        database after stamps were taken. Keys that are already cached keep
+        their value, and a value is dropped if its bucket was written since,
+        as another process may have written or deleted the key after the read
+        began, so a stale value is never added over or after a newer one.'''
+        with self._locked():
+            for key, value in items.items():
+                _key = self._key(key)
+                h = self._hash(_key)
+                if stamps.get(key) != self._stamp_of(h):
+                    self.stale += 1
+                    continue
+                self._store(_key, h, value, replace=False)
+
+    def discard(self, keys: list) -> None:
+        '''This method removes a list of keys from the cache, and drops the
+        values of the keys being read from the database, see fill.'''
+        with self._locked():
+            for key in map(self._key, keys):
+                h = self._hash(key)
+                self._stamp(h)
+                off = self._find(key, h)
+                if off is not None:
+                    self._release(off)
+
+    def clear(self) -> None:
+        '''This method removes every key from the cache, see discard.'''
+        with self._locked():
+            for i in range(self.buckets):
+                self._stamp(i)
+            for i in range(self.slots):
+                off = self.offset + i * self.slot_size
+                if self.buf[off + USED]:
+                    self._release(off)
+
+    def stats(self) -> dict:
+        '''This method returns the size and use of the cache, and the hits,
+        misses, rejected values and stale fills dropped of this process.'''
+        used = sum(self.buf[self.offset + i * self.slot_size + USED] for i in range(self.slots))
+        return {
+            'name': self.name,
+            'slots': self.slots,
+            'slot_size': self.slot_size,
+            'used': used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'rejects': self.rejects,
+            'stale': self.stale,
+        }
+
+    def close(self) -> None:
+        '''This method detaches from the segment, which stays available to the
+        other processes.'''
+        self.buf = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def unlink(self) -> None:
+        '''This method removes the segment and its lock file. Processes still
+        attached keep their mapping, later opens create a new segment.'''
+        try:
+            shm = _open_segment(self.name)
+        except FileNotFoundError:
+            pass
+        else:
+            shm.close()
+            if sys.version_info < (3, 13):
+                resource_tracker.register(shm._name, 'shared_memory')
+            shm.unlink()
+        self.lock_path.unlink(missing_ok=True)
+        LOG.info(f'Removed shared cache "{self.name}"')
+
+    @contextmanager
+    def _locked(self):
+        '''Holds the writer lock, between the threads of this process and
+        between processes.'''
+        with self._thread_lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _hash(self, key: bytes) -> int:
+        '''Non zero 64 bit hash of a key.'''
+        return int.from_bytes(blake2b(key, digest_size=8).digest(), 'little') or 1
+
+    def _key(self, key: bytes | int) -> bytes:
+        '''Bytes of a key, integer keys are stored as 8 bytes.'''
+        if isinstance(key, int):
+            return key.to_bytes(8, 'little', signed=True)
+        return key
+
+    def _bucket(self, h: int) -> int:
+        '''Offset of the first slot of the bucket of a hash.'''
+        return self.offset + (h % self.buckets) * self.ways * self.slot_size
+
+    def _stamp_of(self, h: int) -> int:
+        '''Write stamp of the bucket of a hash.'''
+        return STAMP.unpack_from(self.buf, self.stamp_offset + (h % self.buckets) * STAMP.size)[0]
+
+    def _stamp(self, h: int) -> None:
+        '''Changes the write stamp of the bucket of a hash, with the writer lock
+        held.'''
+        STAMP.pack_into(self.buf, self.stamp_offset + (h % self.buckets) * STAMP.size, (self._stamp_of(h) + 1) & 0xFFFFFFFF)
+
+    def _find(self, key: bytes, h: int) -> int | None:
+        '''Offset of the slot of a key, with the writer lock held.'''
+        base = self._bucket(h)
+        for way in range(self.ways):
+            off = base + way * self.slot_size
+            _, _, used, key_size, _, tag = SLOT.unpack_from(self.buf, off)
+            start = off + SLOT.size
+            if used and tag == h and key_size == len(key) and self.buf[start:start + key_size] == key:
+                return off
+        return None
+
+    def _store(self, key: bytes, h: int, value: bytes, replace: bool) -> None:
+        '''Writes a value into the slot of its key, a free slot of its bucket or
+        the slot chosen by the clock, with the writer lock held.'''
+        off = self._find(key, h)
+        if len(key) + len(value) > self.capacity:
+            # Too large to cache, drop the older value so it is not read
+            if off is not None:
+                self._release(off)
+            self.rejects += 1
+            return
+        if off is not None and not replace:
+            return
+
+        if off is None:
+            off = self._victim(h)
+        seq = SEQ.unpack_from(self.buf, off)[0] | 1
+        SEQ.pack_into(self.buf, off, seq)
+        start = off + SLOT.size
+        self.buf[start:start + len(key)] = key
+        self.buf[start + len(key):start + len(key) + len(value)] = value
+        SLOT.pack_into(self.buf, off, seq, 0, 1, len(key), len(value), h)
+        SEQ.pack_into(self.buf, off, (seq + 1) & 0xFFFFFFFF)
+
+    def _victim(self, h: int) -> int:
+        '''Offset of a free slot of the bucket, or else of the first slot from
+        the clock hand with a clear reference bit. Reference bits passed over
+        are cleared.'''
+        base = self._bucket(h)
+        for way in range(self.ways):
+            off = base + way * self.slot_size
+            if not self.buf[off + USED]:
+                return off
+
+        hand_off = HEADER.size + h % self.buckets
+        hand = self.buf[hand_off] % self.ways
+        while True:
+            off = base + hand * self.slot_size
+            hand = (hand + 1) % self.ways
+            if self.buf[off + REF]:
+                self.buf[off + REF] = 0
+            else:
+                self.buf[hand_off] = hand
+                return off
+
+    def _release(self, off: int) -> None:
+        '''Marks a slot free, with the writer lock held.'''
+        seq = SEQ.unpack_from(self.buf, off)[0] | 1
+        SEQ.pack_into(self.buf, off, seq)
+        self.buf[off + USED] = 0
+        SEQ.pack_into(self.buf, off, (seq + 1) & 0xFFFFFFFF)
+
+
+def _open_segment(name: str, create: bool = False, size: int = 0) -> SharedMemory:
+    '''Opens a shared memory segment without the resource tracker, which would
+    unlink it when the first process using it exits.'''
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, create=create, size=size, track=False)
+    shm = SharedMemory(name, create=create, size=size)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+def _child_get(database_path: str, table_name: str, section: dict, keys: list, queue) -> None:
+    '''Reads keys from the shared cache in another process, for the test.'''
+    cache = SharedCache(database_path, table_name, section).open()
+    queue.put(cache.get_many(keys))
+    cache.put({b'child': b'from the child'})
+    cache.close()
+
+
+async def test() -> bool:
+    import multiprocessing
+    from lib.lru_database import LRUDataBase
+
+    section = {'logger': 'Shared_cache', 'slots': 8, 'slot_size': 64, 'ways': 4}
+    cache = SharedCache('test_shared_cache.db', 'test_case', section).open()
+    other = SharedCache('test_shared_cache.db', 'test_case', section).open()
+    try:
+        cache.put({b'key0': b'value0', b'key1': b'value1'})
+        assert other.get(b'key0') == b'value0', 'attached cache read failed'
+
+        # A fill keeps cached values, and drops the keys written or discarded
+        # by another process since the stamps were taken
+        stamps = other.stamps([b'key0', b'key2'])
+        cache.discard([b'key2'])
+        other.fill({b'key0': b'stale', b'key2': b'stale'}, stamps)
+        assert other.get(b'key0') == b'value0', 'fill overwrote a value'
+        assert other.get(b'key2') is None and other.stale, 'fill restored a deleted key'
+        other.fill({b'key3': b'value3'}, other.stamps([b'key3']))
+        assert cache.get(b'key3') == b'value3', 'fill failed'
+
+        # Values too large for a slot are rejected and drop the older value
+        cache.put({b'key1': b'x' * 64})
+        assert other.get(b'key1') is None and cache.rejects == 1, 'oversized value was cached'
+
+        # Another process sees the same segment
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        child = context.Process(target=_child_get, args=('test_shared_cache.db', 'test_case', section, [b'key0', b'key1'], queue))
+        child.start()
+        assert queue.get(timeout=60) == {b'key0': b'value0'}, 'child process read failed'
+        child.join()
+        assert cache.get(b'child') == b'from the child', 'child process write failed'
+
+        # The clock keeps referenced keys when a bucket overflows
+        for i in range(20):
+            cache.get(b'key0')
+            cache.put({f'fill{i}'.encode(): b'v'})
+        assert cache.get(b'key0') == b'value0', 'clock evicted a referenced key'
+        assert cache.stats()['used'] <= section['slots'], 'cache overflowed'
+
+        cache.discard([b'key0'])
+        assert other.get(b'key0') is None, 'discard failed'
+        cache.clear()
+        assert cache.stats()['used'] == 0, 'clear failed'
+    finally:
+        other.close()
+        cache.close()
+        cache.unlink()
+
+    # Two shelves share values through the tier instead of the database
+    configs = Configs(overrides={'LRU_db': {'shared_cache': True}})
+    a = LRUDataBase('test_shared_cache', 'test_case', configs=configs)
+    b = LRUDataBase('test_shared_cache', 'test_case', configs=configs)
+    await a.connect()
+    await b.connect()
+    database_path = a.db.database_path
+    try:
+        shared = a.shared
+        assert a.shared.name == b.shared.name, 'shelves use different segments'
+        await a.write('key0', 'a0')
+        await a.write('key1', 'a1')
+        await a.flush_cache()
+        assert await b.read('key0') == 'a0' and b.shared.hits == 1, 'read through the shared tier failed'
+        assert await b.read(['key0', 'key1', 'nokey']) == {'key0': 'a0', 'key1': 'a1', 'nokey': None}, 'read_many failed'
+
+        await a.delete('key1')
+        del b.lru[b'key1']
+        assert await b.read('key1') is None, 'deleted key was read from the shared tier'
+
+        # A value read before another shelf deletes the key is not shared
+        await a.write('key2', 'a2')
+        await a.flush_cache()
+        shared.discard([b'key2'])
+        hits, missing, stamps = b._shared_get(b'key2')
+        blob = await b.db.read(missing)
+        await a.delete('key2')
+        b._shared_fill(b'key2', hits, blob, stamps)
+        assert shared.get(b'key2') is None, 'stale value was shared after a delete'
+    finally:
+        await a.close()
+        await b.close()
+        shared.unlink()
+        database_path.unlink()
+
+    LOG.info('SharedCache Test completed successfully.')
+    return True
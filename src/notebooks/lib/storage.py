@@ -0,0 +1,270 @@
+'''
+The storage backend interface of LRUDataBase. A backend persists the items
+offloaded by the LRU cache of one table, AsyncDataBase (SQLite) is the default.
+
+Copyright (C) 2024  RC Bravo Consuling Inc., https://github.com/rcbravo-dev
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+'''
+import importlib
+import itertools
+import os
+import struct
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Any, Iterable, Iterator
+
+# Bytes read at a time from a file passed to write_stream
+CHUNK_SIZE = 1 << 20
+
+# Pairs written per transaction by bulk_load
+BULK_BATCH = 100_000
+
+# Dump files written by export start with DUMP_MAGIC, followed by one record 
+# per node: a RECORD header of the key type, node type, key length and node 
+# length, then the key and node bytes. Types are BYTES, TEXT (utf-8), 
+# INTEGER (8 bytes, little endian) and NULL.
+DUMP_MAGIC = b'LRUDB-DUMP\x00\x01'
+RECORD = struct.Struct('<BBII')
+BYTES, TEXT, INTEGER, NULL = range(4)
+
+# Backend names accepted by the "backend" setting of LRU_db, imported on use
+BACKENDS = {
+    'sqlite': 'lib.database.AsyncDataBase',
+    'bitcask': 'lib.bitcask.BitcaskDataBase',
+}
+
+
+class StorageBackend(ABC):
+    '''The interface LRUDataBase uses to persist a table of (node_id, node)
+    pairs, where node_id is the encoded key and node the serialized value.
+    Backends are constructed as
+
+        backend(file_name, table_name, database_path=None, configs=None)
+
+    and read returns Node(node_id, node) tuples, see lib.database.Node. A
+    single node_id that is not stored reads as None.'''
+
+    @abstractmethod
+    async def open_connection(self) -> None:
+        '''Opens the storage of the file.'''
+
+    @abstractmethod
+    async def create(self) -> None:
+        '''Creates the table, and its hot key list, if they don't already exist.'''
+
+    @abstractmethod
+    async def write(self, values: tuple | dict, hot_keys: list | None = None, deletes: list | None = None) -> None:
+        '''Writes a (node_id, node) pair or a dict of pairs, replaces the hot
+        key list if hot_keys is given and deletes the node_ids in deletes.'''
+
+    @abstractmethod
+    async def read(self, node_id: Any) -> Any:
+        '''Reads a Node, or None, for a node_id, and a list of the stored Nodes
+        for a list of node_ids.'''
+
+    @abstractmethod
+    async def node_keys(self) -> list:
+        '''Returns the stored node_ids.'''
+
+    @abstractmethod
+    async def delete_node(self, node_id: Any) -> None:
+        '''Deletes a node_id, or a list of node_ids.'''
+
+    @abstractmethod
+    async def write_hot_keys(self, node_ids: list) -> None:
+        '''Replaces the hot key list, ordered from the least to the most
+        recently used.'''
+
+    @abstractmethod
+    async def read_hot_keys(self) -> list:
+        '''Returns the hot key list, ordered from the least to the most
+        recently used.'''
+
+    @abstractmethod
+    async def close(self) -> None:
+        '''Closes the storage.'''
+
+    async def read_range(self, node_id: Any, offset: int = 0, size: int = -1) -> bytes | None:
+        '''Reads size bytes of a node from offset, to the end if size is
+        negative, or None if the node_id is not stored. This default loads the
+        whole node, backends with partial reads override it.'''
+        blob = await self.read(node_id)
+        if blob is None:
+            return None
+        return bytes(blob.node[offset:None if size < 0 else offset + size])
+
+    async def blob_size(self, node_id: Any) -> int | None:
+        '''Returns the size in bytes of a node, or None if the node_id is not
+        stored.'''
+        blob = await self.read(node_id)
+        return None if blob is None else len(blob.node)
+
+    async def write_stream(self, node_id: Any, source: Any, size: int, chunk_size: int = CHUNK_SIZE) -> None:
+        '''Writes a node of size bytes from a binary file or an iterable of
+        bytes chunks, see iter_chunks. This default joins the chunks, backends
+        with incremental writes override it.'''
+        node = b''.join(iter_chunks(source, chunk_size))
+        if len(node) != size:
+            raise ValueError(f'stream has {len(node)} bytes, expected {size}')
+        await self.write((node_id, node))
+
+    async def update(self, node_ids: Any, fn: Any) -> dict:
+        '''Applies fn(node_id, node) to the node of each node_id, or a list of 
+        node_ids, None if it is not stored, and writes the nodes fn changes. fn 
+        returns the node it was given to leave it unchanged. Returns the written 
+        nodes. This default uses read and write, so it is not atomic against 
+        other connections.'''
+        ids = node_ids if isinstance(node_ids, list) else [node_ids]
+        stored = {blob.node_id: blob.node for blob in await self.read(ids)}
+        written = {}
+        for node_id in ids:
+            node = written.get(node_id, stored.get(node_id))
+            new = fn(node_id, node)
+            if new is not node:
+                written[node_id] = new
+        if written:
+            await self.write(written)
+        return written
+
+    async def bulk_load(self, source: Any, batch_size: int | None = None) -> int:
+        '''Writes the (node_id, node) pairs of a dict, an iterable or a dump 
+        file, see iter_rows, batch_size pairs per write. Returns the number of 
+        pairs. This default uses write, backends with a faster path override it.'''
+        count = 0
+        rows = iter_rows(source)
+        while batch := dict(itertools.islice(rows, batch_size or BULK_BATCH)):
+            await self.write(batch)
+            count += len(batch)
+        return count
+
+    async def export(self, dest: Any, batch_size: int | None = None) -> int:
+        '''Writes the stored nodes to a dump file, a path or a binary file, and 
+        returns the number of nodes. This default reads the nodes of node_keys 
+        batch_size at a time.'''
+        node_ids = sorted(await self.node_keys())
+        batch_size = batch_size or BULK_BATCH
+        count = 0
+        with _open(dest, 'wb') as f:
+            f.write(DUMP_MAGIC)
+            for i in range(0, len(node_ids), batch_size):
+                for node_id, node in await self.read(node_ids[i:i + batch_size]):
+                    write_record(f, node_id, node)
+                    count += 1
+        return count
+
+
+def iter_chunks(source: Any, chunk_size: int = CHUNK_SIZE) -> Iterable:
+    '''Returns the chunks of a write_stream source: a bytes-like value is one
+    chunk, a binary file is read chunk_size bytes at a time, and any other
+    iterable is taken to yield bytes chunks.'''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return [source]
+    if hasattr(source, 'read'):
+        return iter(lambda: source.read(chunk_size), b'')
+    return source
+
+
+def is_dump(source: Any) -> bool:
+    '''True if source is a path or a binary file, read as a dump file by 
+    iter_rows.'''
+    return isinstance(source, (str, os.PathLike)) or hasattr(source, 'read')
+
+
+def iter_rows(source: Any) -> Iterator[tuple]:
+    '''Returns the (node_id, node) pairs of a bulk_load source: the items of a 
+    dict, the records of a dump file given as a path or a binary file, or the 
+    pairs of any other iterable.'''
+    if isinstance(source, dict):
+        return iter(source.items())
+    if is_dump(source):
+        return read_dump(source)
+    return iter(source)
+
+
+def write_dump(dest: Any, rows: Iterable) -> int:
+    '''Writes (node_id, node) pairs to a dump file, a path or a binary file, 
+    and returns the number of pairs.'''
+    count = 0
+    with _open(dest, 'wb') as f:
+        f.write(DUMP_MAGIC)
+        for node_id, node in rows:
+            write_record(f, node_id, node)
+            count += 1
+    return count
+
+
+def write_record(f: Any, node_id: Any, node: Any) -> None:
+    '''Writes one (node_id, node) record to an open dump file.'''
+    key_type, key = _pack_field(node_id)
+    node_type, node = _pack_field(node)
+    f.write(RECORD.pack(key_type, node_type, len(key), len(node)))
+    f.write(key)
+    f.write(node)
+
+
+def read_dump(source: Any) -> Iterator[tuple]:
+    '''Yields the (node_id, node) pairs of a dump file, a path or a binary 
+    file. Raises a ValueError if it is not a dump file or is truncated.'''
+    with _open(source, 'rb') as f:
+        if f.read(len(DUMP_MAGIC)) != DUMP_MAGIC:
+            raise ValueError(f'{source} is not a dump file')
+        while header := f.read(RECORD.size):
+            if len(header) < RECORD.size:
+                raise ValueError(f'{source} is truncated')
+            key_type, node_type, key_size, node_size = RECORD.unpack(header)
+            key, node = f.read(key_size), f.read(node_size)
+            if len(node) < node_size:
+                raise ValueError(f'{source} is truncated')
+            yield _unpack_field(key_type, key), _unpack_field(node_type, node)
+
+
+def _open(target: Any, mode: str) -> Any:
+    '''Opens a path, or passes an open file through without closing it.'''
+    if hasattr(target, 'read') or hasattr(target, 'write'):
+        return nullcontext(target)
+    return open(target, mode, buffering=CHUNK_SIZE)
+
+
+def _pack_field(value: Any) -> tuple:
+    '''Returns the type and bytes of a dump record field.'''
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return BYTES, value
+    if isinstance(value, str):
+        return TEXT, value.encode()
+    if isinstance(value, int):
+        return INTEGER, value.to_bytes(8, 'little', signed=True)
+    if value is None:
+        return NULL, b''
+    raise TypeError(f'dump fields must be bytes, str, int or None. type={type(value)}')
+
+
+def _unpack_field(field_type: int, raw: bytes) -> Any:
+    '''Returns the value of a dump record field, see _pack_field.'''
+    if field_type == BYTES:
+        return raw
+    if field_type == TEXT:
+        return raw.decode()
+    if field_type == INTEGER:
+        return int.from_bytes(raw, 'little', signed=True)
+    return None
+
+
+def get_backend(name: str) -> type:
+    '''Returns the backend class registered under name in BACKENDS.'''
+    try:
+        module, cls = BACKENDS[name].rsplit('.', 1)
+    except KeyError:
+        raise ValueError(f'unknown storage backend "{name}", expected one of {list(BACKENDS)}') from None
+    return getattr(importlib.import_module(module), cls)
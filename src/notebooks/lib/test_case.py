@@ -23,6 +23,12 @@ class ParticleBox:
         ...               ]
 
     bounds is the size of the box: [xmin, xmax, ymin, ymax]
+
+    method selects the collision search: 'grid' bins the particles into a
+    uniform grid of cells the size of a collision and only compares particles
+    in neighbouring cells, O(N) in time and memory, and resolves collisions
+    with array operations. 'pdist' is the original full distance matrix with a
+    Python loop per collision, O(N^2).
     """
     def __init__(self,
                  init_state = [[1, 0, 0, -1],
@@ -31,7 +37,9 @@ class ParticleBox:
                  bounds = [-2, 2, -2, 2],
                  size = 0.04,
                  M = 0.05,
-                 G = 9.8):
+                 G = 9.8,
+                 method = 'grid'):
+        self.method = method
         self.init_state = np.asarray(init_state, dtype=float)
         self.M = M * np.ones(self.init_state.shape[0])
         self.size = size
@@ -48,13 +56,137 @@ class ParticleBox:
         self.state[:, :2] += dt * self.state[:, 2:]
 
         # find pairs of particles undergoing a collision
+        if self.method == 'grid':
+            ind1, ind2 = self._grid_pairs()
+            self._resolve_collisions(ind1, ind2)
+        else:
+            ind1, ind2 = self._pdist_pairs()
+            self._resolve_collisions_loop(ind1, ind2)
+
+        # check for crossing boundary
+        crossed_x1 = (self.state[:, 0] < self.bounds[0] + self.size)
+        crossed_x2 = (self.state[:, 0] > self.bounds[1] - self.size)
+        crossed_y1 = (self.state[:, 1] < self.bounds[2] + self.size)
+        crossed_y2 = (self.state[:, 1] > self.bounds[3] - self.size)
+
+        self.state[crossed_x1, 0] = self.bounds[0] + self.size
+        self.state[crossed_x2, 0] = self.bounds[1] - self.size
+
+        self.state[crossed_y1, 1] = self.bounds[2] + self.size
+        self.state[crossed_y2, 1] = self.bounds[3] - self.size
+
+        self.state[crossed_x1 | crossed_x2, 2] *= -1
+        self.state[crossed_y1 | crossed_y2, 3] *= -1
+
+        # add gravity
+        self.state[:, 3] -= self.M * self.G * dt
+
+        # RANDOM Read/Write - rcbravo
+        self.reads = ind1.tolist()
+        self.writes = {}
+        for i in ind2.tolist():
+            self.writes[i] = self.state[i, :2]
+
+    def _pdist_pairs(self):
+        """pairs closer than 2 * size from the full distance matrix, ordered
+        by (ind1, ind2)"""
         D = squareform(pdist(self.state[:, :2]))
         ind1, ind2 = np.where(D < 2 * self.size)
         unique = (ind1 < ind2)
-        ind1 = ind1[unique]
-        ind2 = ind2[unique]
-
-        # update velocities of colliding pairs
+        return ind1[unique], ind2[unique]
+
+    def _grid_pairs(self):
+        """pairs closer than 2 * size from a uniform grid of cells, ordered
+        by (ind1, ind2) like _pdist_pairs"""
+        r = 2 * self.size
+        xy = self.state[:, :2]
+
+        # cell coordinates, particles outside the bounds go to the edge cells
+        nx = max(1, int(np.ceil((self.bounds[1] - self.bounds[0]) / r)))
+        ny = max(1, int(np.ceil((self.bounds[3] - self.bounds[2]) / r)))
+        cx = np.clip(((xy[:, 0] - self.bounds[0]) // r).astype(np.int64), 0, nx - 1)
+        cy = np.clip(((xy[:, 1] - self.bounds[2]) // r).astype(np.int64), 0, ny - 1)
+
+        # particles sorted by cell. Queries are made in sorted order too, so
+        # the neighbouring cell ids are sorted, which keeps searchsorted fast
+        cell = cx * ny + cy
+        order = np.argsort(cell, kind='stable')
+        sorted_cells = cell[order]
+        cx, cy = cx[order], cy[order]
+
+        ind1, ind2 = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                nbx, nby = cx + dx, cy + dy
+                valid = np.flatnonzero((nbx >= 0) & (nbx < nx) & (nby >= 0) & (nby < ny))
+                neighbour = sorted_cells[valid] + (dx * ny + dy)
+
+                # range of sorted particles in the neighbouring cell
+                start = np.searchsorted(sorted_cells, neighbour, 'left')
+                count = np.searchsorted(sorted_cells, neighbour, 'right') - start
+                total = count.sum()
+                if total == 0:
+                    continue
+
+                i = order[np.repeat(valid, count)]
+                offset = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+                j = order[np.repeat(start, count) + offset]
+
+                keep = i < j
+                i, j = i[keep], j[keep]
+                d = xy[i] - xy[j]
+                close = np.einsum('ij,ij->i', d, d) < r * r
+                ind1.append(i[close])
+                ind2.append(j[close])
+
+        if not ind1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        ind1 = np.concatenate(ind1)
+        ind2 = np.concatenate(ind2)
+        sort = np.lexsort((ind2, ind1))
+        return ind1[sort], ind2[sort]
+
+    def _resolve_collisions(self, ind1, ind2):
+        """update velocities of colliding pairs with array operations. Pairs
+        are applied in rounds of pairs that share no particle, where a pair
+        joins a round once every earlier pair sharing one of its particles has
+        been applied, so the result matches the sequential loop."""
+        pairs = np.arange(len(ind1))
+        while len(pairs):
+            # a pair is ready when it is the first remaining pair of both
+            # particles, the ends are interleaved so they sort by pair
+            ends = np.stack([ind1[pairs], ind2[pairs]], axis=1).ravel()
+            _, first = np.unique(ends, return_index=True)
+            is_first = np.zeros(len(ends), dtype=bool)
+            is_first[first] = True
+            ready = is_first.reshape(-1, 2).all(axis=1)
+
+            self._collide(ind1[pairs[ready]], ind2[pairs[ready]])
+            pairs = pairs[~ready]
+
+    def _collide(self, i1, i2):
+        """elastic collisions of pairs that share no particle"""
+        m1 = self.M[i1][:, None]
+        m2 = self.M[i2][:, None]
+
+        r1 = self.state[i1, :2]
+        r2 = self.state[i2, :2]
+        v1 = self.state[i1, 2:]
+        v2 = self.state[i2, 2:]
+
+        r_rel = r1 - r2
+        v_rel = v1 - v2
+        v_cm = (m1 * v1 + m2 * v2) / (m1 + m2)
+
+        rr_rel = np.einsum('ij,ij->i', r_rel, r_rel)[:, None]
+        vr_rel = np.einsum('ij,ij->i', v_rel, r_rel)[:, None]
+        v_rel = 2 * r_rel * vr_rel / rr_rel - v_rel
+
+        self.state[i1, 2:] = v_cm + v_rel * m2 / (m1 + m2)
+        self.state[i2, 2:] = v_cm - v_rel * m1 / (m1 + m2)
+
+    def _resolve_collisions_loop(self, ind1, ind2):
+        """update velocities of colliding pairs one at a time"""
         for i1, i2 in zip(ind1, ind2):
             # mass
             m1 = self.M[i1]
@@ -84,27 +216,27 @@ class ParticleBox:
             self.state[i1, 2:] = v_cm + v_rel * m2 / (m1 + m2)
             self.state[i2, 2:] = v_cm - v_rel * m1 / (m1 + m2) 
 
-        # check for crossing boundary
-        crossed_x1 = (self.state[:, 0] < self.bounds[0] + self.size)
-        crossed_x2 = (self.state[:, 0] > self.bounds[1] - self.size)
-        crossed_y1 = (self.state[:, 1] < self.bounds[2] + self.size)
-        crossed_y2 = (self.state[:, 1] > self.bounds[3] - self.size)
-
-        self.state[crossed_x1, 0] = self.bounds[0] + self.size
-        self.state[crossed_x2, 0] = self.bounds[1] - self.size
-
-        self.state[crossed_y1, 1] = self.bounds[2] + self.size
-        self.state[crossed_y2, 1] = self.bounds[3] - self.size
-
-        self.state[crossed_x1 | crossed_x2, 2] *= -1
-        self.state[crossed_y1 | crossed_y2, 3] *= -1
-
-        # add gravity
-        self.state[:, 3] -= self.M * self.G * dt
-
-        # RANDOM Read/Write - rcbravo
-        self.reads = [x for x in ind1]
-        self.writes = {}
-        for i in ind2:
-            self.writes[i] = self.state[i, :2]
 
+def test(box_size=400, steps=200, seed=0):
+    """check that the grid search and vectorized collisions match the
+    original pdist search and loop on a small, crowded box. Collisions are
+    chaotic, so rounding differences grow, each step starts from the same
+    state."""
+    np.random.seed(seed)
+    init_state = -0.5 + np.random.random((box_size, 4))
+    init_state[:, :2] *= 3.9
+
+    grid = ParticleBox(init_state, size=0.04, G=1.0, method='grid')
+    loop = ParticleBox(init_state, size=0.04, G=1.0, method='pdist')
+
+    collisions = 0
+    for _ in range(steps):
+        grid.state = loop.state.copy()
+        grid.step(1. / 30)
+        loop.step(1. / 30)
+        assert grid.reads == loop.reads, 'grid collision pairs differ from pdist'
+        assert np.allclose(grid.state, loop.state), 'grid collision state differs from pdist'
+        collisions += len(grid.reads)
+
+    assert collisions > 0, 'no collisions were tested'
+    return True
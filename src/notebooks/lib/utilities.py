@@ -1,29 +1,109 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+
 PACKAGE = 'LRUdb'
-CWD = f'/Users/Shared/SharedProjects/Projects/LastRecentlyUsedDataBase/{PACKAGE}/'
+# The repository root, src/notebooks/lib/utilities.py is three levels down. 
+# Set the LRUDB_CWD environment variable to use a different root.
+CWD = os.environ.get('LRUDB_CWD', str(Path(__file__).resolve().parents[3])).rstrip('/') + '/'
 
 
-def load_yaml(file_name: str) -> dict:
+@lru_cache(maxsize=None)
+def _parse_yaml(path: str) -> dict:
 	import yaml
 
-	path = CWD + file_name 
-
 	with open(path, 'rt') as file:
-		config = yaml.safe_load(file.read())
-	return config
+		return yaml.safe_load(file.read())
+
+
+def load_yaml(file_name: str) -> dict:
+	'''Returns a copy of the parsed YAML file. Each file is parsed once per process.'''
+	import copy
+
+	path = file_name if os.path.isabs(file_name) else CWD + file_name
+
+	return copy.deepcopy(_parse_yaml(path))
+
+
+_LOGGING_CONFIGURED = set()
 
 
 def setup_logging(path: str = 'configs/logging_config.yaml') -> None:
+	'''Applies the logging configuration once per path. Relative log file names 
+	are resolved against CWD and their directories are created.'''
 	import logging as log
 	import logging.config 
-	import yaml
 
-	config = load_yaml(path)
-	
-	log.config.dictConfig(config)
+	if path not in _LOGGING_CONFIGURED:
+		config = load_yaml(path)
+
+		for handler in config.get('handlers', {}).values():
+			if 'filename' in handler:
+				filename = Path(handler['filename'])
+				if not filename.is_absolute():
+					filename = Path(CWD) / filename
+				filename.parent.mkdir(parents=True, exist_ok=True)
+				handler['filename'] = str(filename)
+
+		log.config.dictConfig(config)
+		_LOGGING_CONFIGURED.add(path)
 	
 	return log
 
 
+class Configs:
+	'''The configuration shared by the LRUDataBase, AsyncDataBase and LRU classes. 
+	Nothing is read at construction, the YAML file is parsed and logging is set 
+	up the first time a section is requested. Sections are returned as copies 
+	with the overrides applied, so instances can be mutated freely.
+
+	configs = Configs(overrides={'LRU': {'maxlen': 1000}})
+	shelf = LRUDataBase('file_name', 'table_name', configs=configs)'''
+
+	def __init__(self, path: str = 'configs/config.yaml', overrides: dict | None = None, logging: bool = True) -> None:
+		self.path = path
+		self.overrides = overrides or {}
+		self.logging = logging
+		self._data = None
+
+	def __getitem__(self, section: str) -> dict:
+		if self._data is None:
+			self.load()
+		configs = dict(self._data.get(section) or {})
+		configs.update(self.overrides.get(section, {}))
+		return configs
+
+	def load(self) -> None:
+		'''Parses the configuration file and, unless disabled, sets up logging.'''
+		self._data = load_yaml(self.path)
+
+		if self.logging:
+			import logging as log
+
+			app = self['Application']
+			setup_logging(app['loggingConfigPath'])
+
+			for section in self._data.values():
+				if isinstance(section, dict) and 'logger' in section:
+					log.getLogger(section['logger']).setLevel(app['logging_level'])
+
+
+@lru_cache(maxsize=None)
+def get_configs() -> Configs:
+	'''Returns the default Configs instance, created on first use.'''
+	return Configs()
+
+
+def resolve_configs(configs: Configs | dict | None, section: str) -> tuple:
+	'''Returns the (section dict, Configs) pair for a configs argument. A dict is 
+	taken as the section itself, None selects the default configuration.'''
+	if isinstance(configs, Configs):
+		return configs[section], configs
+	if configs is None:
+		return get_configs()[section], get_configs()
+	return dict(configs), get_configs()
+
+
 def import_util(cwd: str = CWD, paths: list = ['src/lib']) -> None:
 	'''Function to ensure import paths are properly updated. '''
 	# Catch errors